@@ -1,4 +1,7 @@
 # type: ignore
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt #fwt = json web token
 from passlib.context import CryptContext
@@ -6,6 +9,7 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, database
+from .auth_cache import carregar_principal, guardar_principal
 from .database import get_db
 import sqlalchemy as sa
 
@@ -13,23 +17,58 @@ SECRET_KEY = "Sup3rS3gur0!@#"  # em produção, guardar em variável de ambiente
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt roda num pool de threads próprio (a lib solta o GIL), pra não travar o event loop em login/cadastro.
+# BCRYPT_ROUNDS é o custo; hashes com outro custo são refeitos no próximo login (verificar_e_atualizar).
+# BCRYPT_MAX_PENDENTES limita quantos hashes podem estar rodando/esperando; passou disso a request leva 503.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+BCRYPT_MAX_PENDENTES = int(os.getenv("BCRYPT_MAX_PENDENTES", str(BCRYPT_WORKERS * 16)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_pendentes = 0
 
 # Para extrair o token do header Authorization
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/usuarios/login")
 oauth2_restaurante = OAuth2PasswordBearer(tokenUrl="/restaurantes/login")
 
-def gerar_hash(senha: str) -> str:
+def _preparar_senha(senha: str) -> str:
     if not isinstance(senha, str):
         senha = str(senha)
-    senha = senha.strip()[:72]  # remove espaços invisíveis e corta
-    return pwd_context.hash(senha)
+    return senha.strip()[:72]  # remove espaços invisíveis e corta
 
-def verificar_senha(senha: str, senha_hash: str) -> bool:
-    if not isinstance(senha, str):
-        senha = str(senha)
-    senha = senha.strip()[:72]
-    return pwd_context.verify(senha, senha_hash)
+async def _no_pool_bcrypt(funcao, *args):
+    """Roda funcao no pool do bcrypt com controle de admissão (503 quando a fila está cheia)"""
+    global _bcrypt_pendentes
+    if _bcrypt_pendentes >= BCRYPT_MAX_PENDENTES:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, tente novamente em instantes",
+            headers={"Retry-After": "1"},
+        )
+    _bcrypt_pendentes += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, funcao, *args)
+    finally:
+        _bcrypt_pendentes -= 1
+
+async def gerar_hash(senha: str) -> str:
+    return await _no_pool_bcrypt(pwd_context.hash, _preparar_senha(senha))
+
+async def verificar_senha(senha: str, senha_hash: str) -> bool:
+    return await _no_pool_bcrypt(pwd_context.verify, _preparar_senha(senha), senha_hash)
+
+async def verificar_e_atualizar(senha: str, senha_hash: str) -> tuple[bool, str | None]:
+    """(senha confere, hash novo se o custo/esquema do atual estiver desatualizado)"""
+    return await _no_pool_bcrypt(pwd_context.verify_and_update, _preparar_senha(senha), senha_hash)
+
+def metricas_bcrypt() -> dict:
+    return {
+        "rounds": BCRYPT_ROUNDS,
+        "workers": BCRYPT_WORKERS,
+        "max_pendentes": BCRYPT_MAX_PENDENTES,
+        "pendentes": _bcrypt_pendentes,
+    }
 
 def criar_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -53,14 +92,21 @@ async def obter_usuario_atual(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
+        usuario_id = payload.get("id")  # tokens antigos não têm
         if email is None:
             raise credenciais_invalidas
     except JWTError:
         raise credenciais_invalidas
 
+    if usuario_id is not None:
+        usuario = await carregar_principal(db, models.Usuario, usuario_id, email)
+        if usuario is not None:
+            return usuario
+
     # busca o usuário no banco
     result = await db.execute(sa.select(models.Usuario).where(models.Usuario.email == email))
     usuario = result.scalar_one_or_none()
     if usuario is None:
         raise credenciais_invalidas
+    guardar_principal(usuario)
     return usuario
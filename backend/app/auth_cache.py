@@ -0,0 +1,51 @@
+# type: ignore
+"""
+Cache curto (por processo) do usuário/restaurante autenticado.
+
+Os tokens novos levam o id além do email (sub), então obter_usuario_atual e get_current_restaurante
+acham o principal aqui sem ir no banco. O cache guarda só os valores das colunas; a cada request é
+montada uma instância nova já anexada à sessão (sem SELECT), então alterações feitas pela rota
+funcionam igual a antes e nada é compartilhado entre requests.
+As escritas em crud.py chamam invalidar_principal depois do commit; em outro worker o dado pode ficar
+velho por no máximo AUTH_CACHE_TTL_SEGUNDOS (padrão 30). Tokens antigos (sem id) continuam buscando por email.
+"""
+import copy
+import os
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from .cache import CacheLRU
+
+cache_principais = CacheLRU(
+    max_itens=int(os.getenv("AUTH_CACHE_MAX_ITENS", "4096")),
+    ttl_segundos=float(os.getenv("AUTH_CACHE_TTL_SEGUNDOS", "30")),
+)
+
+def _grupo(modelo, pk) -> str:
+    return f"{modelo.__tablename__}:{pk}"
+
+def guardar_principal(obj):
+    """Guarda as colunas do principal recém-carregado (ignora se alguma coluna não estiver carregada)"""
+    estado = sa.inspect(obj)
+    valores = {}
+    for atributo in estado.mapper.column_attrs:
+        if atributo.key not in estado.dict:
+            return
+        valores[atributo.key] = estado.dict[atributo.key]
+    pk = estado.mapper.primary_key_from_instance(obj)[0]
+    cache_principais.set((_grupo(type(obj), pk),), valores)
+
+async def carregar_principal(db: AsyncSession, modelo, pk, email: str):
+    """Principal em cache como instância persistente da sessão, ou None (miss ou email não confere)"""
+    valores = cache_principais.get((_grupo(modelo, pk),))
+    if valores is None or valores.get("email") != email:
+        return None
+    obj = modelo(**copy.deepcopy(valores))  # cópia: JSON/arrays são mutáveis
+    make_transient_to_detached(obj)  # fica como se tivesse vindo de uma query
+    db.add(obj)
+    return obj
+
+def invalidar_principal(modelo, pk):
+    cache_principais.invalidar_grupo(_grupo(modelo, pk))
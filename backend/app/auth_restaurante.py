@@ -3,24 +3,22 @@ from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from .database import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
-from . import models
+from . import auth, models
+from .auth_cache import carregar_principal, guardar_principal
 import sqlalchemy as sa
 
 SECRET_KEY = "troque_esta_chave_restaurante"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme_restaurante = OAuth2PasswordBearer(tokenUrl="/restaurantes/login")
 
-def gerar_hash(senha: str):
-    return pwd_context.hash(senha)
-
-def verificar_senha(senha: str, hash: str):
-    return pwd_context.verify(senha, hash)
+# mesmo hash/pool do auth: o cadastro do restaurante já gera a senha com auth.gerar_hash
+gerar_hash = auth.gerar_hash
+verificar_senha = auth.verificar_senha
+verificar_e_atualizar = auth.verificar_e_atualizar
 
 def criar_token(dados: dict):
     to_encode = dados.copy()
@@ -35,12 +33,18 @@ async def get_current_restaurante(token: str = Depends(oauth2_scheme_restaurante
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
+        restaurante_id = payload.get("id")  # tokens antigos não têm
         if email is None:
             raise cred_exception
     except JWTError:
         raise cred_exception
+    if restaurante_id is not None:
+        restaurante = await carregar_principal(db, models.Restaurante, restaurante_id, email)
+        if restaurante is not None:
+            return restaurante
     result = await db.execute(sa.select(models.Restaurante).where(models.Restaurante.email == email))
     restaurante = result.scalar_one_or_none()
     if restaurante is None:
         raise cred_exception
+    guardar_principal(restaurante)
     return restaurante
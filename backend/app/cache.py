@@ -0,0 +1,167 @@
+# type: ignore
+"""
+Cache em memória (por processo) das leituras quentes de restaurante: lista, detalhes, cardápio e avaliações.
+
+As respostas ficam guardadas já serializadas em JSON, com TTL e despejo LRU quando passa do limite.
+As leituras de um restaurante também levam a versão dele (restaurantes.versao), que vira o ETag da
+resposta e invalida entradas antigas mesmo quando a escrita aconteceu em outro worker.
+Cada chave pertence a um restaurante (ou ao grupo None, da listagem geral) e as escritas em crud.py
+chamam invalidar_restaurante depois do commit. Com vários workers cada um tem o seu cache; na listagem
+geral (sem versão) o TTL é o limite de quanto tempo outro worker pode servir um dado antigo.
+
+Configuração: CACHE_MAX_ITENS (padrão 1024) e CACHE_TTL_SEGUNDOS (padrão 60).
+"""
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+
+class CacheLRU:
+    """Cache LRU com TTL; a chave é (restaurante_id ou None, recurso, *parâmetros)"""
+
+    def __init__(self, max_itens: int, ttl_segundos: float):
+        self.max_itens = max_itens
+        self.ttl_segundos = ttl_segundos
+        self._itens: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()  # chave -> (expira_em, valor)
+        self._por_restaurante: dict[Any, set[tuple]] = defaultdict(set)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expiracoes = 0
+        self.invalidacoes = 0
+
+    def get(self, chave: tuple) -> Optional[Any]:
+        item = self._itens.get(chave)
+        if item is None:
+            self.misses += 1
+            return None
+        expira_em, valor = item
+        if expira_em <= time.monotonic():
+            self._remover(chave)
+            self.expiracoes += 1
+            self.misses += 1
+            return None
+        self._itens.move_to_end(chave)
+        self.hits += 1
+        return valor
+
+    def set(self, chave: tuple, valor: Any, ttl_segundos: Optional[float] = None):
+        """ttl_segundos sobrescreve o TTL padrão só pra esta entrada"""
+        if chave in self._itens:
+            self._itens.move_to_end(chave)
+        self._itens[chave] = (time.monotonic() + (self.ttl_segundos if ttl_segundos is None else ttl_segundos), valor)
+        self._por_restaurante[chave[0]].add(chave)
+        while len(self._itens) > self.max_itens:
+            mais_antiga = next(iter(self._itens))
+            self._remover(mais_antiga)
+            self.evictions += 1
+
+    def _remover(self, chave: tuple):
+        self._itens.pop(chave, None)
+        grupo = self._por_restaurante.get(chave[0])
+        if grupo is not None:
+            grupo.discard(chave)
+            if not grupo:
+                del self._por_restaurante[chave[0]]
+
+    def invalidar_grupo(self, grupo: Hashable):
+        """Remove todas as chaves que começam com grupo"""
+        for chave in list(self._por_restaurante.get(grupo, ())):
+            self._remover(chave)
+            self.invalidacoes += 1
+
+    def invalidar_restaurante(self, restaurante_id: Hashable):
+        """Remove tudo do restaurante e a listagem geral (que também mostra os dados dele)"""
+        self.invalidar_grupo(str(restaurante_id))
+        self.invalidar_grupo(None)
+
+    def limpar(self):
+        self._itens.clear()
+        self._por_restaurante.clear()
+
+    def metricas(self) -> dict:
+        consultas = self.hits + self.misses
+        return {
+            "itens": len(self._itens),
+            "max_itens": self.max_itens,
+            "ttl_segundos": self.ttl_segundos,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0,
+            "evictions": self.evictions,
+            "expiracoes": self.expiracoes,
+            "invalidacoes": self.invalidacoes,
+        }
+
+
+cache_leituras = CacheLRU(
+    max_itens=int(os.getenv("CACHE_MAX_ITENS", "1024")),
+    ttl_segundos=float(os.getenv("CACHE_TTL_SEGUNDOS", "60")),
+)
+
+_adapters: dict[Any, TypeAdapter] = {}
+
+def serializar(tipo, dados) -> bytes:
+    """Valida objetos do ORM contra o schema de resposta e devolve o JSON (mesmo formato do response_model)"""
+    adapter = _adapters.get(tipo)
+    if adapter is None:
+        adapter = _adapters[tipo] = TypeAdapter(tipo)
+    return adapter.dump_json(adapter.validate_python(dados, from_attributes=True))
+
+async def obter_ou_carregar(chave: tuple, tipo, carregar: Callable[[], Awaitable[Any]], versao: Optional[int] = None) -> Optional[bytes]:
+    """
+    JSON em cache para a chave; se não tiver, chama carregar() e guarda (None não é guardado).
+    Com versao, uma entrada gravada com outra versão (ex: escrita feita em outro worker) conta como miss.
+    """
+    item = cache_leituras.get(chave)
+    if item is not None and item[0] == versao:
+        return item[1]
+    dados = await carregar()
+    if dados is None:
+        return None
+    json_cache = serializar(tipo, dados)
+    cache_leituras.set(chave, (versao, json_cache))
+    return json_cache
+
+def _etag_confere(if_none_match: str, etag: str) -> bool:
+    """Comparação fraca do If-None-Match (aceita lista, W/ e *)"""
+    for candidata in if_none_match.split(","):
+        candidata = candidata.strip()
+        if candidata == "*" or candidata.removeprefix("W/") == etag:
+            return True
+    return False
+
+async def resposta_versionada(request: Request, chave: tuple, tipo, carregar: Callable[[], Awaitable[Any]], versao) -> Optional[Response]:
+    """
+    Resposta com ETag/Last-Modified derivados de (versao, atualizado_em) do restaurante.
+    Se o cliente já tem essa versão devolve 304 sem chamar carregar() nem serializar nada.
+    Retorna None quando carregar() não encontrou nada.
+    """
+    numero, atualizado_em = versao
+    etag = f'"v{numero}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if atualizado_em is not None:
+        headers["Last-Modified"] = format_datetime(atualizado_em.astimezone(timezone.utc), usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if _etag_confere(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since and atualizado_em is not None:
+        try:
+            if atualizado_em.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since):
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass  # data inválida: ignora o header, como manda o RFC
+
+    conteudo = await obter_ou_carregar(chave, tipo, carregar, numero)
+    if conteudo is None:
+        return None
+    return Response(content=conteudo, media_type="application/json", headers=headers)
@@ -0,0 +1,160 @@
+# type: ignore
+"""
+Busca de endereço por CEP (ViaCEP) com cache.
+
+ - um httpx.AsyncClient só por processo (conexões keep-alive com o ViaCEP, sem handshake TLS a cada busca)
+ - cache LRU+TTL dos CEPs encontrados (CEP_CACHE_TTL_SEGUNDOS, padrão 7 dias: CEP quase nunca muda) e
+   cache negativo mais curto dos inexistentes (CEP_CACHE_TTL_NEGATIVO, padrão 1h)
+ - buscas simultâneas do mesmo CEP esperam a mesma chamada ao ViaCEP (single-flight)
+ - CEP_DATASET: CSV opcional (cep,logradouro,bairro,cidade,estado[,complemento]; pode ser .csv.gz) carregado
+   em memória no startup; o que está nele é respondido sem rede, o resto ainda vai no ViaCEP
+
+Erros do ViaCEP (timeout, 5xx, rede) não entram no cache.
+Configuração: CEP_UPSTREAM_URL (com {cep}), CEP_TIMEOUT_SEGUNDOS (padrão 5), CEP_CACHE_MAX_ITENS (padrão 10000).
+"""
+import asyncio
+import csv
+import gzip
+import os
+import re
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from .cache import CacheLRU
+
+CEP_UPSTREAM_URL = os.getenv("CEP_UPSTREAM_URL", "https://viacep.com.br/ws/{cep}/json/")
+CEP_TIMEOUT_SEGUNDOS = float(os.getenv("CEP_TIMEOUT_SEGUNDOS", "5"))
+CEP_CACHE_TTL_NEGATIVO = float(os.getenv("CEP_CACHE_TTL_NEGATIVO", "3600"))
+CEP_DATASET = os.getenv("CEP_DATASET")
+
+cache_ceps = CacheLRU(
+    max_itens=int(os.getenv("CEP_CACHE_MAX_ITENS", "10000")),
+    ttl_segundos=float(os.getenv("CEP_CACHE_TTL_SEGUNDOS", str(7 * 24 * 3600))),
+)
+
+INEXISTENTE = False  # valor guardado no cache pros CEPs que o ViaCEP disse que não existem
+CAMPOS = ("logradouro", "bairro", "cidade", "estado", "complemento")
+
+_cliente: Optional[httpx.AsyncClient] = None
+_em_andamento: dict[str, asyncio.Task] = {}
+_dataset: Optional[dict[str, tuple]] = None
+_trava_dataset = asyncio.Lock()
+
+chamadas_upstream = 0
+buscas_agrupadas = 0  # buscas que pegaram carona numa chamada já em andamento
+respostas_dataset = 0
+
+def limpar_cep(cep: str) -> str:
+    cep_limpo = re.sub(r'\D', '', cep)
+    if len(cep_limpo) != 8:
+        raise HTTPException(status_code=400, detail="CEP deve conter 8 dígitos")
+    return cep_limpo
+
+def _cliente_http() -> httpx.AsyncClient:
+    global _cliente
+    if _cliente is None:
+        _cliente = httpx.AsyncClient(
+            timeout=CEP_TIMEOUT_SEGUNDOS,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _cliente
+
+async def fechar_cliente():
+    global _cliente
+    if _cliente is not None:
+        await _cliente.aclose()
+        _cliente = None
+
+def _ler_dataset(caminho: str) -> dict[str, tuple]:
+    abrir = gzip.open if caminho.endswith(".gz") else open
+    dataset = {}
+    with abrir(caminho, "rt", encoding="utf-8", newline="") as arquivo:
+        for linha in csv.DictReader(arquivo):
+            cep = re.sub(r'\D', '', linha.get("cep") or "")
+            if len(cep) == 8:
+                dataset[cep] = tuple((linha.get(campo) or "").strip() for campo in CAMPOS)
+    return dataset
+
+async def carregar_dataset():
+    """Lê o CEP_DATASET (uma vez por processo, numa thread); sem CEP_DATASET não faz nada"""
+    global _dataset
+    if not CEP_DATASET or _dataset is not None:
+        return
+    async with _trava_dataset:
+        if _dataset is None:
+            _dataset = await run_in_threadpool(_ler_dataset, CEP_DATASET)
+            print(f"Dataset de CEP carregado: {len(_dataset)} CEPs de {CEP_DATASET}")
+
+def _formatar(cep: str, valores: tuple) -> dict:
+    return {"cep": f"{cep[:5]}-{cep[5:]}", **dict(zip(CAMPOS, valores))}
+
+async def _consultar_upstream(cep: str):
+    """Endereço do ViaCEP (já no formato da API) ou INEXISTENTE; guarda no cache"""
+    global chamadas_upstream
+    chamadas_upstream += 1
+    try:
+        response = await _cliente_http().get(CEP_UPSTREAM_URL.format(cep=cep))
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Timeout ao buscar CEP. Tente novamente.")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Erro ao buscar CEP: {e}")
+    if response.status_code >= 500 or response.status_code == 429:
+        raise HTTPException(status_code=502, detail="Serviço de CEP indisponível. Tente novamente.")
+    try:
+        data = response.json() if response.status_code == 200 else {"erro": True}
+    except ValueError:
+        raise HTTPException(status_code=502, detail="Resposta inválida do serviço de CEP")
+    if data.get("erro"):
+        cache_ceps.set(("cep", cep), INEXISTENTE, CEP_CACHE_TTL_NEGATIVO)
+        return INEXISTENTE
+    endereco = {
+        "cep": data.get("cep", ""),
+        "logradouro": data.get("logradouro", ""),
+        "bairro": data.get("bairro", ""),
+        "cidade": data.get("localidade", ""),
+        "estado": data.get("uf", ""),
+        "complemento": data.get("complemento", ""),
+    }
+    cache_ceps.set(("cep", cep), endereco)
+    return endereco
+
+def _terminou(tarefa: asyncio.Task):
+    _em_andamento.pop(tarefa.get_name(), None)
+    if not tarefa.cancelled():
+        tarefa.exception()  # marca como lida: se todo mundo desistiu de esperar, não vira aviso no log
+
+async def buscar_endereco(cep: str) -> dict:
+    """Endereço do CEP (8 dígitos); 404 se não existe"""
+    global buscas_agrupadas, respostas_dataset
+    await carregar_dataset()
+    if _dataset is not None and cep in _dataset:
+        respostas_dataset += 1
+        return _formatar(cep, _dataset[cep])
+
+    endereco = cache_ceps.get(("cep", cep))
+    if endereco is None:
+        tarefa = _em_andamento.get(cep)
+        if tarefa is None:
+            tarefa = _em_andamento[cep] = asyncio.create_task(_consultar_upstream(cep), name=cep)
+            tarefa.add_done_callback(_terminou)
+        else:
+            buscas_agrupadas += 1
+        # shield: se quem chegou primeiro desistir (cliente fechou a conexão), a chamada continua pros outros
+        endereco = await asyncio.shield(tarefa)
+    if endereco is INEXISTENTE:
+        raise HTTPException(status_code=404, detail="CEP não encontrado")
+    return endereco
+
+def metricas() -> dict:
+    return {
+        **cache_ceps.metricas(),
+        "ttl_negativo_segundos": CEP_CACHE_TTL_NEGATIVO,
+        "chamadas_upstream": chamadas_upstream,
+        "buscas_agrupadas": buscas_agrupadas,
+        "em_andamento": len(_em_andamento),
+        "dataset": len(_dataset) if _dataset is not None else None,
+        "respostas_dataset": respostas_dataset,
+    }
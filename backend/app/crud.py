@@ -2,20 +2,147 @@
 from fastapi import HTTPException
 from sqlalchemy import select
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from . import models, schemas
+from . import models, schemas, estatisticas
 from uuid import UUID
+import asyncio
+import base64
+import uuid
 from .auth import gerar_hash
+from .auth_cache import invalidar_principal
+from .cache import cache_leituras
+from .database import AsyncSessionLocal
+from .restricoes import normalizar_restricoes
+
+STATUS_PEDIDO = ["Recebido", "Em preparo", "Saiu para entrega", "Entregue", "Cancelado"]
+# status -> para onde pode ir; Entregue e Cancelado são finais
+TRANSICOES_PEDIDO = {
+    "Recebido": {"Em preparo", "Cancelado"},
+    "Em preparo": {"Saiu para entrega", "Cancelado"},
+    "Saiu para entrega": {"Entregue", "Cancelado"},
+    "Entregue": set(),
+    "Cancelado": set(),
+}
+# coluna de pedidos que guarda quando o pedido entrou no status (Recebido é o data_pedido)
+HORARIO_STATUS = {
+    "Em preparo": "em_preparo_em",
+    "Saiu para entrega": "saiu_para_entrega_em",
+    "Entregue": "entregue_em",
+    "Cancelado": "cancelado_em",
+}
+
+def codificar_cursor(*partes) -> str:
+    """Cursor opaco com a posição (chave de ordenação, id) do último item da página"""
+    bruto = "|".join(str(parte) for parte in partes)
+    return base64.urlsafe_b64encode(bruto.encode()).decode()
+
+def decodificar_cursor(cursor: str, *conversores):
+    """Desfaz codificar_cursor aplicando um conversor por parte (ex: datetime.fromisoformat, UUID)"""
+    try:
+        partes = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        if len(partes) != len(conversores):
+            raise ValueError
+        return tuple(converter(parte) for converter, parte in zip(conversores, partes))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
 async def get_restaurants(db: AsyncSession, limit: int = 50):
     q = await db.execute(select(models.Restaurante).where(models.Restaurante.ativo==True).limit(limit))
     return q.scalars().all() #executa e retorna resultados 
 
+def query_busca_restaurantes(filtros: schemas.FiltroRestaurantes):
+    """Monta a busca de restaurantes ativos, ordenada pela avaliação (maior primeiro) ou pelo ETA (menor primeiro)"""
+    from .models import Restaurante, TEXTO_BUSCA_RESTAURANTE, CIDADE_RESTAURANTE, ESTADO_RESTAURANTE, AVALIACAO_RESTAURANTE, ETA_RESTAURANTE
+    from decimal import Decimal
+
+    if filtros.ordenar == "eta":
+        ordem = (ETA_RESTAURANTE.asc(), Restaurante.restaurante_id.asc())
+    else:
+        ordem = (AVALIACAO_RESTAURANTE.desc(), Restaurante.restaurante_id.desc())
+    q = (
+        sa.select(Restaurante)
+        .where(Restaurante.ativo == True)
+        .order_by(*ordem)
+        .limit(filtros.limite + 1)  # um a mais só pra saber se existe próxima página
+    )
+    if filtros.q:
+        # ILIKE com % nas pontas é atendido pelo índice trigram (gin_trgm_ops)
+        termo = filtros.q.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        q = q.where(TEXTO_BUSCA_RESTAURANTE.ilike(f"%{termo}%"))
+    if filtros.estado:
+        q = q.where(ESTADO_RESTAURANTE == filtros.estado.strip().upper())
+    if filtros.cidade:
+        q = q.where(CIDADE_RESTAURANTE == filtros.cidade.strip().lower())
+    if filtros.avaliacao_minima is not None:
+        q = q.where(AVALIACAO_RESTAURANTE >= filtros.avaliacao_minima)
+    if filtros.taxa_maxima is not None:
+        q = q.where(sa.func.coalesce(Restaurante.taxa_entrega_base, 0) <= filtros.taxa_maxima)
+    if filtros.cursor and filtros.ordenar == "eta":
+        eta, restaurante_id = decodificar_cursor(filtros.cursor, int, UUID)
+        q = q.where(sa.tuple_(ETA_RESTAURANTE, Restaurante.restaurante_id) > sa.tuple_(eta, restaurante_id))
+    elif filtros.cursor:
+        avaliacao, restaurante_id = decodificar_cursor(filtros.cursor, Decimal, UUID)
+        q = q.where(sa.tuple_(AVALIACAO_RESTAURANTE, Restaurante.restaurante_id) < sa.tuple_(avaliacao, restaurante_id))
+    return q
+
+def eta_restaurante(restaurante: models.Restaurante) -> int:
+    """Mesmo valor de models.ETA_RESTAURANTE, calculado no objeto (pro cursor da busca por ETA)"""
+    for valor in (restaurante.eta_p50, restaurante.tempo_medio_entrega):
+        if valor is not None:
+            return valor
+    return models.SEM_ETA
+
+async def buscar_restaurantes(db: AsyncSession, filtros: schemas.FiltroRestaurantes):
+    """Retorna (restaurantes, cursor da próxima página ou None)"""
+    result = await db.execute(query_busca_restaurantes(filtros))
+    restaurantes = result.scalars().all()
+    if len(restaurantes) > filtros.limite:
+        restaurantes = restaurantes[:filtros.limite]
+        ultimo = restaurantes[-1]
+        if filtros.ordenar == "eta":
+            return restaurantes, codificar_cursor(eta_restaurante(ultimo), ultimo.restaurante_id)
+        return restaurantes, codificar_cursor(ultimo.avaliacao_media or 0, ultimo.restaurante_id)
+    return restaurantes, None
+
 async def get_restaurant(db: AsyncSession, restaurante_id: UUID):
     q = await db.execute(select(models.Restaurante).where(models.Restaurante.restaurante_id==restaurante_id))
     return q.scalar_one_or_none() #retorna 1 ou nenhum resultado
 
+async def incrementar_versao_restaurante(db: AsyncSession, restaurante_id: UUID):
+    """Muda o ETag das leituras do restaurante; chamar na mesma transação da escrita (antes do commit)"""
+    await db.execute(
+        sa.update(models.Restaurante)
+        .where(models.Restaurante.restaurante_id == restaurante_id)
+        .values(versao=models.Restaurante.versao + 1, atualizado_em=sa.func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+async def get_versao_restaurante(db: AsyncSession, restaurante_id: UUID):
+    """(versao, atualizado_em) do restaurante, ou None se não existir; só lê a linha pela PK"""
+    result = await db.execute(
+        sa.select(models.Restaurante.versao, models.Restaurante.atualizado_em)
+        .where(models.Restaurante.restaurante_id == restaurante_id)
+    )
+    return result.one_or_none()
+
+async def get_versao_perfil_restaurante(db: AsyncSession, restaurante_id: UUID):
+    """
+    Versão do RestauranteOut: a do restaurante mais a dos tempos observados ("versao.versao_tempos"),
+    que mudam sem mexer no ETag do cardápio e das avaliações. None se o restaurante não existir.
+    """
+    restaurante = models.Restaurante
+    result = await db.execute(
+        sa.select(
+            sa.func.concat(restaurante.versao, ".", restaurante.versao_tempos),
+            sa.func.greatest(restaurante.atualizado_em, restaurante.tempos_atualizados_em),  # greatest ignora NULL
+        )
+        .where(restaurante.restaurante_id == restaurante_id)
+    )
+    return result.one_or_none()
+
 async def get_restaurant_by_email(db: AsyncSession, email: str):
     q = await db.execute(select(models.Restaurante).where(models.Restaurante.email == email))
     return q.scalar_one_or_none()
@@ -30,19 +157,21 @@ async def create_restaurant(db: AsyncSession, payload: schemas.RestauranteCreate
         nome_fantasia=payload.nome_fantasia,
         razao_social=payload.razao_social,
         email=payload.email,
-        senha_hash=gerar_hash(payload.senha),
+        senha_hash=await gerar_hash(payload.senha),
         descricao=payload.descricao,
         telefone=payload.telefone,
         tempo_medio_entrega=payload.tempo_medio_entrega,
         taxa_entrega_base=payload.taxa_entrega_base,
         endereco=payload.endereco.dict(),
         foto_perfil=payload.foto_perfil,
+        foto_perfil_variantes=payload.foto_perfil_variantes,
         ativo=True,
     )
 
     db.add(restaurante)
     await db.commit()
     await db.refresh(restaurante)
+    cache_leituras.invalidar_restaurante(restaurante.restaurante_id)
     return restaurante
 
 async def update_restaurant(db: AsyncSession, restaurante_id: UUID, payload: schemas.RestauranteUpdate):
@@ -67,34 +196,103 @@ async def update_restaurant(db: AsyncSession, restaurante_id: UUID, payload: sch
     if payload.endereco is not None:
         restaurante.endereco = payload.endereco.dict()
     
+    await incrementar_versao_restaurante(db, restaurante_id)
     await db.commit()
     await db.refresh(restaurante)
+    cache_leituras.invalidar_restaurante(restaurante_id)
+    invalidar_principal(models.Restaurante, restaurante_id)
     return restaurante
 
 async def alterar_senha_restaurante(db: AsyncSession, restaurante_id: UUID, senha_atual: str, senha_nova: str):
     """Altera a senha do restaurante"""
     from .auth import verificar_senha, gerar_hash
     
-    restaurante = await get_restaurant(db, restaurante_id)
+    # populate_existing: o restaurante da sessão pode ter vindo do cache de autenticação
+    restaurante = await db.get(models.Restaurante, restaurante_id, populate_existing=True)
     if not restaurante:
         return None
     
     # Verifica se a senha atual está correta
-    if not verificar_senha(senha_atual, restaurante.senha_hash):
+    if not await verificar_senha(senha_atual, restaurante.senha_hash):
         raise HTTPException(status_code=400, detail="Senha atual incorreta")
     
     # Atualiza a senha
-    restaurante.senha_hash = gerar_hash(senha_nova)
+    restaurante.senha_hash = await gerar_hash(senha_nova)
     await db.commit()
     await db.refresh(restaurante)
+    invalidar_principal(models.Restaurante, restaurante_id)
     return restaurante
 
-async def get_menu(db: AsyncSession, restaurante_id: UUID): #mostra os pratos disponiveis de um restaurante
-    q = await db.execute(select(models.Prato).where(models.Prato.restaurante_id==restaurante_id, models.Prato.disponivel==True))
+def _filtro_restricoes(excluir_restricoes: list[str] | None = None, somente_sem_restricoes: bool = False):
+    """Condições sobre pratos.restricoes_normalizadas (operadores de array atendidos pelo índice GIN)"""
+    condicoes = []
+    excluir = normalizar_restricoes(excluir_restricoes)
+    if excluir:
+        condicoes.append(sa.not_(models.Prato.restricoes_normalizadas.overlap(excluir)))
+    if somente_sem_restricoes:
+        condicoes.append(models.Prato.restricoes_normalizadas == [])
+    return condicoes
+
+async def get_menu(db: AsyncSession, restaurante_id: UUID, excluir_restricoes: list[str] | None = None, somente_sem_restricoes: bool = False): #mostra os pratos disponiveis de um restaurante
+    q = await db.execute(
+        select(models.Prato)
+        # mesmo predicado do índice parcial ix_pratos_cardapio
+        .where(models.Prato.restaurante_id==restaurante_id, models.Prato.disponivel==True, models.Prato.arquivado_em.is_(None))
+        .where(*_filtro_restricoes(excluir_restricoes, somente_sem_restricoes))
+    )
     return q.scalars().all() #mostra todos os pratos disponiveis
 
+async def get_menu_restaurante(db: AsyncSession, restaurante_id: UUID):
+    """Cardápio pro próprio restaurante: inclui os indisponíveis (pra poder religar), não os arquivados"""
+    q = await db.execute(
+        select(models.Prato)
+        .where(models.Prato.restaurante_id == restaurante_id, models.Prato.arquivado_em.is_(None))
+        .order_by(models.Prato.created_at)
+    )
+    return q.scalars().all()
+
+async def get_pratos_compativeis(db: AsyncSession, usuario: models.Usuario, filtros: schemas.FiltroPratosCompativeis, marcacoes: list[str] | None = None):
+    """Pratos disponíveis, de restaurantes ativos, sem nenhuma restrição do usuário; retorna (pratos, próximo cursor)"""
+    from .models import Prato, Restaurante
+
+    q = (
+        sa.select(Prato)
+        .join(Restaurante, Restaurante.restaurante_id == Prato.restaurante_id)
+        .where(Prato.disponivel == True, Prato.arquivado_em.is_(None), Restaurante.ativo == True)
+        .where(*_filtro_restricoes(usuario.restricoes, bool(usuario.seletividade)))
+        .order_by(Prato.prato_id)
+        .limit(filtros.limite + 1)
+    )
+    if marcacoes:
+        # pratos marcados com todas as marcações pedidas (ex: vegano), via @> no índice GIN
+        q = q.where(Prato.restricoes_normalizadas.contains(normalizar_restricoes(marcacoes)))
+    if filtros.cursor:
+        (prato_id,) = decodificar_cursor(filtros.cursor, UUID)
+        q = q.where(Prato.prato_id > prato_id)
+
+    result = await db.execute(q)
+    pratos = result.scalars().all()
+    if len(pratos) > filtros.limite:
+        pratos = pratos[:filtros.limite]
+        return pratos, codificar_cursor(pratos[-1].prato_id)
+    return pratos, None
+
+async def preencher_restricoes_normalizadas(db: AsyncSession):
+    """Preenche restricoes_normalizadas dos pratos criados antes da coluna existir"""
+    result = await db.execute(
+        sa.select(models.Prato.prato_id, models.Prato.restricoes)
+        .where(models.Prato.restricoes_normalizadas.is_(None))
+    )
+    pendentes = [
+        {"prato_id": row.prato_id, "restricoes_normalizadas": normalizar_restricoes(row.restricoes)}
+        for row in result.all()
+    ]
+    if pendentes:
+        await db.execute(sa.update(models.Prato), pendentes)
+    await db.commit()
+
 async def get_prato(db: AsyncSession, prato_id: UUID): #mostra só um prato pelo id
-    q = await db.execute(select(models.Prato).where(models.Prato.prato_id==prato_id))
+    q = await db.execute(select(models.Prato).where(models.Prato.prato_id==prato_id, models.Prato.arquivado_em.is_(None)))
     return q.scalar_one_or_none()
 
 async def create_prato(db: AsyncSession, restaurante_id: UUID, payload: schemas.PratoCreate):
@@ -105,16 +303,18 @@ async def create_prato(db: AsyncSession, restaurante_id: UUID, payload: schemas.
         descricao=payload.descricao,
         preco=payload.preco,
         restricoes=payload.restricoes,
+        restricoes_normalizadas=normalizar_restricoes(payload.restricoes),
         disponivel=True
     )
     db.add(prato)
+    await incrementar_versao_restaurante(db, restaurante_id)
     await db.commit()       # 💡 importante: salva no banco
     await db.refresh(prato) # atualiza com dados do banco (ex: prato_id)
+    cache_leituras.invalidar_restaurante(restaurante_id)
     return prato
 
 async def update_prato(db: AsyncSession, prato_id: UUID, dados: schemas.PratoCreate):
-    result = await db.execute(select(models.Prato).where(models.Prato.prato_id == prato_id))
-    prato = result.scalar_one_or_none()
+    prato = await get_prato(db, prato_id)
 
     if not prato:
         return None
@@ -123,116 +323,403 @@ async def update_prato(db: AsyncSession, prato_id: UUID, dados: schemas.PratoCre
     prato.descricao = dados.descricao
     prato.preco = dados.preco
     prato.restricoes = dados.restricoes
+    prato.restricoes_normalizadas = normalizar_restricoes(dados.restricoes)
+    await incrementar_versao_restaurante(db, prato.restaurante_id)
     await db.commit()
     await db.refresh(prato)
+    cache_leituras.invalidar_restaurante(prato.restaurante_id)
     return prato
 
 async def delete_prato(db: AsyncSession, prato_id: UUID):
-    result = await db.execute(select(models.Prato).where(models.Prato.prato_id == prato_id))
-    prato = result.scalar_one_or_none()
+    """Arquiva o prato: some do cardápio, mas pedidos antigos e o top de pratos continuam achando a linha"""
+    prato = await get_prato(db, prato_id)
 
     if not prato:
         return False
 
-    await db.delete(prato)
+    prato.arquivado_em = sa.func.now()
+    await incrementar_versao_restaurante(db, prato.restaurante_id)
     await db.commit()
+    cache_leituras.invalidar_restaurante(prato.restaurante_id)
     return True
 
-async def create_pedido(db: AsyncSession, pedido_data: schemas.PedidoCreate, usuario_id: UUID):
+LOTE_UPSERT = 500  # linhas por INSERT ... ON CONFLICT (cada linha usa ~10 parâmetros, o limite do Postgres é 32767)
+
+async def _upsert_pratos(db: AsyncSession, restaurante_id: UUID, itens: list[schemas.PratoLoteItem]):
+    """
+    INSERT ... ON CONFLICT (prato_id) DO UPDATE dos itens, em blocos de LOTE_UPSERT; retorna [(prato, inserido)].
+    Um prato_id de outro restaurante não é tocado (WHERE do DO UPDATE) e derruba o lote com 404. Não faz commit.
+    """
+    Prato = models.Prato
+
+    ids = [item.prato_id for item in itens if item.prato_id]
+    if len(ids) != len(set(ids)):
+        raise HTTPException(status_code=422, detail="O mesmo prato_id aparece mais de uma vez no lote")
+
+    resultado = []
+    for inicio in range(0, len(itens), LOTE_UPSERT):
+        valores = [
+            {
+                "prato_id": item.prato_id or uuid.uuid4(),
+                "restaurante_id": restaurante_id,
+                "nome": item.nome,
+                "descricao": item.descricao,
+                "preco": item.preco,
+                "restricoes": item.restricoes,
+                "restricoes_normalizadas": normalizar_restricoes(item.restricoes),
+                "disponivel": item.disponivel,
+                "imagem_url": item.imagem_url,
+            }
+            for item in itens[inicio:inicio + LOTE_UPSERT]
+        ]
+        stmt = pg_insert(Prato).values(valores)
+        novo = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Prato.prato_id],
+            set_={
+                "nome": novo.nome,
+                "descricao": novo.descricao,
+                "preco": novo.preco,
+                "restricoes": novo.restricoes,
+                "restricoes_normalizadas": novo.restricoes_normalizadas,
+                "disponivel": novo.disponivel,
+                # sem imagem_url no item a foto atual fica; trocou a URL, as variantes da antiga não valem mais
+                "imagem_url": sa.func.coalesce(novo.imagem_url, Prato.imagem_url),
+                "imagem_variantes": sa.case(
+                    (sa.or_(novo.imagem_url.is_(None), novo.imagem_url == Prato.imagem_url), Prato.imagem_variantes),
+                    else_=sa.null(),
+                ),
+                "arquivado_em": None,  # mandar de novo um prato arquivado traz ele de volta pro cardápio
+            },
+            where=Prato.restaurante_id == novo.restaurante_id,
+        ).returning(Prato, sa.literal_column("xmax = 0").label("inserido"))  # xmax 0: a linha acabou de ser inserida
+        linhas = (await db.execute(stmt, execution_options={"populate_existing": True})).all()
+        if len(linhas) != len(valores):
+            devolvidos = {prato.prato_id for prato, _ in linhas}
+            alheios = [str(v["prato_id"]) for v in valores if v["prato_id"] not in devolvidos]
+            raise HTTPException(status_code=404, detail=f"Pratos não encontrados neste restaurante: {', '.join(alheios)}")
+        resultado.extend(linhas)
+    return resultado
+
+async def _arquivar_pratos(db: AsyncSession, restaurante_id: UUID, condicao) -> int:
+    """Arquiva os pratos (ainda não arquivados) do restaurante que atendem a condição; retorna quantos. Não faz commit."""
+    Prato = models.Prato
+    result = await db.execute(
+        sa.update(Prato)
+        .where(Prato.restaurante_id == restaurante_id, Prato.arquivado_em.is_(None), condicao)
+        .values(arquivado_em=sa.func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+async def _alterar_disponibilidade(db: AsyncSession, restaurante_id: UUID, itens: list[schemas.PratoDisponibilidade]) -> int:
+    """Dois UPDATEs (ligar e desligar) em vez de um por prato; retorna quantas linhas mudaram. Não faz commit."""
+    Prato = models.Prato
+    alterados = 0
+    for disponivel in (True, False):
+        ids = [item.prato_id for item in itens if item.disponivel is disponivel]
+        if ids:
+            result = await db.execute(
+                sa.update(Prato)
+                .where(Prato.restaurante_id == restaurante_id, Prato.prato_id.in_(ids), Prato.arquivado_em.is_(None),
+                       Prato.disponivel.is_distinct_from(disponivel))
+                .values(disponivel=disponivel)
+                .execution_options(synchronize_session=False)
+            )
+            alterados += result.rowcount
+    return alterados
+
+def _resultado_lote(linhas, **contadores) -> schemas.MenuLoteResultado:
+    return schemas.MenuLoteResultado(
+        criados=sum(1 for _, inserido in linhas if inserido),
+        atualizados=sum(1 for _, inserido in linhas if not inserido),
+        pratos=[schemas.PratoOut.model_validate(prato, from_attributes=True) for prato, _ in linhas],
+        **contadores,
+    )
+
+async def aplicar_lote_menu(db: AsyncSession, restaurante_id: UUID, lote: schemas.MenuLote) -> schemas.MenuLoteResultado:
+    """Upserts, remoções e disponibilidade numa transação, com um bump de versão e uma invalidação de cache só"""
+    linhas = await _upsert_pratos(db, restaurante_id, lote.upserts)
+    removidos = await _arquivar_pratos(db, restaurante_id, models.Prato.prato_id.in_(lote.remover)) if lote.remover else 0
+    alterados = await _alterar_disponibilidade(db, restaurante_id, lote.disponibilidade)
+    await incrementar_versao_restaurante(db, restaurante_id)
+    await db.commit()
+    cache_leituras.invalidar_restaurante(restaurante_id)
+    return _resultado_lote(linhas, removidos=removidos, disponibilidade_alterada=alterados)
+
+async def importar_menu(db: AsyncSession, restaurante_id: UUID, itens) -> schemas.MenuLoteResultado:
+    """
+    Substitui o cardápio inteiro pelos itens (iterável assíncrono de PratoLoteItem, lido enquanto chega), numa
+    transação só. Item sem prato_id reaproveita o prato de mesmo nome (sem diferenciar maiúsculas), então
+    importar o mesmo arquivo de novo não duplica nada (e um prato arquivado com aquele nome volta pro cardápio,
+    com o histórico de vendas). Pratos que ficaram de fora são arquivados.
+    """
+    Prato = models.Prato
+    existentes = {
+        nome.strip().lower(): prato_id
+        for prato_id, nome in (await db.execute(
+            # nomes repetidos: vale o último, então os ativos vêm depois dos arquivados e o mais novo por último
+            sa.select(Prato.prato_id, Prato.nome).where(Prato.restaurante_id == restaurante_id)
+            .order_by(Prato.arquivado_em.is_(None), Prato.created_at)
+        )).all()
+    }
+    importados: set[UUID] = set()
+    linhas, bloco = [], []
+
+    async def gravar_bloco():
+        for item in bloco:
+            if item.prato_id is None:
+                existente = existentes.get(item.nome.strip().lower())
+                # o mesmo nome duas vezes no arquivo: a segunda vira um prato novo em vez de sobrescrever a primeira
+                if existente not in importados and all(outro.prato_id != existente for outro in bloco):
+                    item.prato_id = existente
+            elif item.prato_id in importados:
+                raise HTTPException(status_code=422, detail=f"O prato_id {item.prato_id} aparece mais de uma vez na importação")
+        gravados = await _upsert_pratos(db, restaurante_id, bloco)
+        importados.update(prato.prato_id for prato, _ in gravados)
+        linhas.extend(gravados)
+        bloco.clear()
+
+    async for item in itens:
+        bloco.append(item)
+        if len(bloco) >= LOTE_UPSERT:
+            await gravar_bloco()
+    if bloco:
+        await gravar_bloco()
+
+    # um parâmetro só (array) em vez de um por prato: cardápio grande estouraria o limite de parâmetros do NOT IN
+    importados_array = sa.bindparam("importados", list(importados), type_=ARRAY(PG_UUID(as_uuid=True)))
+    removidos = await _arquivar_pratos(db, restaurante_id, sa.not_(Prato.prato_id == sa.any_(importados_array)))
+    await incrementar_versao_restaurante(db, restaurante_id)
+    await db.commit()
+    cache_leituras.invalidar_restaurante(restaurante_id)
+    return _resultado_lote(linhas, removidos=removidos)
+
+async def create_pedido(db: AsyncSession, pedido_data: schemas.PedidoCreate, usuario_id: UUID, pedido_id: UUID | None = None):
+    """Cria o pedido e os itens; pedido_id vem de fora quando já foi reservado por uma Idempotency-Key"""
     from . import models
-    
-    total = 0
-    # calcula o total
+
+    if not pedido_data.itens:
+        raise HTTPException(status_code=400, detail="O pedido deve conter pelo menos um item")
+    if any(item.quantidade < 1 for item in pedido_data.itens):
+        raise HTTPException(status_code=400, detail="A quantidade de cada item deve ser maior que zero")
+
+    # busca todos os pratos do carrinho numa query só (IN) em vez de um SELECT por item
+    prato_ids = {item.prato_id for item in pedido_data.itens}
+    result = await db.execute(
+        sa.select(
+            models.Prato.prato_id,
+            models.Prato.nome,
+            models.Prato.preco,
+            models.Prato.restaurante_id,
+            models.Prato.disponivel,
+            models.Prato.arquivado_em,
+        ).where(models.Prato.prato_id.in_(prato_ids))
+    )
+    pratos = {row.prato_id: row for row in result.all()}
+
+    for prato_id in prato_ids:
+        prato = pratos.get(prato_id)
+        if not prato:
+            raise HTTPException(status_code=404, detail=f"Prato {prato_id} não encontrado")
+        if prato.restaurante_id != pedido_data.restaurante_id:
+            raise HTTPException(status_code=400, detail=f"Prato {prato_id} não pertence a este restaurante")
+        if not prato.disponivel or prato.arquivado_em is not None:
+            raise HTTPException(status_code=400, detail=f"Prato {prato.nome} não está disponível")
+
+    # o pedido_id é gerado aqui pra montar pedido e itens sem precisar de flush intermediário
     pedido = models.Pedido(
+        pedido_id=pedido_id or uuid.uuid4(),
         restaurante_id=pedido_data.restaurante_id,
         usuario_id=usuario_id,  # Associa o pedido ao usuário logado
-        total=0  # atualizamos depois
-    )    
-    db.add(pedido)
-    await db.flush() #pra gerar o pedido_id, flush manda pro banco mas n da o commit, entao ele ja gera um ID
-    # diferença do flush pro commit é q da pra dar rollback, no commit nao, ele confirma definitivamente as operações
-    
+        status="Recebido",
+    )
+    total = 0
     for item in pedido_data.itens:
-        result = await db.execute(sa.select(models.Prato).where(models.Prato.prato_id==item.prato_id))
-        prato = result.scalar_one_or_none()
-        
-        if not prato:
-            raise Exception(f"Prato {item.prato_id} não encontrado")
-        
-        preco = float(prato.preco)
-        nome_prato = str(prato.nome)
-        total += preco * item.quantidade
-        
-        novo_item = models.ItemPedido(
+        prato = pratos[item.prato_id]
+        total += prato.preco * item.quantidade
+        pedido.itens.append(models.ItemPedido(
+            item_id=uuid.uuid4(),
             pedido_id=pedido.pedido_id,
             prato_id=item.prato_id,
-            nome_prato=nome_prato,
+            nome_prato=prato.nome,
             quantidade=item.quantidade,
-            preco_unitario=preco #puxa automatico
-        )
-        db.add(novo_item)
-        await db.flush()
-    
+            preco_unitario=prato.preco, #puxa automatico
+        ))
     pedido.total = total
+
+    # o flush manda 1 INSERT do pedido (com RETURNING do data_pedido) e 1 INSERT em lote
+    # (executemany) pra todos os itens; como expire_on_commit=False, os itens continuam
+    # carregados e nao precisa reler com selectinload
+    db.add(pedido)
     await db.flush()
+    # depois do flush do pedido: sem relationship, o flush não sabe que o histórico tem que ir depois (FK)
+    db.add(models.HistoricoStatusPedido(pedido_id=pedido.pedido_id, status=pedido.status, versao=0))
+    await estatisticas.registrar_pedido_criado(db, pedido)
     await db.commit()
-    
-    result = await db.execute(
-    sa.select(models.Pedido)
-    .options(selectinload(models.Pedido.itens))
-    .where(models.Pedido.pedido_id == pedido.pedido_id)
-)
-    pedido_com_itens = result.scalar_one()
+    return pedido
+
+async def get_pedido(db: AsyncSession, pedido_id: UUID):
+    """Pedido com os itens (pra devolver como PedidoOut) ou None"""
+    from .models import Pedido
 
-    return pedido_com_itens
+    result = await db.execute(sa.select(Pedido).options(selectinload(Pedido.itens)).where(Pedido.pedido_id == pedido_id))
+    return result.scalar_one_or_none()
 
-async def get_pedidos_restaurante(db: AsyncSession, restaurante_id: UUID):
+async def _listar_pedidos(db: AsyncSession, filtro, filtros: schemas.FiltroPedidos):
+    """Página de pedidos em ordem decrescente; retorna (pedidos, cursor da próxima página ou None)"""
     from .models import Pedido
+    from datetime import datetime
 
-    result = await db.execute(
+    q = (
         sa.select(Pedido)
         .options(selectinload(Pedido.itens))
-        .where(Pedido.restaurante_id == restaurante_id)
-        .order_by(Pedido.data_pedido.desc())
+        .where(filtro)
+        .order_by(Pedido.data_pedido.desc(), Pedido.pedido_id.desc())
+        .limit(filtros.limite + 1)  # um a mais só pra saber se existe próxima página
     )
-    return result.scalars().all()
-
-async def update_pedido_status(db: AsyncSession, pedido_id: UUID, novo_status: str, restaurante_id: UUID):
+    if filtros.status:
+        q = q.where(Pedido.status == filtros.status)
+    if filtros.desde:
+        q = q.where(Pedido.data_pedido >= filtros.desde)
+    if filtros.ate:
+        q = q.where(Pedido.data_pedido < filtros.ate)
+    if filtros.cursor:
+        # keyset: continua exatamente depois do último item da página anterior, usando o índice
+        data, pedido_id = decodificar_cursor(filtros.cursor, datetime.fromisoformat, UUID)
+        q = q.where(sa.tuple_(Pedido.data_pedido, Pedido.pedido_id) < sa.tuple_(data, pedido_id))
+
+    result = await db.execute(q)
+    pedidos = result.scalars().all()
+    if len(pedidos) > filtros.limite:
+        pedidos = pedidos[:filtros.limite]
+        ultimo = pedidos[-1]
+        return pedidos, codificar_cursor(ultimo.data_pedido.isoformat(), ultimo.pedido_id)
+    return pedidos, None
+
+async def get_pedidos_restaurante(db: AsyncSession, restaurante_id: UUID, filtros: schemas.FiltroPedidos):
     from .models import Pedido
 
+    return await _listar_pedidos(db, Pedido.restaurante_id == restaurante_id, filtros)
+
+async def update_pedido_status(db: AsyncSession, pedido_id: UUID, novo_status: str, restaurante_id: UUID, versao: int | None = None):
+    """
+    Muda o status com um UPDATE condicional só: pedido do restaurante, status atual que pode ir pro novo
+    (TRANSICOES_PEDIDO) e, se veio, a versao que o cliente viu. Dois dispositivos mudando o mesmo pedido ao
+    mesmo tempo: o segundo não sobrescreve o primeiro, recebe 409 com o status e a versao atuais.
+    Retorna a linha atualizada (com status_anterior) ou None se o pedido não é do restaurante.
+    """
+    from .models import Pedido, HistoricoStatusPedido
+
     # Validação de status válidos
-    status_validos = ["Recebido", "Em preparo", "Saiu para entrega", "Entregue", "Cancelado"]
-    if novo_status not in status_validos:
+    if novo_status not in STATUS_PEDIDO:
         raise HTTPException(
             status_code=400, 
-            detail=f"Status inválido. Status válidos: {', '.join(status_validos)}"
+            detail=f"Status inválido. Status válidos: {', '.join(STATUS_PEDIDO)}"
         )
 
-    pedido = await db.get(Pedido, pedido_id)
-
-    if not pedido:
-        return None
-
-    # Valida que o restaurante só pode atualizar seus próprios pedidos
-    if pedido.restaurante_id != restaurante_id:
-        return None
-
-    pedido.status = novo_status
+    anteriores = [status for status, destinos in TRANSICOES_PEDIDO.items() if novo_status in destinos]
+    do_restaurante = sa.and_(Pedido.pedido_id == pedido_id, Pedido.restaurante_id == restaurante_id)
+    # o UPDATE não devolve o valor antigo; o CTE trava a linha e lê o status de antes (a versão mais nova,
+    # já que o FOR UPDATE espera quem estiver mexendo), que as estatísticas precisam pra tirar de um status e pôr no outro
+    atual = sa.select(Pedido.pedido_id, Pedido.status).where(do_restaurante).with_for_update().cte("atual")
+    condicoes = [Pedido.pedido_id == atual.c.pedido_id, Pedido.status.in_(anteriores)]
+    if versao is not None:
+        condicoes.append(Pedido.versao == versao)
+    valores = {"status": novo_status, "versao": Pedido.versao + 1}
+    if novo_status in HORARIO_STATUS:  # Recebido não tem coluna (e nenhum status vai pra ele: cai no 409 abaixo)
+        valores[HORARIO_STATUS[novo_status]] = sa.func.now()
+    result = await db.execute(
+        sa.update(Pedido)
+        .where(*condicoes)
+        .values(valores)
+        .returning(
+            Pedido.pedido_id, Pedido.usuario_id, Pedido.restaurante_id, Pedido.data_pedido, Pedido.total,
+            Pedido.status, Pedido.versao, atual.c.status.label("status_anterior"),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    pedido = result.one_or_none()
+
+    if pedido is None:
+        # só no caminho de erro: descobre se o pedido não existe (pro restaurante) ou se o status/versao não batem
+        atual = (await db.execute(sa.select(Pedido.status, Pedido.versao).where(do_restaurante))).one_or_none()
+        if atual is None:
+            return None
+        if versao is not None and atual.versao != versao:
+            motivo = "O pedido foi alterado em outro dispositivo"
+        else:
+            motivo = f"Não é possível mudar de '{atual.status}' para '{novo_status}'"
+        raise HTTPException(status_code=409, detail={"erro": motivo, "status": atual.status, "versao": atual.versao})
+
+    db.add(HistoricoStatusPedido(
+        pedido_id=pedido.pedido_id, status_anterior=pedido.status_anterior, status=pedido.status, versao=pedido.versao,
+    ))
+    await estatisticas.registrar_mudanca_status(db, pedido, pedido.status_anterior)
+    tempos_novos = False
+    if novo_status in HORARIO_STATUS:
+        # só soma no histograma; os p50/p90 são recalculados fora da request (estatisticas.iniciar_recalculo)
+        tempos_novos = await estatisticas.registrar_tempos(db, pedido.pedido_id, pedido.restaurante_id, HORARIO_STATUS[novo_status])
     await db.commit()
-    await db.refresh(pedido)
+    if tempos_novos:
+        estatisticas.marcar_tempos_pendentes(pedido.restaurante_id)
     return pedido
 
-async def get_pedidos_usuario(db: AsyncSession, usuario_id: UUID):
-    from .models import Pedido
+async def get_historico_status(db: AsyncSession, pedido_id: UUID, restaurante_id: UUID):
+    """Mudanças de status do pedido em ordem; None se o pedido não é do restaurante"""
+    from .models import Pedido, HistoricoStatusPedido
 
+    dono = await db.scalar(sa.select(Pedido.restaurante_id).where(Pedido.pedido_id == pedido_id))
+    if dono != restaurante_id:
+        return None
     result = await db.execute(
-        sa.select(Pedido)
-        .options(selectinload(Pedido.itens))
-        .where(Pedido.usuario_id == usuario_id)
-        .order_by(Pedido.data_pedido.desc())
+        sa.select(HistoricoStatusPedido)
+        .where(HistoricoStatusPedido.pedido_id == pedido_id)
+        .order_by(HistoricoStatusPedido.versao, HistoricoStatusPedido.alterado_em)
     )
     return result.scalars().all()
 
+async def get_pedidos_usuario(db: AsyncSession, usuario_id: UUID, filtros: schemas.FiltroPedidos):
+    from .models import Pedido
+
+    return await _listar_pedidos(db, Pedido.usuario_id == usuario_id, filtros)
+
+async def get_historico_usuario(db: AsyncSession, usuario_id: UUID, filtros: schemas.FiltroPedidos):
+    """
+    Página do histórico do cliente com o resumo do restaurante e a avaliação de cada pedido.
+    Restaurantes e avaliações vêm em uma consulta IN cada (não uma por pedido); retorna (pedidos, cursor).
+    """
+    from .models import Pedido, Restaurante, Avaliacao
+
+    pedidos, proximo_cursor = await _listar_pedidos(db, Pedido.usuario_id == usuario_id, filtros)
+    if not pedidos:
+        return [], proximo_cursor
+
+    restaurante_ids = {p.restaurante_id for p in pedidos}
+    resumos = {
+        r.restaurante_id: schemas.RestauranteResumo.model_validate(r)
+        for r in (await db.execute(
+            sa.select(Restaurante.restaurante_id, Restaurante.nome_fantasia, Restaurante.foto_perfil,
+                      Restaurante.foto_perfil_variantes, Restaurante.avaliacao_media)
+            .where(Restaurante.restaurante_id.in_(restaurante_ids))
+        )).all()
+    }
+    avaliacoes = {
+        a.pedido_id: schemas.AvaliacaoResumo.model_validate(a)
+        for a in (await db.execute(
+            sa.select(Avaliacao.pedido_id, Avaliacao.nota, Avaliacao.comentario, Avaliacao.criado_em)
+            .where(Avaliacao.pedido_id.in_([p.pedido_id for p in pedidos]), Avaliacao.usuario_id == usuario_id)
+        )).all()
+    }
+
+    historico = []
+    for pedido in pedidos:
+        item = schemas.PedidoHistoricoOut.model_validate(pedido, from_attributes=True)
+        item.restaurante = resumos.get(pedido.restaurante_id)
+        item.avaliacao = avaliacoes.get(pedido.pedido_id)
+        historico.append(item)
+    return historico, proximo_cursor
+
 async def criar_usuario(db: AsyncSession, usuario: schemas.UsuarioCreate):
         # Verifica se já existe o email
     result = await db.execute(sa.select(models.Usuario).where(models.Usuario.email == usuario.email))
@@ -242,7 +729,7 @@ async def criar_usuario(db: AsyncSession, usuario: schemas.UsuarioCreate):
     novo_usuario = models.Usuario(
         nome=usuario.nome,
         email=usuario.email,
-        senha_hash=gerar_hash(usuario.senha),
+        senha_hash=await gerar_hash(usuario.senha),
         tipo_dieta=usuario.tipo_dieta,
         restricoes=usuario.restricoes,
         seletividade=usuario.seletividade
@@ -272,24 +759,27 @@ async def update_usuario(db: AsyncSession, usuario_id: UUID, payload: schemas.Us
     
     await db.commit()
     await db.refresh(usuario)
+    invalidar_principal(models.Usuario, usuario_id)
     return usuario
 
 async def alterar_senha_usuario(db: AsyncSession, usuario_id: UUID, senha_atual: str, senha_nova: str):
     """Altera a senha do usuário"""
     from .auth import verificar_senha, gerar_hash
     
-    usuario = await db.get(models.Usuario, usuario_id)
+    # populate_existing: o usuário da sessão pode ter vindo do cache de autenticação
+    usuario = await db.get(models.Usuario, usuario_id, populate_existing=True)
     if not usuario:
         return None
     
     # Verifica se a senha atual está correta
-    if not verificar_senha(senha_atual, usuario.senha_hash):
+    if not await verificar_senha(senha_atual, usuario.senha_hash):
         raise HTTPException(status_code=400, detail="Senha atual incorreta")
     
     # Atualiza a senha
-    usuario.senha_hash = gerar_hash(senha_nova)
+    usuario.senha_hash = await gerar_hash(senha_nova)
     await db.commit()
     await db.refresh(usuario)
+    invalidar_principal(models.Usuario, usuario_id)
     return usuario
 
 # ========== AVALIAÇÕES ==========
@@ -309,17 +799,7 @@ async def criar_avaliacao(db: AsyncSession, avaliacao_data: schemas.AvaliacaoCre
     if pedido.usuario_id != usuario_id:
         raise HTTPException(status_code=403, detail="Você só pode avaliar seus próprios pedidos")
     
-    # Verifica se já existe avaliação para este pedido
-    result = await db.execute(
-        sa.select(Avaliacao).where(
-            Avaliacao.pedido_id == avaliacao_data.pedido_id,
-            Avaliacao.usuario_id == usuario_id
-        )
-    )
-    if result.scalar_one_or_none():
-        raise HTTPException(status_code=400, detail="Este pedido já foi avaliado")
-    
-    # Cria a avaliação
+    # Cria a avaliação; avaliação duplicada é barrada pela constraint uq_avaliacao_pedido_usuario
     avaliacao = Avaliacao(
         pedido_id=avaliacao_data.pedido_id,
         restaurante_id=pedido.restaurante_id,
@@ -329,11 +809,17 @@ async def criar_avaliacao(db: AsyncSession, avaliacao_data: schemas.AvaliacaoCre
     )
     
     db.add(avaliacao)
-    await db.commit()
-    await db.refresh(avaliacao)
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Este pedido já foi avaliado")
     
-    # Atualiza a média de avaliações do restaurante
-    await atualizar_media_avaliacoes_restaurante(db, pedido.restaurante_id)
+    # Atualiza a média do restaurante na mesma transação
+    await atualizar_media_avaliacoes_restaurante(db, pedido.restaurante_id, avaliacao_data.nota)
+    await db.commit()
+    cache_leituras.invalidar_restaurante(pedido.restaurante_id)
+    invalidar_principal(models.Restaurante, pedido.restaurante_id)  # média/total de avaliações mudaram
     
     return avaliacao
 
@@ -358,118 +844,107 @@ async def get_avaliacao_pedido(db: AsyncSession, pedido_id: UUID, usuario_id: UU
     )
     return result.scalar_one_or_none()
 
-async def atualizar_media_avaliacoes_restaurante(db: AsyncSession, restaurante_id: UUID):
-    from .models import Avaliacao, Restaurante
+async def atualizar_media_avaliacoes_restaurante(db: AsyncSession, restaurante_id: UUID, nota: int):
+    """Soma uma nota no contador do restaurante e recalcula a média sem reler as avaliações (não faz commit)"""
+    from .models import Restaurante
     
-    # Calcula a média das avaliações
+    # no SET as colunas ainda têm o valor antigo, por isso a média usa (soma + nota) / (total + 1)
     result = await db.execute(
-        sa.select(sa.func.avg(Avaliacao.nota))
-        .where(Avaliacao.restaurante_id == restaurante_id)
+        sa.update(Restaurante)
+        .where(Restaurante.restaurante_id == restaurante_id)
+        .values(
+            total_avaliacoes=Restaurante.total_avaliacoes + 1,
+            soma_avaliacoes=Restaurante.soma_avaliacoes + nota,
+            avaliacao_media=sa.func.round(
+                sa.cast(Restaurante.soma_avaliacoes + nota, sa.Numeric) / (Restaurante.total_avaliacoes + 1), 2
+            ),
+            versao=Restaurante.versao + 1,  # novas avaliações mudam o ETag do restaurante
+            atualizado_em=sa.func.now(),
+        )
+        .returning(Restaurante.avaliacao_media, Restaurante.total_avaliacoes)
+        .execution_options(synchronize_session=False)
     )
-    media = result.scalar()
-    
-    # Atualiza o restaurante
-    restaurante = await db.get(Restaurante, restaurante_id)
-    if restaurante:
-        restaurante.avaliacao_media = float(media) if media else 0.0
-        await db.commit()
-        await db.refresh(restaurante)
+    return result.one_or_none()
 
 # ========== ESTATÍSTICAS ==========
 
-async def get_estatisticas_restaurante(db: AsyncSession, restaurante_id: UUID):
-    from .models import Pedido, ItemPedido, Prato, Avaliacao
-    from datetime import datetime, timedelta
-    
-    # Total de pedidos
-    total_pedidos_result = await db.execute(
-        sa.select(sa.func.count(Pedido.pedido_id))
-        .where(Pedido.restaurante_id == restaurante_id)
-    )
-    total_pedidos = total_pedidos_result.scalar() or 0
-    
-    # Pedidos por status
-    pedidos_por_status = {}
-    status_list = ["Recebido", "Em preparo", "Saiu para entrega", "Entregue", "Cancelado"]
-    for status in status_list:
+async def _pratos_mais_vendidos(restaurante_id: UUID, limite: int = 5):
+    """Top pratos do restaurante; usa sessão própria pra poder rodar em paralelo com a agregação de pedidos.
+    Prato arquivado continua contando; o outer join cobre os que foram apagados de verdade antes do arquivamento existir."""
+    from .models import VendaDiariaPrato, Prato
+
+    async with AsyncSessionLocal() as db:
         result = await db.execute(
-            sa.select(sa.func.count(Pedido.pedido_id))
-            .where(
-                Pedido.restaurante_id == restaurante_id,
-                Pedido.status == status
+            sa.select(
+                VendaDiariaPrato.prato_id,
+                sa.func.coalesce(Prato.nome, "Prato removido").label('nome'),
+                sa.func.sum(VendaDiariaPrato.quantidade).label('total_vendido')
             )
+            .outerjoin(Prato, VendaDiariaPrato.prato_id == Prato.prato_id)
+            .where(VendaDiariaPrato.restaurante_id == restaurante_id)
+            .group_by(VendaDiariaPrato.prato_id, Prato.nome)
+            .order_by(sa.desc('total_vendido'))
+            .limit(limite)
         )
-        pedidos_por_status[status] = result.scalar() or 0
-    
-    # Receita total
-    receita_result = await db.execute(
-        sa.select(sa.func.sum(Pedido.total))
-        .where(
-            Pedido.restaurante_id == restaurante_id,
-            Pedido.status == "Entregue"
-        )
-    )
-    receita_total = float(receita_result.scalar() or 0)
-    
-    # Receita do último mês
-    um_mes_atras = datetime.now() - timedelta(days=30)
-    receita_mes_result = await db.execute(
-        sa.select(sa.func.sum(Pedido.total))
-        .where(
-            Pedido.restaurante_id == restaurante_id,
-            Pedido.status == "Entregue",
-            Pedido.data_pedido >= um_mes_atras
-        )
-    )
-    receita_mes = float(receita_mes_result.scalar() or 0)
-    
-    # Média de pedidos por dia (últimos 30 dias)
-    pedidos_mes_result = await db.execute(
-        sa.select(sa.func.count(Pedido.pedido_id))
-        .where(
-            Pedido.restaurante_id == restaurante_id,
-            Pedido.data_pedido >= um_mes_atras
-        )
-    )
-    pedidos_mes = pedidos_mes_result.scalar() or 0
-    media_pedidos_dia = round(pedidos_mes / 30, 1) if pedidos_mes > 0 else 0
-    
-    # Pratos mais vendidos
-    pratos_vendidos_result = await db.execute(
+        return [
+            {
+                "prato_id": str(row.prato_id),
+                "nome": row.nome,
+                "total_vendido": int(row.total_vendido)
+            }
+            for row in result.all()
+        ]
+
+async def get_estatisticas_restaurante(db: AsyncSession, restaurante_id: UUID, dias: int = 30):
+    from .models import EstatisticaDiaria, Restaurante
+    from datetime import datetime, timedelta, timezone
+
+    # lê as agregações diárias (O(dias x status) linhas) em vez de varrer todos os pedidos;
+    # a janela conta o dia de hoje e os (dias - 1) anteriores, em UTC
+    inicio_periodo = datetime.now(timezone.utc).date() - timedelta(days=dias - 1)
+    no_periodo = EstatisticaDiaria.dia >= inicio_periodo
+
+    agregado = (
         sa.select(
-            ItemPedido.prato_id,
-            Prato.nome,
-            sa.func.sum(ItemPedido.quantidade).label('total_vendido')
+            EstatisticaDiaria.status,
+            sa.func.sum(EstatisticaDiaria.quantidade).label("quantidade"),
+            sa.func.coalesce(sa.func.sum(EstatisticaDiaria.quantidade).filter(no_periodo), 0).label("quantidade_periodo"),
+            sa.func.sum(EstatisticaDiaria.receita).label("receita"),
+            sa.func.coalesce(sa.func.sum(EstatisticaDiaria.receita).filter(no_periodo), 0).label("receita_periodo"),
+            sa.select(Restaurante.total_avaliacoes)
+            .where(Restaurante.restaurante_id == restaurante_id)
+            .scalar_subquery()
+            .label("total_avaliacoes"),
         )
-        .join(Prato, ItemPedido.prato_id == Prato.prato_id)
-        .join(Pedido, ItemPedido.pedido_id == Pedido.pedido_id)
-        .where(Pedido.restaurante_id == restaurante_id)
-        .group_by(ItemPedido.prato_id, Prato.nome)
-        .order_by(sa.desc('total_vendido'))
-        .limit(5)
+        .where(EstatisticaDiaria.restaurante_id == restaurante_id)
+        .group_by(EstatisticaDiaria.status)
     )
-    pratos_mais_vendidos = [
-        {
-            "prato_id": str(row.prato_id),
-            "nome": row.nome,
-            "total_vendido": int(row.total_vendido)
-        }
-        for row in pratos_vendidos_result.all()
-    ]
-    
-    # Total de avaliações
-    total_avaliacoes_result = await db.execute(
-        sa.select(sa.func.count(Avaliacao.avaliacao_id))
-        .where(Avaliacao.restaurante_id == restaurante_id)
+
+    # asyncpg não executa duas queries ao mesmo tempo na mesma conexão,
+    # então os pratos mais vendidos rodam numa sessão separada em paralelo
+    resultado, pratos_mais_vendidos = await asyncio.gather(
+        db.execute(agregado),
+        _pratos_mais_vendidos(restaurante_id),
     )
-    total_avaliacoes = total_avaliacoes_result.scalar() or 0
-    
+    linhas = resultado.all()
+
+    pedidos_por_status = {status: 0 for status in STATUS_PEDIDO}
+    for linha in linhas:
+        pedidos_por_status[linha.status] = linha.quantidade
+
+    entregues = next((linha for linha in linhas if linha.status == "Entregue"), None)
+    pedidos_periodo = sum(linha.quantidade_periodo for linha in linhas)
+
+    # toda avaliação pertence a um pedido, então sem pedidos não tem avaliação
+    total_avaliacoes = linhas[0].total_avaliacoes if linhas else 0
+
     return {
-        "total_pedidos": total_pedidos,
+        "total_pedidos": sum(linha.quantidade for linha in linhas),
         "pedidos_por_status": pedidos_por_status,
-        "receita_total": receita_total,
-        "receita_mes": receita_mes,
-        "media_pedidos_dia": media_pedidos_dia,
+        "receita_total": float(entregues.receita) if entregues else 0.0,
+        "receita_mes": float(entregues.receita_periodo) if entregues else 0.0,
+        "media_pedidos_dia": round(pedidos_periodo / dias, 1) if pedidos_periodo > 0 else 0,
+        "periodo_dias": dias,
         "pratos_mais_vendidos": pratos_mais_vendidos,
         "total_avaliacoes": total_avaliacoes
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,435 @@
+# type: ignore
+"""
+Agregações diárias por restaurante usadas no dashboard de estatísticas.
+
+As tabelas estatisticas_diarias e vendas_diarias_pratos são atualizadas na mesma transação
+de crud.create_pedido e crud.update_pedido_status, então o dashboard lê O(dias) linhas
+em vez de varrer todos os pedidos.
+
+tempos_diarios é um histograma por minuto da duração das etapas (preparo, entrega e total) de cada
+pedido, somado quando a etapa termina. Os p50/p90 dos últimos TEMPO_JANELA_DIAS saem dele (O(dias x
+minutos) linhas, nunca os pedidos) e ficam gravados no restaurante: é o ETA observado do RestauranteOut.
+A mudança de status só soma no histograma; os p50/p90 são recalculados fora da request por uma tarefa de
+cada worker, a cada TEMPO_RECALCULO_SEGUNDOS para os restaurantes com etapas novas e uma vez por dia para
+todos (a janela anda mesmo sem entregas novas). Mudar os tempos sobe restaurantes.versao_tempos, não a
+versao: o ETag do cardápio e das avaliações continua o mesmo.
+No startup, reconstruir_se_vazio faz o backfill sozinho quando as tabelas estão vazias e já há pedidos.
+Configuração: TEMPO_JANELA_DIAS (padrão 30), TEMPO_MIN_AMOSTRAS (padrão 5, abaixo disso o p50/p90 fica nulo),
+TEMPO_RECALCULO_SEGUNDOS (padrão 60).
+
+Comandos (dentro de backend/):
+    python -m app.estatisticas reconstruir [--restaurante ID]   # backfill a partir de pedidos/itens_pedido
+    python -m app.estatisticas verificar [--restaurante ID]     # compara com um recálculo ao vivo
+"""
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+TEMPO_JANELA_DIAS = int(os.getenv("TEMPO_JANELA_DIAS", "30"))
+TEMPO_MIN_AMOSTRAS = int(os.getenv("TEMPO_MIN_AMOSTRAS", "5"))
+TEMPO_RECALCULO_SEGUNDOS = float(os.getenv("TEMPO_RECALCULO_SEGUNDOS", "60"))
+TEMPO_MAX_MINUTOS = 240  # acima disso conta como 240: pedido esquecido aberto não estica o histograma
+
+_tempos_pendentes: set[UUID] = set()  # restaurantes com etapas novas no histograma desde o último recálculo
+_tarefa_recalculo: Optional[asyncio.Task] = None
+
+# etapa -> (coluna de início e de fim em pedidos, colunas do p50 e do p90 em restaurantes)
+ETAPAS = {
+    "preparo": ("data_pedido", "saiu_para_entrega_em", ("tempo_preparo_p50", "tempo_preparo_p90")),
+    "entrega": ("saiu_para_entrega_em", "entregue_em", ("tempo_entrega_p50", "tempo_entrega_p90")),
+    "total": ("data_pedido", "entregue_em", ("eta_p50", "eta_p90")),
+}
+
+
+def dia_do_pedido(data_pedido):
+    """Dia (UTC) em que o pedido entra na agregação"""
+    return data_pedido.astimezone(timezone.utc).date()
+
+def _dia_sql(coluna):
+    return sa.cast(sa.func.timezone("UTC", coluna), sa.Date)
+
+async def _somar_status(db: AsyncSession, linhas: list[dict]):
+    """Upsert que soma quantidade/receita nas linhas (restaurante, dia, status)"""
+    tabela = models.EstatisticaDiaria.__table__
+    stmt = insert(tabela).values(linhas)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[tabela.c.restaurante_id, tabela.c.dia, tabela.c.status],
+        set_={
+            "quantidade": tabela.c.quantidade + stmt.excluded.quantidade,
+            "receita": tabela.c.receita + stmt.excluded.receita,
+        },
+    ))
+
+async def registrar_pedido_criado(db: AsyncSession, pedido: models.Pedido):
+    """Contabiliza um pedido novo (precisa do data_pedido já gerado, ou seja, depois do flush)"""
+    dia = dia_do_pedido(pedido.data_pedido)
+    await _somar_status(db, [{
+        "restaurante_id": pedido.restaurante_id,
+        "dia": dia,
+        "status": pedido.status,
+        "quantidade": 1,
+        "receita": pedido.total,
+    }])
+
+    # agrupa por prato antes do upsert: o ON CONFLICT não aceita a mesma linha duas vezes no mesmo comando
+    quantidades = defaultdict(int)
+    for item in pedido.itens:
+        quantidades[item.prato_id] += item.quantidade
+
+    tabela = models.VendaDiariaPrato.__table__
+    stmt = insert(tabela).values([
+        {"restaurante_id": pedido.restaurante_id, "dia": dia, "prato_id": prato_id, "quantidade": quantidade}
+        for prato_id, quantidade in quantidades.items()
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[tabela.c.restaurante_id, tabela.c.dia, tabela.c.prato_id],
+        set_={"quantidade": tabela.c.quantidade + stmt.excluded.quantidade},
+    ))
+
+async def registrar_mudanca_status(db: AsyncSession, pedido: models.Pedido, status_anterior: str):
+    """Move o pedido do status anterior para o atual num único upsert"""
+    if status_anterior == pedido.status:
+        return
+    dia = dia_do_pedido(pedido.data_pedido)
+    await _somar_status(db, [
+        {"restaurante_id": pedido.restaurante_id, "dia": dia, "status": status_anterior,
+         "quantidade": -1, "receita": -pedido.total},
+        {"restaurante_id": pedido.restaurante_id, "dia": dia, "status": pedido.status,
+         "quantidade": 1, "receita": pedido.total},
+    ])
+
+# ========== TEMPOS (SLA) ==========
+
+def _agregado_tempos_ao_vivo(filtro=None, etapas=tuple(ETAPAS)):
+    """Histograma (restaurante, dia, etapa, minutos) -> quantidade calculado direto de pedidos"""
+    from .models import Pedido
+
+    consultas = []
+    for etapa in etapas:
+        inicio, fim = (getattr(Pedido, coluna) for coluna in ETAPAS[etapa][:2])
+        segundos = sa.extract("epoch", fim - inicio)
+        minutos = sa.cast(sa.func.least(sa.func.greatest(sa.func.ceil(segundos / 60), 0), TEMPO_MAX_MINUTOS), sa.Integer)
+        dia = _dia_sql(fim)
+        q = (
+            sa.select(
+                Pedido.restaurante_id,
+                dia.label("dia"),
+                sa.literal(etapa).label("etapa"),
+                minutos.label("minutos"),
+                sa.func.count().label("quantidade"),
+            )
+            .where(inicio.is_not(None), fim.is_not(None))
+            .group_by(Pedido.restaurante_id, dia, minutos)
+        )
+        consultas.append(q.where(filtro) if filtro is not None else q)
+    return sa.union_all(*consultas)
+
+async def atualizar_tempos_restaurante(db: AsyncSession, restaurante_id: UUID, etapas=tuple(ETAPAS)) -> bool:
+    """
+    Recalcula os p50/p90 das etapas a partir do histograma da janela, num UPDATE só (percentil pela soma
+    acumulada por minuto). Só grava, e só muda a versao_tempos do restaurante, se algum valor mudou; retorna se mudou.
+    """
+    from .models import Restaurante, TempoDiario
+
+    desde = datetime.now(timezone.utc).date() - timedelta(days=TEMPO_JANELA_DIAS - 1)
+    por_minuto = (
+        sa.select(TempoDiario.etapa, TempoDiario.minutos, sa.func.sum(TempoDiario.quantidade).label("quantidade"))
+        .where(TempoDiario.restaurante_id == restaurante_id, TempoDiario.dia >= desde, TempoDiario.etapa.in_(etapas))
+        .group_by(TempoDiario.etapa, TempoDiario.minutos)
+        .subquery()
+    )
+    acumulado = sa.select(
+        por_minuto.c.etapa,
+        por_minuto.c.minutos,
+        sa.func.sum(por_minuto.c.quantidade).over(partition_by=por_minuto.c.etapa, order_by=por_minuto.c.minutos).label("acumulado"),
+        sa.func.sum(por_minuto.c.quantidade).over(partition_by=por_minuto.c.etapa).label("total"),
+    ).cte("acumulado")
+
+    def percentil(etapa: str, p: float):
+        # menor minuto em que a soma acumulada alcança p do total (percentil "disc" do histograma)
+        return (
+            sa.select(sa.func.min(acumulado.c.minutos))
+            .where(acumulado.c.etapa == etapa, acumulado.c.total >= TEMPO_MIN_AMOSTRAS,
+                   acumulado.c.acumulado >= acumulado.c.total * p)
+            .scalar_subquery()
+        )
+
+    novos = {}
+    for etapa in etapas:
+        coluna_p50, coluna_p90 = ETAPAS[etapa][2]
+        novos[coluna_p50] = percentil(etapa, 0.5)
+        novos[coluna_p90] = percentil(etapa, 0.9)
+    atuais = [getattr(Restaurante, coluna) for coluna in novos]
+    result = await db.execute(
+        sa.update(Restaurante)
+        .where(Restaurante.restaurante_id == restaurante_id, sa.tuple_(*atuais).is_distinct_from(sa.tuple_(*novos.values())))
+        # o ETA aparece no RestauranteOut, mas tem versão própria: não invalida o cardápio nem as avaliações
+        .values(**novos, versao_tempos=Restaurante.versao_tempos + 1, tempos_atualizados_em=sa.func.now())
+        .returning(Restaurante.restaurante_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.first() is not None
+
+async def registrar_tempos(db: AsyncSession, pedido_id: UUID, restaurante_id: UUID, coluna_fim: str) -> bool:
+    """
+    Chamar depois de preencher coluna_fim do pedido (ex: entregue_em): soma no histograma as etapas que
+    terminam nela. Retorna se alguma etapa terminou; nesse caso, depois do commit, chamar marcar_tempos_pendentes.
+    """
+    etapas = [etapa for etapa, (_, fim, _) in ETAPAS.items() if fim == coluna_fim]
+    if not etapas:
+        return False
+    tabela = models.TempoDiario.__table__
+    # a duração é calculada no SQL, com a mesma expressão do reconstruir/verificar
+    stmt = insert(tabela).from_select(
+        ["restaurante_id", "dia", "etapa", "minutos", "quantidade"],
+        _agregado_tempos_ao_vivo(models.Pedido.pedido_id == pedido_id, etapas),
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[tabela.c.restaurante_id, tabela.c.dia, tabela.c.etapa, tabela.c.minutos],
+        set_={"quantidade": tabela.c.quantidade + stmt.excluded.quantidade},
+    ))
+    return True
+
+def marcar_tempos_pendentes(restaurante_id: UUID):
+    """O histograma do restaurante mudou (já commitado): entra no próximo recálculo deste worker"""
+    _tempos_pendentes.add(restaurante_id)
+
+async def recalcular_tempos(db: AsyncSession, restaurante_ids) -> list[UUID]:
+    """Atualiza os p50/p90 de cada restaurante, um commit por restaurante (a linha fica travada só no UPDATE dele)"""
+    from .auth_cache import invalidar_principal
+    from .cache import cache_leituras
+
+    mudaram = []
+    for restaurante_id in restaurante_ids:
+        if await atualizar_tempos_restaurante(db, restaurante_id):
+            mudaram.append(restaurante_id)
+        await db.commit()
+    for restaurante_id in mudaram:
+        invalidar_principal(models.Restaurante, restaurante_id)  # p50/p90 aparecem no /restaurantes/me
+    if mudaram:
+        cache_leituras.invalidar_grupo(None)  # a listagem geral; o /{id} já confere a versao_tempos
+    return mudaram
+
+async def _recalculo_periodico():
+    from .database import AsyncSessionLocal
+
+    ultimo_dia = datetime.now(timezone.utc).date()
+    while True:
+        await asyncio.sleep(TEMPO_RECALCULO_SEGUNDOS)
+        hoje = datetime.now(timezone.utc).date()
+        pendentes = set(_tempos_pendentes)
+        _tempos_pendentes.difference_update(pendentes)
+        try:
+            async with AsyncSessionLocal() as db:
+                if hoje != ultimo_dia:
+                    # virou o dia: a janela andou pra todo mundo que tem histograma, com ou sem entregas novas
+                    pendentes |= set((await db.execute(sa.select(models.TempoDiario.restaurante_id).distinct())).scalars())
+                    ultimo_dia = hoje
+                await recalcular_tempos(db, pendentes)
+        except Exception as e:  # banco fora do ar não pode matar a tarefa; tenta na próxima rodada
+            _tempos_pendentes.update(pendentes)
+            print(f"Erro ao recalcular tempos dos restaurantes: {e!r}")
+
+def iniciar_recalculo():
+    global _tarefa_recalculo
+    if _tarefa_recalculo is None:
+        _tarefa_recalculo = asyncio.create_task(_recalculo_periodico())
+
+async def parar_recalculo():
+    global _tarefa_recalculo
+    if _tarefa_recalculo is not None:
+        _tarefa_recalculo.cancel()
+        await asyncio.gather(_tarefa_recalculo, return_exceptions=True)
+        _tarefa_recalculo = None
+
+# ========== BACKFILL / CONSISTÊNCIA ==========
+
+def _agregado_status_ao_vivo():
+    from .models import Pedido
+
+    dia = _dia_sql(Pedido.data_pedido)
+    return (
+        sa.select(
+            Pedido.restaurante_id,
+            dia.label("dia"),
+            Pedido.status,
+            sa.func.count().label("quantidade"),
+            sa.func.sum(Pedido.total).label("receita"),
+        )
+        .group_by(Pedido.restaurante_id, dia, Pedido.status)
+    )
+
+def _agregado_pratos_ao_vivo():
+    from .models import Pedido, ItemPedido
+
+    dia = _dia_sql(Pedido.data_pedido)
+    return (
+        sa.select(
+            Pedido.restaurante_id,
+            dia.label("dia"),
+            ItemPedido.prato_id,
+            sa.func.sum(ItemPedido.quantidade).label("quantidade"),
+        )
+        .join(Pedido, ItemPedido.pedido_id == Pedido.pedido_id)
+        .where(ItemPedido.prato_id.is_not(None))
+        .group_by(Pedido.restaurante_id, dia, ItemPedido.prato_id)
+    )
+
+async def reconstruir(db: AsyncSession, restaurante_id: UUID | None = None):
+    """Apaga e recalcula as agregações (e os tempos p50/p90) a partir de pedidos/itens_pedido, numa transação só"""
+    from .models import Pedido, EstatisticaDiaria, VendaDiariaPrato, TempoDiario, Restaurante
+
+    status_q = _agregado_status_ao_vivo()
+    pratos_q = _agregado_pratos_ao_vivo()
+    tempos_q = _agregado_tempos_ao_vivo()
+    apagar_status = sa.delete(EstatisticaDiaria)
+    apagar_pratos = sa.delete(VendaDiariaPrato)
+    apagar_tempos = sa.delete(TempoDiario)
+    restaurantes_q = sa.select(Restaurante.restaurante_id)
+    if restaurante_id is not None:
+        status_q = status_q.where(Pedido.restaurante_id == restaurante_id)
+        pratos_q = pratos_q.where(Pedido.restaurante_id == restaurante_id)
+        tempos_q = _agregado_tempos_ao_vivo(Pedido.restaurante_id == restaurante_id)
+        apagar_status = apagar_status.where(EstatisticaDiaria.restaurante_id == restaurante_id)
+        apagar_pratos = apagar_pratos.where(VendaDiariaPrato.restaurante_id == restaurante_id)
+        apagar_tempos = apagar_tempos.where(TempoDiario.restaurante_id == restaurante_id)
+        restaurantes_q = restaurantes_q.where(Restaurante.restaurante_id == restaurante_id)
+
+    # bloqueia escritas em pedidos até o commit pra nenhum pedido novo escapar do recálculo
+    await db.execute(sa.text("LOCK TABLE pedidos IN SHARE MODE"))
+    await db.execute(apagar_status)
+    await db.execute(apagar_pratos)
+    await db.execute(
+        sa.insert(EstatisticaDiaria).from_select(
+            ["restaurante_id", "dia", "status", "quantidade", "receita"], status_q
+        )
+    )
+    await db.execute(
+        sa.insert(VendaDiariaPrato).from_select(
+            ["restaurante_id", "dia", "prato_id", "quantidade"], pratos_q
+        )
+    )
+    await db.execute(apagar_tempos)
+    await db.execute(
+        sa.insert(TempoDiario).from_select(
+            ["restaurante_id", "dia", "etapa", "minutos", "quantidade"], tempos_q
+        )
+    )
+    for (rid,) in (await db.execute(restaurantes_q)).all():
+        await atualizar_tempos_restaurante(db, rid)
+    await db.commit()
+
+async def reconstruir_se_vazio(db: AsyncSession) -> bool:
+    """
+    Backfill do startup: se as agregações estão vazias mas já existem pedidos (banco de antes das tabelas),
+    roda o reconstruir. O advisory lock faz só um worker reconstruir; os outros esperam e já acham preenchido.
+    """
+    from .models import Pedido, EstatisticaDiaria
+
+    await db.execute(sa.select(sa.func.pg_advisory_xact_lock(sa.func.hashtext("estatisticas.reconstruir"))))
+    vazio = await db.scalar(sa.select(EstatisticaDiaria.restaurante_id).limit(1)) is None
+    if vazio and await db.scalar(sa.select(Pedido.pedido_id).limit(1)) is not None:
+        await reconstruir(db)  # o commit do reconstruir solta o lock
+        return True
+    await db.commit()
+    return False
+
+async def verificar(db: AsyncSession, restaurante_id: UUID | None = None) -> list[str]:
+    """Compara as agregações com um recálculo ao vivo; retorna a lista de divergências"""
+    from .models import Pedido, EstatisticaDiaria, VendaDiariaPrato, TempoDiario
+
+    status_q = _agregado_status_ao_vivo()
+    pratos_q = _agregado_pratos_ao_vivo()
+    tempos_q = _agregado_tempos_ao_vivo()
+    rollup_status_q = sa.select(EstatisticaDiaria)
+    rollup_pratos_q = sa.select(VendaDiariaPrato)
+    rollup_tempos_q = sa.select(TempoDiario)
+    if restaurante_id is not None:
+        status_q = status_q.where(Pedido.restaurante_id == restaurante_id)
+        pratos_q = pratos_q.where(Pedido.restaurante_id == restaurante_id)
+        tempos_q = _agregado_tempos_ao_vivo(Pedido.restaurante_id == restaurante_id)
+        rollup_status_q = rollup_status_q.where(EstatisticaDiaria.restaurante_id == restaurante_id)
+        rollup_pratos_q = rollup_pratos_q.where(VendaDiariaPrato.restaurante_id == restaurante_id)
+        rollup_tempos_q = rollup_tempos_q.where(TempoDiario.restaurante_id == restaurante_id)
+
+    esperado_status = {
+        (r.restaurante_id, r.dia, r.status): (r.quantidade, Decimal(r.receita or 0))
+        for r in (await db.execute(status_q)).all()
+    }
+    atual_status = {
+        (r.restaurante_id, r.dia, r.status): (r.quantidade, Decimal(r.receita))
+        for r in (await db.execute(rollup_status_q)).scalars()
+        if r.quantidade != 0 or r.receita != 0  # linhas zeradas por mudança de status são equivalentes a não existir
+    }
+    esperado_pratos = {
+        (r.restaurante_id, r.dia, r.prato_id): r.quantidade
+        for r in (await db.execute(pratos_q)).all()
+    }
+    atual_pratos = {
+        (r.restaurante_id, r.dia, r.prato_id): r.quantidade
+        for r in (await db.execute(rollup_pratos_q)).scalars()
+    }
+
+    esperado_tempos = {
+        (r.restaurante_id, r.dia, r.etapa, r.minutos): r.quantidade
+        for r in (await db.execute(tempos_q)).all()
+    }
+    atual_tempos = {
+        (r.restaurante_id, r.dia, r.etapa, r.minutos): r.quantidade
+        for r in (await db.execute(rollup_tempos_q)).scalars()
+    }
+
+    divergencias = []
+    for chave in sorted(set(esperado_status) | set(atual_status), key=str):
+        esperado = esperado_status.get(chave, (0, Decimal(0)))
+        atual = atual_status.get(chave, (0, Decimal(0)))
+        if esperado != atual:
+            divergencias.append(f"status {chave}: esperado {esperado}, agregado {atual}")
+    for chave in sorted(set(esperado_pratos) | set(atual_pratos), key=str):
+        esperado = esperado_pratos.get(chave, 0)
+        atual = atual_pratos.get(chave, 0)
+        if esperado != atual:
+            divergencias.append(f"prato {chave}: esperado {esperado}, agregado {atual}")
+    for chave in sorted(set(esperado_tempos) | set(atual_tempos), key=str):
+        esperado = esperado_tempos.get(chave, 0)
+        atual = atual_tempos.get(chave, 0)
+        if esperado != atual:
+            divergencias.append(f"tempo {chave}: esperado {esperado}, agregado {atual}")
+    return divergencias
+
+async def _main(args):
+    from .database import AsyncSessionLocal, Base, engine
+
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with AsyncSessionLocal() as db:
+            if args.comando == "reconstruir":
+                await reconstruir(db, args.restaurante)
+                print("Agregações reconstruídas")
+                return 0
+            divergencias = await verificar(db, args.restaurante)
+            for divergencia in divergencias:
+                print(divergencia)
+            print(f"{len(divergencias)} divergência(s) encontrada(s)")
+            return 1 if divergencias else 0
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção das agregações diárias de estatísticas")
+    parser.add_argument("comando", choices=["reconstruir", "verificar"])
+    parser.add_argument("--restaurante", type=UUID, default=None, help="limita a um restaurante")
+    raise SystemExit(asyncio.run(_main(parser.parse_args())))
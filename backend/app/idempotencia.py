@@ -0,0 +1,108 @@
+# type: ignore
+"""
+Idempotency-Key do POST /pedidos/: o app manda a mesma chave quando repete a requisição (conexão caiu antes
+da resposta chegar) e recebe o pedido que já foi criado, em vez de um pedido duplicado na cozinha.
+
+A chave é gravada na mesma transação do pedido, antes dele, com INSERT ... ON CONFLICT:
+ - chave nova (ou vencida): a linha é nossa e o pedido é criado com o pedido_id reservado
+ - chave já usada: devolve o pedido original, sem criar nem notificar o restaurante de novo
+ - duas requisições com a mesma chave ao mesmo tempo: o INSERT da segunda espera o commit (ou rollback) da
+   primeira no próprio índice único e cai num dos casos acima; não tem trava nenhuma do lado da aplicação
+ - mesma chave com outro corpo: 422
+
+Chaves vencidas (IDEMPOTENCIA_TTL_HORAS, padrão 24) são reaproveitadas na hora e apagadas de tempos em
+tempos (IDEMPOTENCIA_LIMPEZA_SEGUNDOS, padrão 1h) por uma tarefa que o startup sobe em cada worker.
+"""
+import asyncio
+import hashlib
+from datetime import timedelta
+import os
+from typing import Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
+
+from . import models
+
+IDEMPOTENCIA_TTL_HORAS = float(os.getenv("IDEMPOTENCIA_TTL_HORAS", "24"))
+IDEMPOTENCIA_LIMPEZA_SEGUNDOS = float(os.getenv("IDEMPOTENCIA_LIMPEZA_SEGUNDOS", "3600"))
+CHAVE_MAX = 255
+
+_tarefa_limpeza: Optional[asyncio.Task] = None
+
+
+def _vencimento():
+    return func.now() - timedelta(hours=IDEMPOTENCIA_TTL_HORAS)
+
+def validar_chave(chave: str) -> str:
+    chave = chave.strip()
+    if not chave or len(chave) > CHAVE_MAX or not chave.isprintable():
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key precisa ter de 1 a {CHAVE_MAX} caracteres")
+    return chave
+
+def hash_requisicao(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+async def reservar(db: AsyncSession, usuario_id: UUID, chave: str, hash_corpo: str, pedido_id: UUID) -> Optional[UUID]:
+    """
+    Grava a chave apontando pro pedido_id que vai ser criado. Retorna None se a chave ficou com esta requisição
+    (segue criando o pedido na mesma transação) ou o pedido_id do pedido que já foi criado com ela.
+    """
+    Chave = models.ChaveIdempotencia
+    insert = pg_insert(Chave).values(usuario_id=usuario_id, chave=chave, pedido_id=pedido_id, hash_requisicao=hash_corpo)
+    reservada = (await db.execute(
+        insert.on_conflict_do_update(
+            index_elements=[Chave.usuario_id, Chave.chave],
+            set_={
+                "pedido_id": insert.excluded.pedido_id,
+                "hash_requisicao": insert.excluded.hash_requisicao,
+                "criado_em": func.now(),
+            },
+            where=Chave.criado_em < _vencimento(),  # vencida: vale como chave nova
+        ).returning(Chave.pedido_id)
+    )).scalar_one_or_none()
+    if reservada is not None:
+        return None
+
+    existente = (await db.execute(
+        sa.select(Chave.pedido_id, Chave.hash_requisicao).where(Chave.usuario_id == usuario_id, Chave.chave == chave)
+    )).one_or_none()
+    if existente is None:
+        # a limpeza apagou a chave vencida entre os dois comandos; o cliente pode repetir
+        raise HTTPException(status_code=409, detail="Idempotency-Key em uso, tente novamente")
+    if existente.hash_requisicao != hash_corpo:
+        raise HTTPException(status_code=422, detail="Idempotency-Key já usada com outro pedido")
+    return existente.pedido_id
+
+async def limpar_vencidas(db: AsyncSession) -> int:
+    resultado = await db.execute(sa.delete(models.ChaveIdempotencia).where(models.ChaveIdempotencia.criado_em < _vencimento()))
+    await db.commit()
+    return resultado.rowcount
+
+async def _limpeza_periodica():
+    from .database import AsyncSessionLocal
+
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await limpar_vencidas(db)
+        except Exception as e:  # banco fora do ar não pode matar a tarefa; tenta na próxima rodada
+            print(f"Erro ao limpar chaves de idempotência: {e!r}")
+        await asyncio.sleep(IDEMPOTENCIA_LIMPEZA_SEGUNDOS)
+
+def iniciar_limpeza():
+    global _tarefa_limpeza
+    if _tarefa_limpeza is None:
+        _tarefa_limpeza = asyncio.create_task(_limpeza_periodica())
+
+async def parar_limpeza():
+    global _tarefa_limpeza
+    if _tarefa_limpeza is not None:
+        _tarefa_limpeza.cancel()
+        await asyncio.gather(_tarefa_limpeza, return_exceptions=True)
+        _tarefa_limpeza = None
@@ -0,0 +1,273 @@
+# type: ignore
+"""
+Upload de imagens (foto do restaurante, foto de prato).
+
+O arquivo é copiado pro disco em blocos numa thread (nada de I/O síncrono no event loop), com limite de
+tamanho (IMAGEM_MAX_BYTES, 413 se passar) e o tipo decidido pelos primeiros bytes, não pela extensão nem
+pelo Content-Type que o navegador mandou (415 se não for JPEG, PNG, WebP ou GIF).
+O limite vale já na chegada: LimiteUpload recusa corpos multipart maiores que IMAGEM_MAX_BYTES + UPLOAD_FOLGA_BYTES
+pelo Content-Length, antes de ler o corpo, e conta os bytes recebidos quando ele não vem (chunked), então o
+Starlette nunca grava em disco um upload gigante antes do 413.
+Depois as variantes redimensionadas (thumb pros cards, media pro cardápio) são geradas em WebP num pool de
+threads próprio (IMAGEM_WORKERS).
+
+Os arquivos ficam em app/static/img com o sha256 do conteúdo no nome (<hash>.jpg, <hash>_thumb320.webp...):
+a mesma foto enviada pra vários pratos/restaurantes é gravada uma vez só, e uma URL nunca muda de conteúdo,
+então ArquivosImutaveis serve com Cache-Control immutable e o próprio hash como ETag.
+Trocar uma foto não apaga a antiga (outro prato pode usar o mesmo arquivo); quem limpa é o coletor:
+python -m app.imagens coletar [--simular]  (dentro de backend/, pode rodar num cron)
+Uploads antigos em app/static/uploads continuam servidos como antes.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, JSONResponse
+from starlette.staticfiles import NotModifiedResponse
+from PIL import Image, ImageOps
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+import sqlalchemy as sa
+
+from . import models
+
+IMAGENS_DIR = os.path.join("app", "static", "img")
+URL_IMAGENS = "/static/img"
+os.makedirs(IMAGENS_DIR, exist_ok=True)
+
+IMAGEM_MAX_BYTES = int(os.getenv("IMAGEM_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_FOLGA_BYTES = int(os.getenv("UPLOAD_FOLGA_BYTES", str(64 * 1024)))  # campos do formulário e delimitadores do multipart
+IMAGEM_WORKERS = int(os.getenv("IMAGEM_WORKERS", str(min(2, os.cpu_count() or 1))))
+VARIANTES = {"media": 640, "thumb": 320}  # lado maior em px; da maior pra menor (a menor sai da maior)
+QUALIDADE_WEBP = 80
+BLOCO = 256 * 1024
+CACHE_CONTROL_IMUTAVEL = "public, max-age=31536000, immutable"
+CARENCIA_COLETA = 3600  # segundos: o coletor não apaga arquivo mais novo que isso (upload cujo commit ainda não saiu)
+
+_NOME_ARQUIVO = re.compile(r"^([0-9a-f]{64})(?:_[a-z]+\d+)?\.[a-z]+$")
+
+Image.MAX_IMAGE_PIXELS = 40_000_000  # acima disso o Pillow recusa (bomba de descompressão)
+
+_imagens_pool = ThreadPoolExecutor(max_workers=IMAGEM_WORKERS, thread_name_prefix="imagens")
+
+# assinatura no começo do arquivo -> extensão salva
+_ASSINATURAS = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+def _detectar_extensao(inicio: bytes) -> Optional[str]:
+    if inicio[:4] == b"RIFF" and inicio[8:12] == b"WEBP":
+        return ".webp"
+    for assinatura, extensao in _ASSINATURAS:
+        if inicio.startswith(assinatura):
+            return extensao
+    return None
+
+def _remover_arquivos(caminhos: list[str]):
+    for caminho in caminhos:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+def _publicar(temporario: str, destino: str):
+    """Move o temporário pro nome final; se o conteúdo já existia fica o antigo, com mtime renovado pro coletor"""
+    if os.path.exists(destino):
+        os.remove(temporario)
+        os.utime(destino)
+    else:
+        os.replace(temporario, destino)  # atômico: ninguém vê arquivo pela metade
+
+def _copiar(origem) -> str:
+    """Copia o upload em blocos calculando o sha256; retorna o nome final (<hash>.<ext>)"""
+    origem.seek(0)
+    inicio = origem.read(BLOCO)
+    extensao = _detectar_extensao(inicio)
+    if extensao is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Envie uma imagem JPEG, PNG, WebP ou GIF")
+    temporario = os.path.join(IMAGENS_DIR, f".{uuid.uuid4().hex}.parcial")
+    sha = hashlib.sha256()
+    total = 0
+    try:
+        with open(temporario, "wb") as saida:
+            bloco = inicio
+            while bloco:
+                total += len(bloco)
+                if total > IMAGEM_MAX_BYTES:
+                    raise _muito_grande()
+                sha.update(bloco)
+                saida.write(bloco)
+                bloco = origem.read(BLOCO)
+        nome = sha.hexdigest() + extensao
+        _publicar(temporario, os.path.join(IMAGENS_DIR, nome))
+    except BaseException:
+        _remover_arquivos([temporario])
+        raise
+    return nome
+
+def _nomes_variantes(nome: str) -> dict[str, str]:
+    # o tamanho vai no nome: mudar VARIANTES gera URLs novas em vez de trocar o conteúdo de uma URL imutável
+    base = os.path.splitext(nome)[0]
+    return {variante: f"{base}_{variante}{lado}.webp" for variante, lado in VARIANTES.items()}
+
+def _gerar_variantes(nome: str) -> dict[str, str]:
+    """Abre o original uma vez e salva cada variante que ainda não existe em WebP; retorna {variante: nome do arquivo}"""
+    nomes = _nomes_variantes(nome)
+    if all(os.path.exists(os.path.join(IMAGENS_DIR, n)) for n in nomes.values()):
+        for n in nomes.values():
+            os.utime(os.path.join(IMAGENS_DIR, n))
+        return nomes  # mesma imagem já enviada antes
+    temporario = None
+    try:
+        with Image.open(os.path.join(IMAGENS_DIR, nome)) as original:
+            maior = max(VARIANTES.values())
+            original.draft("RGB", (maior, maior))  # JPEG: decodifica já reduzido (bem mais rápido em foto de celular)
+            imagem = ImageOps.exif_transpose(original)
+            imagem = imagem.convert("RGBA" if imagem.mode in ("RGBA", "LA", "P") else "RGB")
+            for variante, lado in VARIANTES.items():
+                imagem.thumbnail((lado, lado))  # só reduz, mantém a proporção
+                temporario = os.path.join(IMAGENS_DIR, f".{uuid.uuid4().hex}.parcial")
+                imagem.save(temporario, "WEBP", quality=QUALIDADE_WEBP)
+                _publicar(temporario, os.path.join(IMAGENS_DIR, nomes[variante]))
+                temporario = None
+    except (OSError, Image.DecompressionBombError, ValueError):
+        # conteúdo que não decodifica nunca chega a ser referenciado: dá pra apagar o original na hora
+        _remover_arquivos([os.path.join(IMAGENS_DIR, nome), *([temporario] if temporario else [])])
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Não foi possível ler a imagem")
+    return nomes
+
+def _muito_grande() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Imagem maior que {IMAGEM_MAX_BYTES // (1024 * 1024)} MB",
+    )
+
+
+class LimiteUpload:
+    """
+    Middleware ASGI que limita o corpo das requisições multipart (os únicos formulários com arquivo são os de imagem).
+    Content-Length acima do limite: 413 sem ler o corpo. Sem Content-Length: o receive conta os bytes e corta no limite.
+    """
+
+    def __init__(self, app, max_bytes: Optional[int] = None):
+        self.app = app
+        self.max_bytes = IMAGEM_MAX_BYTES + UPLOAD_FOLGA_BYTES if max_bytes is None else max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").lower().startswith("multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        tamanho = headers.get("content-length", "")
+        if tamanho.isdigit() and int(tamanho) > self.max_bytes:
+            erro = _muito_grande()
+            # Connection: close: o servidor não precisa ler (e descartar) o resto do corpo
+            resposta = JSONResponse({"detail": erro.detail}, status_code=erro.status_code, headers={"Connection": "close"})
+            return await resposta(scope, receive, send)
+
+        recebidos = 0
+
+        async def receive_limitado():
+            nonlocal recebidos
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebidos += len(mensagem.get("body", b""))
+                if recebidos > self.max_bytes:
+                    raise _muito_grande()  # o FastAPI repassa HTTPException levantada na leitura do corpo
+            return mensagem
+
+        await self.app(scope, receive_limitado, send)
+
+
+async def salvar_imagem(arquivo: UploadFile) -> tuple[str, dict[str, str]]:
+    """Salva o upload e as variantes; retorna (url do original, {variante: url})"""
+    if arquivo.size is not None and arquivo.size > IMAGEM_MAX_BYTES:
+        raise _muito_grande()
+    # o nome sai do conteúdo: o nome que o cliente mandou não vai pro disco
+    nome = await run_in_threadpool(_copiar, arquivo.file)
+    variantes = await asyncio.get_running_loop().run_in_executor(_imagens_pool, _gerar_variantes, nome)
+    return f"{URL_IMAGENS}/{nome}", {variante: f"{URL_IMAGENS}/{n}" for variante, n in variantes.items()}
+
+
+class ArquivosImutaveis(StaticFiles):
+    """StaticFiles de app/static/img: cache de um ano e ETag forte (o hash do conteúdo, que já está no nome)"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        # o FileResponse faria o etag de mtime+tamanho, que muda se o arquivo for regravado; aqui o nome já é o conteúdo
+        headers = {"cache-control": CACHE_CONTROL_IMUTAVEL, "etag": f'"{os.path.splitext(os.path.basename(full_path))[0]}"'}
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def _hashes_referenciados(urls) -> set[str]:
+    hashes = set()
+    for url in urls:
+        if url and url.startswith(URL_IMAGENS + "/"):
+            encontrado = _NOME_ARQUIVO.match(os.path.basename(url))
+            if encontrado:
+                hashes.add(encontrado.group(1))
+    return hashes
+
+def _apagar_orfaos(referenciados: set[str], simular: bool) -> tuple[list[str], int]:
+    """(arquivos apagados, bytes liberados); pula arquivos dentro da carência"""
+    limite = time.time() - CARENCIA_COLETA
+    apagados, liberados = [], 0
+    for entrada in os.scandir(IMAGENS_DIR):
+        if not entrada.is_file():
+            continue
+        encontrado = _NOME_ARQUIVO.match(entrada.name)
+        if encontrado and encontrado.group(1) in referenciados:
+            continue
+        estado = entrada.stat()
+        if estado.st_mtime > limite:
+            continue  # upload recente (ou temporário de um upload em andamento)
+        if not simular:
+            _remover_arquivos([entrada.path])
+        apagados.append(entrada.name)
+        liberados += estado.st_size
+    return apagados, liberados
+
+async def coletar_orfaos(db: AsyncSession, simular: bool = False) -> tuple[list[str], int]:
+    """Apaga de app/static/img o que nenhum Prato.imagem_url nem Restaurante.foto_perfil usa mais"""
+    urls = (await db.execute(
+        sa.select(models.Prato.imagem_url).where(models.Prato.imagem_url.like(URL_IMAGENS + "/%"))
+        .union_all(sa.select(models.Restaurante.foto_perfil).where(models.Restaurante.foto_perfil.like(URL_IMAGENS + "/%")))
+    )).scalars()
+    return await run_in_threadpool(_apagar_orfaos, _hashes_referenciados(urls), simular)
+
+async def _main(args):
+    from .database import AsyncSessionLocal, engine
+
+    engine.echo = False
+    try:
+        async with AsyncSessionLocal() as db:
+            apagados, liberados = await coletar_orfaos(db, args.simular)
+        for nome in apagados:
+            print(nome)
+        print(f"{len(apagados)} arquivo(s) {'seriam apagados' if args.simular else 'apagado(s)'}, "
+              f"{liberados / (1024 * 1024):.1f} MB")
+        return 0
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção das imagens enviadas")
+    parser.add_argument("comando", choices=["coletar"])
+    parser.add_argument("--simular", action="store_true", help="só lista o que seria apagado")
+    raise SystemExit(asyncio.run(_main(parser.parse_args())))
@@ -0,0 +1,152 @@
+# type: ignore
+"""
+Leitura da importação de cardápio (PUT /restaurantes/me/menu/importar) direto do corpo da requisição,
+conforme chega: cada linha vira um PratoLoteItem, e o crud grava em blocos enquanto o resto ainda está
+sendo recebido, sem juntar o arquivo inteiro na memória.
+
+Formatos (pelo Content-Type):
+ - text/csv: cabeçalho com nome, preco e opcionalmente descricao, restricoes (separadas por ; ou |),
+   imagem_url, disponivel (sim/não, true/false, 1/0) e prato_id
+ - application/x-ndjson: um objeto JSON por linha, com os campos de PratoLoteItem
+ - application/json: uma lista de objetos; esse não dá pra ler aos pedaços, então tem limite de tamanho
+
+Linha inválida derruba a importação inteira com 422 dizendo qual linha foi.
+Configuração: IMPORTACAO_MAX_LINHAS (padrão 20000), IMPORTACAO_JSON_MAX_BYTES (padrão 10 MB).
+"""
+import codecs
+import csv
+import json
+import os
+import re
+
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+
+from .schemas import PratoLoteItem
+
+IMPORTACAO_MAX_LINHAS = int(os.getenv("IMPORTACAO_MAX_LINHAS", "20000"))
+IMPORTACAO_JSON_MAX_BYTES = int(os.getenv("IMPORTACAO_JSON_MAX_BYTES", str(10 * 1024 * 1024)))
+
+FORMATOS = ("text/csv", "application/x-ndjson", "application/json")
+_VERDADEIRO = {"1", "true", "sim", "s", "yes", "y"}
+_FALSO = {"0", "false", "nao", "não", "n", "no"}
+
+
+def _erro(linha: int, detalhe) -> HTTPException:
+    return HTTPException(status_code=422, detail={"linha": linha, "erro": detalhe})
+
+def _item(linha: int, dados) -> PratoLoteItem:
+    if linha > IMPORTACAO_MAX_LINHAS:
+        raise _erro(linha, f"Importação com mais de {IMPORTACAO_MAX_LINHAS} pratos")
+    if not isinstance(dados, dict):
+        raise _erro(linha, "Esperado um objeto com os campos do prato")
+    try:
+        return PratoLoteItem.model_validate(dados)
+    except ValidationError as e:
+        raise _erro(linha, e.errors(include_url=False, include_context=False))
+
+def _linha_csv(campos: dict) -> dict:
+    """Registro do CSV (tudo texto, por nome de coluna) -> campos de PratoLoteItem; célula vazia conta como ausente"""
+    dados = {chave.strip().lower(): valor.strip() for chave, valor in campos.items() if chave and valor and valor.strip()}
+    if "restricoes" in dados:
+        dados["restricoes"] = [r for r in re.split(r"[;|]", dados["restricoes"]) if r.strip()]
+    if "disponivel" in dados:
+        valor = dados["disponivel"].lower()
+        if valor not in _VERDADEIRO | _FALSO:
+            raise ValueError(f"disponivel inválido: {dados['disponivel']}")
+        dados["disponivel"] = valor in _VERDADEIRO
+    if "preco" in dados:
+        dados["preco"] = dados["preco"].replace(",", ".")  # 12,50 de planilha brasileira
+    return dados
+
+async def _linhas_texto(request: Request):
+    """Linhas do corpo decodificadas em UTF-8 (com ou sem BOM) conforme os pedaços chegam"""
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    resto = ""
+    try:
+        async for pedaco in request.stream():
+            resto += decodificador.decode(pedaco)
+            *linhas, resto = resto.split("\n")
+            for linha in linhas:
+                yield linha + "\n"
+        resto += decodificador.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Arquivo precisa estar em UTF-8")
+    if resto:
+        yield resto
+
+async def _ler_csv(request: Request):
+    colunas = None
+    pendentes: list[str] = []
+    numero = 0
+    async for texto in _linhas_texto(request):
+        pendentes.append(texto)
+        # aspas em número ímpar: um campo entre aspas tem quebra de linha e o registro continua na próxima
+        if sum(linha.count('"') for linha in pendentes) % 2:
+            continue
+        try:
+            registros = list(csv.reader(pendentes))
+        except csv.Error as e:
+            raise _erro(numero + 1, str(e))
+        pendentes.clear()
+        for registro in registros:
+            if not any(celula.strip() for celula in registro):
+                continue
+            if colunas is None:
+                colunas = [coluna.strip().lower() for coluna in registro]
+                faltando = {"nome", "preco"} - set(colunas)
+                if faltando:
+                    raise _erro(0, f"Cabeçalho sem as colunas: {', '.join(sorted(faltando))}")
+                continue
+            numero += 1
+            try:
+                dados = _linha_csv(dict(zip(colunas, registro)))
+            except ValueError as e:
+                raise _erro(numero, str(e))
+            yield _item(numero, dados)
+    if pendentes:
+        raise _erro(numero + 1, "Aspas não fechadas no fim do arquivo")
+
+async def _ler_ndjson(request: Request):
+    numero = 0
+    async for texto in _linhas_texto(request):
+        if not texto.strip():
+            continue
+        numero += 1
+        try:
+            dados = json.loads(texto)
+        except ValueError:
+            raise _erro(numero, "JSON inválido")
+        yield _item(numero, dados)
+
+async def _ler_json(request: Request):
+    corpo = bytearray()
+    async for pedaco in request.stream():
+        corpo += pedaco
+        if len(corpo) > IMPORTACAO_JSON_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="JSON grande demais; use text/csv ou application/x-ndjson, que são lidos aos pedaços",
+            )
+    try:
+        lista = json.loads(corpo)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    if not isinstance(lista, list):
+        raise HTTPException(status_code=422, detail="Esperada uma lista de pratos")
+    for numero, dados in enumerate(lista, start=1):
+        yield _item(numero, dados)
+
+def ler_importacao(request: Request):
+    """Iterável assíncrono de PratoLoteItem lido do corpo; 415 se o Content-Type não for um dos FORMATOS"""
+    formato = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if formato == "text/csv":
+        return _ler_csv(request)
+    if formato == "application/x-ndjson":
+        return _ler_ndjson(request)
+    if formato == "application/json":
+        return _ler_json(request)
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail=f"Content-Type precisa ser um de: {', '.join(FORMATOS)}",
+    )
@@ -1,12 +1,17 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, WebSocket, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from .routes import restaurantes, pedidos, usuarios, uploads, avaliacoes, cep
-from .database import Base, engine
-from .websocket_manager import manager
+from .routes import restaurantes, pedidos, usuarios, uploads, avaliacoes, cep, metricas
+from .database import Base, engine, AsyncSessionLocal
+from .websocket_manager import manager, canal_restaurante, canal_usuario, PONG
+from .imagens import ArquivosImutaveis, IMAGENS_DIR, URL_IMAGENS, LimiteUpload
+from .auth import obter_usuario_atual
 from .auth_restaurante import get_current_restaurante
-from . import models
-import asyncio
+from . import models, crud, estatisticas
+from . import cep as servico_cep
+from . import idempotencia
+import json
+import time
 
 app = FastAPI(title="TreeLivery API")
 
@@ -17,12 +22,17 @@ origins = [
     "http://127.0.0.1:5173",
 ]
 
+# uploads maiores que IMAGEM_MAX_BYTES levam 413 antes do corpo ser gravado num arquivo temporário
+# (adicionado antes do CORS, fica por dentro dele: o 413 também sai com os headers de CORS)
+app.add_middleware(LimiteUpload)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins, #permite todas as origens listadas
     allow_credentials=True,
     allow_methods=["*"], #permite todos os métodos (GET, POST, etc) HTTP
     allow_headers=["*"],
+    expose_headers=["X-Proximo-Cursor", "Idempotent-Replayed"],  # cursor das listagens; pedido repetido com a mesma Idempotency-Key
 )
 # ----------------------------
 
@@ -32,65 +42,127 @@ app.include_router(usuarios.router)     #inclui as rotas de usuários
 app.include_router(uploads.router)     #inclui as rotas de uploads
 app.include_router(avaliacoes.router)  #inclui as rotas de avaliações
 app.include_router(cep.router)         #inclui as rotas de CEP
+app.include_router(metricas.router)    #inclui as rotas de métricas
 
+app.mount(URL_IMAGENS, ArquivosImutaveis(directory=IMAGENS_DIR), name="imagens")  # antes de /static: a primeira montagem que casa atende
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# WebSocket endpoint para notificações em tempo real
-@app.websocket("/ws/restaurante/{restaurante_id}")
-async def websocket_endpoint(websocket: WebSocket, restaurante_id: str):
-    """Endpoint WebSocket para notificações do restaurante"""
-    await manager.connect(websocket, restaurante_id)
-    
+async def _manter_websocket(websocket: WebSocket, conexao):
+    """
+    Lê o socket até o cliente desconectar (ou responder o close que o servidor mandou: heartbeat, fila cheia).
+    Decide pelo tipo da mensagem ASGI, sem olhar texto de exceção. Qualquer mensagem conta como sinal de vida
+    pro heartbeat (que roda no manager); ping do cliente ainda recebe pong.
+    """
     try:
         while True:
-            try:
-                # Aguarda mensagens do cliente (pode ser ping ou outras mensagens)
-                # Usa timeout para não bloquear indefinidamente
-                message = await asyncio.wait_for(websocket.receive(), timeout=60.0)
-                
-                # Processa mensagens de texto se necessário
-                if "text" in message:
-                    try:
-                        data = message["text"]
-                        # Se for um ping, responde com pong
-                        if data == '{"type":"ping"}':
-                            await websocket.send_text('{"type":"pong"}')
-                    except Exception:
-                        pass
-                        
-            except asyncio.TimeoutError:
-                # Timeout é normal - cliente não enviou mensagem
-                # Continua o loop para manter a conexão aberta
-                continue
-                
-            except (WebSocketDisconnect, RuntimeError, ConnectionError) as e:
-                # Cliente desconectou ou erro de conexão
-                # Verifica se é erro de desconexão
-                error_str = str(e).lower()
-                if "disconnect" in error_str or "closed" in error_str or "connection" in error_str:
-                    # Desconexão normal, apenas sai
-                    break
-                # Outros erros de runtime/connection
-                raise
-                
-    except WebSocketDisconnect:
-        # Conexão fechada normalmente pelo cliente
-        pass
-    except Exception as e:
-        # Outros erros - verifica se é relacionado a desconexão
-        error_str = str(e).lower()
-        if "disconnect" not in error_str and "closed" not in error_str:
-            # Apenas loga erros que não são de desconexão
-            print(f"Erro no WebSocket: {type(e).__name__}: {e}")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            conexao.ultima_atividade = time.monotonic()
+            texto = message.get("text")
+            if texto and '"ping"' in texto:
+                try:
+                    if json.loads(texto).get("type") == "ping":
+                        conexao.enviar(PONG)
+                except (ValueError, AttributeError):
+                    pass  # mensagem que não é JSON de objeto: ignora
     finally:
-        # Sempre desconecta ao sair
+        manager.disconnect(conexao)
+
+async def _autenticar_websocket(websocket: WebSocket, obter_principal, token: str):
+    """Principal dono do token ou None (nesse caso o handshake já foi recusado com 1008)"""
+    async with AsyncSessionLocal() as db:
         try:
-            manager.disconnect(websocket, restaurante_id)
-        except Exception:
-            pass  # Ignora erros ao desconectar
+            return await obter_principal(token, db)
+        except HTTPException:
+            await websocket.close(code=1008)  # antes do accept: o handshake é recusado
+            return None
+
+# WebSocket endpoint para notificações em tempo real
+@app.websocket("/ws/restaurante/{restaurante_id}")
+async def websocket_endpoint(websocket: WebSocket, restaurante_id: str, token: str = "", ultimo_seq: int | None = None, epoca: str | None = None):
+    """
+    Endpoint WebSocket para notificações do restaurante; exige o token do próprio restaurante na query string
+    (ultimo_seq/epoca na reconexão pra receber o que perdeu)
+    """
+    restaurante = await _autenticar_websocket(websocket, get_current_restaurante, token)
+    if restaurante is None:
+        return
+    if str(restaurante.restaurante_id) != restaurante_id:
+        await websocket.close(code=1008)
+        return
+    conexao = await manager.connect(websocket, canal_restaurante(restaurante_id), ultimo_seq, epoca)
+    await _manter_websocket(websocket, conexao)
+
+@app.websocket("/ws/usuario")
+async def websocket_usuario(websocket: WebSocket, token: str = "", ultimo_seq: int | None = None, epoca: str | None = None):
+    """Canal do cliente logado (token JWT na query string): mudanças de status dos pedidos dele"""
+    usuario = await _autenticar_websocket(websocket, obter_usuario_atual, token)
+    if usuario is None:
+        return
+    conexao = await manager.connect(websocket, canal_usuario(usuario.usuario_id), ultimo_seq, epoca)
+    await _manter_websocket(websocket, conexao)
+
+# O create_all só cria tabelas novas; colunas adicionadas em tabelas que já existem
+# entram aqui como comandos idempotentes (os índices são criados em criar_indices_faltantes)
+AJUSTES_SCHEMA = [
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS total_avaliacoes INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS soma_avaliacoes INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE pratos ADD COLUMN IF NOT EXISTS restricoes_normalizadas VARCHAR[]",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMPTZ DEFAULT now()",
+    "CREATE SEQUENCE IF NOT EXISTS ws_eventos_seq",  # seq dos eventos de WebSocket (BackendPostgres)
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS foto_perfil_variantes JSONB",
+    "ALTER TABLE pratos ADD COLUMN IF NOT EXISTS imagem_variantes JSONB",
+    "ALTER TABLE pratos ADD COLUMN IF NOT EXISTS arquivado_em TIMESTAMPTZ",
+    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS em_preparo_em TIMESTAMPTZ",
+    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS saiu_para_entrega_em TIMESTAMPTZ",
+    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS entregue_em TIMESTAMPTZ",
+    "ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS cancelado_em TIMESTAMPTZ",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS tempo_preparo_p50 INTEGER",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS tempo_preparo_p90 INTEGER",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS tempo_entrega_p50 INTEGER",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS tempo_entrega_p90 INTEGER",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS eta_p50 INTEGER",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS eta_p90 INTEGER",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS versao_tempos INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE restaurantes ADD COLUMN IF NOT EXISTS tempos_atualizados_em TIMESTAMPTZ",
+    # preenche os contadores de restaurantes que já tinham avaliações antes das colunas existirem
+    """
+    UPDATE restaurantes r
+    SET total_avaliacoes = a.total, soma_avaliacoes = a.soma
+    FROM (SELECT restaurante_id, COUNT(*) AS total, SUM(nota) AS soma FROM avaliacoes GROUP BY restaurante_id) a
+    WHERE r.restaurante_id = a.restaurante_id AND r.total_avaliacoes = 0
+    """,
+]
+
+def criar_indices_faltantes(conn):
+    """Cria os índices declarados nos models que ainda não existem em tabelas antigas"""
+    for tabela in Base.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            indice.create(conn, checkfirst=True)
 
 # Cria tabelas no startup do app
 @app.on_event("startup")
 async def startup():
     async with engine.begin() as conn:
+        await conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")  # índice trigram da busca de restaurantes
         await conn.run_sync(Base.metadata.create_all)
+        for comando in AJUSTES_SCHEMA:
+            await conn.exec_driver_sql(comando)
+        await conn.run_sync(criar_indices_faltantes)
+    async with AsyncSessionLocal() as db:
+        await crud.preencher_restricoes_normalizadas(db)
+        await estatisticas.reconstruir_se_vazio(db)  # agregações de pedidos feitos antes das tabelas existirem
+    await manager.iniciar()  # pub/sub dos WebSockets (LISTEN no Postgres quando WS_PUBSUB=postgres)
+    await servico_cep.carregar_dataset()  # CEP_DATASET, se configurado
+    idempotencia.iniciar_limpeza()  # apaga as Idempotency-Key vencidas de tempos em tempos
+    estatisticas.iniciar_recalculo()  # p50/p90 dos tempos fora das requests
+
+@app.on_event("shutdown")
+async def shutdown():
+    await manager.parar()
+    await servico_cep.fechar_cliente()
+    await idempotencia.parar_limpeza()
+    await estatisticas.parar_recalculo()
@@ -15,6 +15,8 @@ class Restaurante(Base):
     descricao = sa.Column(sa.Text)
     telefone = sa.Column(sa.String(20))
     avaliacao_media = sa.Column(sa.Numeric(3,2), default=0.0)
+    total_avaliacoes = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")  # contador incremental
+    soma_avaliacoes = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")   # soma das notas, pra média O(1)
     tempo_medio_entrega = sa.Column(sa.Integer)
     taxa_entrega_base = sa.Column(sa.Numeric(10,2), default=0)
     endereco = sa.Column(JSONB, nullable=False)
@@ -23,8 +25,44 @@ class Restaurante(Base):
     email = sa.Column(sa.String, unique=True, nullable=False)
     senha_hash = sa.Column(sa.String, nullable=False)
     foto_perfil = sa.Column(sa.String, nullable=True)
+    foto_perfil_variantes = sa.Column(JSONB, nullable=True)  # {"thumb": url, "media": url}, ver app/imagens.py
     criado_em = sa.Column(sa.DateTime, default=func.now())
-    
+    # versão do perfil/cardápio/avaliações, usada no ETag/Last-Modified das leituras (crud.incrementar_versao_restaurante)
+    versao = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+    atualizado_em = sa.Column(sa.TIMESTAMP(timezone=True), server_default=func.now())
+    # tempos observados em minutos (p50/p90 dos últimos TEMPO_JANELA_DIAS), mantidos por app/estatisticas.py;
+    # preparo: pedido -> saiu para entrega, entrega: saiu -> entregue, eta: pedido -> entregue
+    tempo_preparo_p50 = sa.Column(sa.Integer, nullable=True)
+    tempo_preparo_p90 = sa.Column(sa.Integer, nullable=True)
+    tempo_entrega_p50 = sa.Column(sa.Integer, nullable=True)
+    tempo_entrega_p90 = sa.Column(sa.Integer, nullable=True)
+    eta_p50 = sa.Column(sa.Integer, nullable=True)
+    eta_p90 = sa.Column(sa.Integer, nullable=True)
+    # versão só dos tempos acima: entra no ETag do /restaurantes/{id}, mas não no do cardápio nem no das avaliações
+    versao_tempos = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+    tempos_atualizados_em = sa.Column(sa.TIMESTAMP(timezone=True), nullable=True)
+
+# expressões usadas na busca de restaurantes; os literais ficam inline (literal_column) pra que a
+# query gere exatamente a mesma expressão dos índices e o Postgres consiga usá-los
+TEXTO_BUSCA_RESTAURANTE = Restaurante.nome_fantasia.concat(sa.literal_column("' '")).concat(
+    func.coalesce(Restaurante.descricao, sa.literal_column("''"))
+)
+CIDADE_RESTAURANTE = func.lower(Restaurante.endereco.op("->>", return_type=sa.Text)(sa.literal_column("'cidade'")))
+ESTADO_RESTAURANTE = Restaurante.endereco.op("->>", return_type=sa.Text)(sa.literal_column("'estado'"))
+AVALIACAO_RESTAURANTE = func.coalesce(Restaurante.avaliacao_media, sa.literal_column("0"))
+# ETA observado; sem dados suficientes vale o tempo informado pelo restaurante, e sem nenhum dos dois vai pro fim
+SEM_ETA = 100000
+ETA_RESTAURANTE = func.coalesce(Restaurante.eta_p50, Restaurante.tempo_medio_entrega, sa.literal_column(str(SEM_ETA)))
+
+sa.Index(
+    "ix_restaurantes_busca_trgm", TEXTO_BUSCA_RESTAURANTE.label("texto_busca"),
+    postgresql_using="gin", postgresql_ops={"texto_busca": "gin_trgm_ops"},
+)
+sa.Index("ix_restaurantes_estado_cidade", ESTADO_RESTAURANTE, CIDADE_RESTAURANTE)
+sa.Index("ix_restaurantes_cidade", CIDADE_RESTAURANTE)  # busca só por cidade: o índice acima começa pelo estado
+sa.Index("ix_restaurantes_avaliacao", AVALIACAO_RESTAURANTE.desc(), Restaurante.restaurante_id.desc())
+sa.Index("ix_restaurantes_eta", ETA_RESTAURANTE, Restaurante.restaurante_id)
+
 
 class Prato(Base):
     __tablename__ = "pratos"
@@ -34,9 +72,19 @@ class Prato(Base):
     descricao = sa.Column(sa.Text)
     preco = sa.Column(sa.Numeric(10,2), nullable=False)
     restricoes = sa.Column(sa.ARRAY(sa.String), nullable=True)   
+    restricoes_normalizadas = sa.Column(ARRAY(sa.String), nullable=True)  # ver app/restricoes.py, usada nos filtros
     disponivel = sa.Column(sa.Boolean, default=True)
     imagem_url = sa.Column(sa.String, nullable=True)
+    imagem_variantes = sa.Column(JSONB, nullable=True)  # {"thumb": url, "media": url}, ver app/imagens.py
     created_at = sa.Column(sa.TIMESTAMP(timezone=True), server_default=func.now())
+    # prato "excluído": a linha fica pros itens de pedido e estatísticas continuarem apontando pra ele
+    arquivado_em = sa.Column(sa.TIMESTAMP(timezone=True), nullable=True)
+
+    __table_args__ = (
+        sa.Index("ix_pratos_restricoes_normalizadas", "restricoes_normalizadas", postgresql_using="gin"),
+        # cardápio público: só os pratos que aparecem (o get_menu filtra exatamente por isso)
+        sa.Index("ix_pratos_cardapio", "restaurante_id", postgresql_where=sa.text("disponivel AND arquivado_em IS NULL")),
+    )
 
 # relacionamento 1--n com itemPedido
 class Pedido(Base):
@@ -45,10 +93,50 @@ class Pedido(Base):
     usuario_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("usuarios.usuario_id"), nullable=True)             
     restaurante_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("restaurantes.restaurante_id"))
     data_pedido = sa.Column(sa.TIMESTAMP(timezone=True), server_default=func.now())
-    status = sa.Column(sa.String(30), default="Recebido")  # Pode ser: Recebido, Em preparo, Entregue
+    status = sa.Column(sa.String(30), default="Recebido")  # transições permitidas em crud.TRANSICOES_PEDIDO
+    versao = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")  # +1 a cada mudança de status
+    # quando o pedido entrou em cada status (o Recebido é o data_pedido), ver crud.HORARIO_STATUS
+    em_preparo_em = sa.Column(sa.TIMESTAMP(timezone=True), nullable=True)
+    saiu_para_entrega_em = sa.Column(sa.TIMESTAMP(timezone=True), nullable=True)
+    entregue_em = sa.Column(sa.TIMESTAMP(timezone=True), nullable=True)
+    cancelado_em = sa.Column(sa.TIMESTAMP(timezone=True), nullable=True)
     total = sa.Column(sa.Numeric(10, 2), nullable=False)
     itens = sa.orm.relationship("ItemPedido", back_populates="pedido", cascade="all, delete-orphan")
 
+# índices da paginação por cursor (data_pedido, pedido_id) das listagens de pedidos
+sa.Index("ix_pedidos_restaurante_data", Pedido.restaurante_id, Pedido.data_pedido.desc(), Pedido.pedido_id.desc())
+sa.Index("ix_pedidos_usuario_data", Pedido.usuario_id, Pedido.data_pedido.desc(), Pedido.pedido_id.desc())
+
+
+class HistoricoStatusPedido(Base):
+    """Uma linha por status que o pedido teve (a criação entra com status_anterior nulo)"""
+    __tablename__ = "historico_status_pedidos"
+    historico_id = sa.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    pedido_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("pedidos.pedido_id", ondelete="CASCADE"), nullable=False)
+    status_anterior = sa.Column(sa.String(30), nullable=True)
+    status = sa.Column(sa.String(30), nullable=False)
+    versao = sa.Column(sa.Integer, nullable=False)  # versao do pedido depois da mudança
+    alterado_em = sa.Column(sa.TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (sa.Index("ix_historico_status_pedido", "pedido_id", "versao"),)
+
+
+class ChaveIdempotencia(Base):
+    """Idempotency-Key do POST /pedidos/ (por usuário) -> pedido criado com ela; vale por IDEMPOTENCIA_TTL_HORAS"""
+    __tablename__ = "chaves_idempotencia"
+    usuario_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("usuarios.usuario_id", ondelete="CASCADE"), primary_key=True)
+    chave = sa.Column(sa.String(255), primary_key=True)
+    # a chave é gravada antes do pedido (é ela que segura a requisição repetida), a FK só é conferida no commit
+    pedido_id = sa.Column(
+        UUID(as_uuid=True),
+        sa.ForeignKey("pedidos.pedido_id", ondelete="CASCADE", deferrable=True, initially="DEFERRED"),
+        nullable=False,
+    )
+    hash_requisicao = sa.Column(sa.String(64), nullable=False)  # sha256 do corpo: mesma chave com outro carrinho é erro
+    criado_em = sa.Column(sa.TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (sa.Index("ix_chaves_idempotencia_criado_em", "criado_em"),)
+
 
 class ItemPedido(Base):
     __tablename__ = "itens_pedido"
@@ -87,3 +175,31 @@ class Avaliacao(Base):
     
     # Garantir que um usuário só pode avaliar um pedido uma vez
     __table_args__ = (sa.UniqueConstraint('pedido_id', 'usuario_id', name='uq_avaliacao_pedido_usuario'),)
+
+# tabelas de agregação diária usadas pelo dashboard (mantidas por app/estatisticas.py)
+class EstatisticaDiaria(Base):
+    __tablename__ = "estatisticas_diarias"
+
+    restaurante_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("restaurantes.restaurante_id", ondelete="CASCADE"), primary_key=True)
+    dia = sa.Column(sa.Date, primary_key=True)  # dia (UTC) do data_pedido
+    status = sa.Column(sa.String(30), primary_key=True)
+    quantidade = sa.Column(sa.Integer, nullable=False, default=0)  # pedidos que estão nesse status
+    receita = sa.Column(sa.Numeric(12, 2), nullable=False, default=0)  # soma do total desses pedidos
+
+class VendaDiariaPrato(Base):
+    __tablename__ = "vendas_diarias_pratos"
+
+    restaurante_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("restaurantes.restaurante_id", ondelete="CASCADE"), primary_key=True)
+    dia = sa.Column(sa.Date, primary_key=True)
+    prato_id = sa.Column(UUID(as_uuid=True), primary_key=True)
+    quantidade = sa.Column(sa.Integer, nullable=False, default=0)
+
+class TempoDiario(Base):
+    """Histograma diário (por minuto) da duração de cada etapa dos pedidos, base dos p50/p90 do restaurante"""
+    __tablename__ = "tempos_diarios"
+
+    restaurante_id = sa.Column(UUID(as_uuid=True), sa.ForeignKey("restaurantes.restaurante_id", ondelete="CASCADE"), primary_key=True)
+    dia = sa.Column(sa.Date, primary_key=True)  # dia (UTC) em que a etapa terminou
+    etapa = sa.Column(sa.String(10), primary_key=True)  # preparo, entrega ou total
+    minutos = sa.Column(sa.Integer, primary_key=True)
+    quantidade = sa.Column(sa.Integer, nullable=False, default=0)
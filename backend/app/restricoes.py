@@ -0,0 +1,44 @@
+"""
+Normalização das restrições alimentares (mesma regra do isPratoCompativel do Menu.jsx).
+
+As restrições são comparadas sem acento/maiúsculas e as variações conhecidas viram uma chave só
+(ex: "Glúten" -> "gluten", "nozes" -> "castanhas"), pra que o filtro no banco possa usar os
+operadores de array (&&, @>) direto no índice GIN de pratos.restricoes_normalizadas.
+"""
+import unicodedata
+from typing import Iterable, Optional
+
+# chave canônica -> variações aceitas
+RESTRICOES_CONHECIDAS = {
+    "gluten": ["glúten", "gluten"],
+    "lactose": ["lactose"],
+    "castanhas": ["castanhas", "nozes", "amendoim"],
+    "ovo": ["ovo", "ovos"],
+    "mariscos": ["mariscos", "frutos do mar", "peixe"],
+    "soja": ["soja"],
+    "acucar": ["açúcar", "acucar", "açucar"],
+}
+
+
+def _sem_acento(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFD", texto.lower().strip())
+    return "".join(c for c in decomposto if unicodedata.category(c) != "Mn")
+
+
+_CHAVE_POR_VARIACAO = {
+    _sem_acento(variacao): chave
+    for chave, variacoes in RESTRICOES_CONHECIDAS.items()
+    for variacao in [chave, *variacoes]
+}
+
+
+def normalizar_restricao(restricao: str) -> str:
+    texto = _sem_acento(restricao)
+    return _CHAVE_POR_VARIACAO.get(texto, texto)
+
+
+def normalizar_restricoes(restricoes: Optional[Iterable[str]]) -> list[str]:
+    """Lista normalizada e sem repetição (vazia quando não há restrições)"""
+    if not restricoes:
+        return []
+    return sorted({normalizar_restricao(r) for r in restricoes if r and r.strip()})
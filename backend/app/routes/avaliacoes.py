@@ -1,9 +1,10 @@
 # type: ignore
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from .. import crud, schemas, models
 from ..database import get_db
 from ..auth import obter_usuario_atual
+from ..cache import resposta_versionada
 from uuid import UUID
 
 router = APIRouter(prefix="/avaliacoes", tags=["avaliacoes"])
@@ -20,10 +21,17 @@ async def criar_avaliacao(
 @router.get("/restaurante/{restaurante_id}", response_model=list[schemas.AvaliacaoOut])
 async def listar_avaliacoes_restaurante(
     restaurante_id: UUID,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """Lista todas as avaliações de um restaurante"""
-    return await crud.get_avaliacoes_restaurante(db, restaurante_id)
+    versao = await crud.get_versao_restaurante(db, restaurante_id)
+    if versao is None:
+        return []
+    return await resposta_versionada(
+        request, (str(restaurante_id), "avaliacoes"), list[schemas.AvaliacaoOut],
+        lambda: crud.get_avaliacoes_restaurante(db, restaurante_id), versao
+    )
 
 @router.get("/pedido/{pedido_id}", response_model=schemas.AvaliacaoOut)
 async def get_avaliacao_pedido(
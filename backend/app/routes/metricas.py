@@ -0,0 +1,52 @@
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..cache import cache_leituras
+from .. import cep
+from ..auth import metricas_bcrypt
+from ..auth_cache import cache_principais
+from ..database import get_db, metricas_pool
+from ..websocket_manager import manager
+
+router = APIRouter(prefix="/metricas", tags=["metricas"])
+
+@router.get("/cache")
+async def metricas_cache():
+    """Contadores do cache de leituras (hits, misses, evictions...) pra dimensionar CACHE_MAX_ITENS/CACHE_TTL_SEGUNDOS"""
+    return cache_leituras.metricas()
+
+@router.get("/cache/auth")
+async def metricas_cache_auth():
+    """Contadores do cache do usuário/restaurante autenticado (AUTH_CACHE_MAX_ITENS/AUTH_CACHE_TTL_SEGUNDOS)"""
+    return cache_principais.metricas()
+
+@router.get("/cache/cep")
+async def metricas_cache_cep():
+    """Cache de CEPs: hits, chamadas ao ViaCEP, buscas agrupadas e tamanho do dataset local"""
+    return cep.metricas()
+
+@router.get("/bcrypt")
+async def metricas_senhas():
+    """Pool do bcrypt: custo configurado e quantos hashes estão rodando/esperando (BCRYPT_WORKERS/BCRYPT_MAX_PENDENTES)"""
+    return metricas_bcrypt()
+
+@router.get("/websocket")
+async def metricas_websocket():
+    """Conexões WebSocket deste worker e o que está parado nas filas de envio"""
+    return manager.metricas()
+
+@router.get("/banco")
+async def metricas_banco():
+    """Pool de conexões deste worker (em uso, overflow, espera por conexão) pra ajustar DB_POOL_SIZE/DB_MAX_OVERFLOW"""
+    return metricas_pool()
+
+@router.get("/banco/saude")
+async def saude_banco(db: AsyncSession = Depends(get_db)):
+    """Health probe: faz um SELECT 1 e devolve 503 se o banco não responder"""
+    inicio = time.perf_counter()
+    try:
+        await db.execute(text("SELECT 1"))
+    except Exception:
+        raise HTTPException(status_code=503, detail="Banco de dados indisponível")
+    return {"status": "ok", "latencia_ms": round((time.perf_counter() - inicio) * 1000, 3)}
@@ -1,26 +1,44 @@
 # type: ignore
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from .. import crud, schemas, models
+from .. import crud, schemas, models, idempotencia
 from ..database import get_db
 from ..auth import obter_usuario_atual
 from ..auth_restaurante import get_current_restaurante
 from ..websocket_manager import manager
-from uuid import UUID
+from uuid import UUID, uuid4
+from typing import Optional
 
 router = APIRouter(prefix="/pedidos", tags=["pedidos"]) #todas as rotas começam com pedidos
 
 @router.post("/", response_model=schemas.PedidoOut)
 async def criar_pedido(
     payload: schemas.PedidoCreate, 
+    background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db),
     usuario: models.Usuario = Depends(obter_usuario_atual)
 ):
-    """Cria um novo pedido associado ao usuário logado"""
-    pedido = await crud.create_pedido(db, payload, usuario.usuario_id)
+    """
+    Cria um novo pedido associado ao usuário logado. Com Idempotency-Key, repetir a requisição devolve o
+    pedido já criado (header Idempotent-Replayed: true) sem criar outro nem notificar o restaurante de novo.
+    """
+    pedido_id = None
+    if idempotency_key is not None:
+        pedido_id = uuid4()
+        original = await idempotencia.reservar(
+            db, usuario.usuario_id, idempotencia.validar_chave(idempotency_key),
+            idempotencia.hash_requisicao(payload), pedido_id,
+        )
+        if original is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return await crud.get_pedido(db, original)
+    pedido = await crud.create_pedido(db, payload, usuario.usuario_id, pedido_id)
     
-    # Notifica o restaurante via WebSocket
-    await manager.broadcast_to_restaurante(
+    # Notifica o restaurante via WebSocket depois de enviar a resposta (a request não espera a entrega)
+    background_tasks.add_task(
+        manager.broadcast_to_restaurante,
         str(payload.restaurante_id),
         {
             "type": "novo_pedido",
@@ -36,34 +54,80 @@ async def criar_pedido(
 @router.get("/restaurante/{restaurante_id}", response_model=list[schemas.PedidoOut])
 async def listar_pedidos_restaurante(
     restaurante_id: UUID, 
+    response: Response,
+    filtros: schemas.FiltroPedidos = Depends(),
     db: AsyncSession = Depends(get_db),
     restaurante: models.Restaurante = Depends(get_current_restaurante)
 ):
-    """Lista pedidos de um restaurante (apenas o próprio restaurante pode ver seus pedidos)"""
+    """Lista pedidos de um restaurante (apenas o próprio restaurante pode ver seus pedidos), paginado por cursor"""
     # Valida que o restaurante só vê seus próprios pedidos
     if restaurante.restaurante_id != restaurante_id:
         raise HTTPException(status_code=403, detail="Você só pode ver os pedidos do seu próprio restaurante")
-    return await crud.get_pedidos_restaurante(db, restaurante_id)
+    pedidos, proximo_cursor = await crud.get_pedidos_restaurante(db, restaurante_id, filtros)
+    if proximo_cursor:
+        response.headers["X-Proximo-Cursor"] = proximo_cursor
+    return pedidos
 
 @router.get("/usuario/me", response_model=list[schemas.PedidoOut])
 async def listar_pedidos_usuario(
+    response: Response,
+    filtros: schemas.FiltroPedidos = Depends(),
     db: AsyncSession = Depends(get_db),
     usuario: models.Usuario = Depends(obter_usuario_atual)
 ):
-    """Lista pedidos do usuário logado"""
-    return await crud.get_pedidos_usuario(db, usuario.usuario_id)
+    """Lista pedidos do usuário logado, paginado por cursor"""
+    pedidos, proximo_cursor = await crud.get_pedidos_usuario(db, usuario.usuario_id, filtros)
+    if proximo_cursor:
+        response.headers["X-Proximo-Cursor"] = proximo_cursor
+    return pedidos
+
+@router.get("/usuario/me/historico", response_model=list[schemas.PedidoHistoricoOut])
+async def historico_pedidos_usuario(
+    response: Response,
+    filtros: schemas.FiltroPedidos = Depends(),
+    db: AsyncSession = Depends(get_db),
+    usuario: models.Usuario = Depends(obter_usuario_atual)
+):
+    """Pedidos do usuário logado com restaurante e avaliação embutidos (a tela "Meus pedidos" numa request só)"""
+    pedidos, proximo_cursor = await crud.get_historico_usuario(db, usuario.usuario_id, filtros)
+    if proximo_cursor:
+        response.headers["X-Proximo-Cursor"] = proximo_cursor
+    return pedidos
 
 @router.put("/{pedido_id}/status")
 async def atualizar_status(
     pedido_id: UUID, 
     status: str, 
+    background_tasks: BackgroundTasks,
+    versao: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     restaurante: models.Restaurante = Depends(get_current_restaurante)
 ):
-    """Atualiza o status de um pedido (apenas o restaurante dono do pedido pode atualizar)"""
-    pedido = await crud.update_pedido_status(db, pedido_id, status, restaurante.restaurante_id)
+    """
+    Atualiza o status de um pedido (apenas o restaurante dono do pedido pode atualizar).
+    Só aceita as transições de crud.TRANSICOES_PEDIDO; com versao, falha (409) se o pedido mudou desde que foi lido.
+    """
+    pedido = await crud.update_pedido_status(db, pedido_id, status, restaurante.restaurante_id, versao)
 
     if not pedido:
         raise HTTPException(status_code=404, detail="Pedido não encontrado ou você não tem permissão para atualizá-lo")
 
-    return {"message": "Status atualizado com sucesso"}
+    # delta pro cliente (MeusPedidos) e pros outros dashboards do restaurante, sem segurar a resposta
+    evento = {"type": "status_pedido", "pedido_id": str(pedido.pedido_id), "restaurante_id": str(pedido.restaurante_id),
+              "status": pedido.status, "versao": pedido.versao}
+    background_tasks.add_task(manager.enviar_para_usuario, str(pedido.usuario_id), evento)
+    background_tasks.add_task(manager.broadcast_to_restaurante, str(pedido.restaurante_id), evento)
+
+    return {"message": "Status atualizado com sucesso", "status": pedido.status, "versao": pedido.versao}
+
+@router.get("/{pedido_id}/historico", response_model=list[schemas.HistoricoStatusOut])
+async def historico_status(
+    pedido_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    restaurante: models.Restaurante = Depends(get_current_restaurante)
+):
+    """Linha do tempo dos status do pedido (só o restaurante dono)"""
+    historico = await crud.get_historico_status(db, pedido_id, restaurante.restaurante_id)
+    if historico is None:
+        raise HTTPException(status_code=404, detail="Pedido não encontrado ou você não tem permissão para vê-lo")
+    return historico
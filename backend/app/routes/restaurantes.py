@@ -1,23 +1,23 @@
 # type: ignore
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from .. import crud, schemas, crud, models, auth_restaurante, database
+from ..cache import cache_leituras, obter_ou_carregar, resposta_versionada
+from ..auth_cache import invalidar_principal
+from ..restricoes import normalizar_restricoes
+from ..imagens import salvar_imagem
+from ..importacao_menu import ler_importacao
 from ..database import get_db
 from uuid import UUID
 from typing import Optional
 import sqlalchemy as sa
 from datetime import datetime
-import os
-import shutil
 
 
 router = APIRouter(prefix="/restaurantes", tags=["restaurantes"]) #todas as rotas começam com restaurantes
 #tags ajudam na organização da documentação automática (Swagger UI) 
 
-UPLOAD_DIR = os.path.join("app", "static", "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 # 🟢 Rota para pegar restaurante logado
 @router.get("/me", response_model=schemas.RestauranteOut)
 async def get_me(current_restaurante: models.Restaurante = Depends(auth_restaurante.get_current_restaurante)):
@@ -59,10 +59,51 @@ async def alterar_senha(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# 🟢 Cardápio do restaurante logado, com os pratos indisponíveis (o público só mostra os disponíveis)
+@router.get("/me/menu", response_model=list[schemas.PratoOut])
+async def meu_menu(
+    current_restaurante: models.Restaurante = Depends(auth_restaurante.get_current_restaurante),
+    db: AsyncSession = Depends(get_db)
+):
+    return await crud.get_menu_restaurante(db, current_restaurante.restaurante_id)
+
+# 🟢 Alterações em lote no cardápio do restaurante logado (uma transação só)
+@router.post("/me/menu/lote", response_model=schemas.MenuLoteResultado)
+async def menu_em_lote(
+    lote: schemas.MenuLote,
+    current_restaurante: models.Restaurante = Depends(auth_restaurante.get_current_restaurante),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cria/atualiza, remove e liga/desliga vários pratos de uma vez: ou entra tudo ou nada"""
+    return await crud.aplicar_lote_menu(db, current_restaurante.restaurante_id, lote)
+
+# 🟢 Substitui o cardápio inteiro por um CSV/NDJSON/JSON (lido enquanto chega)
+@router.put("/me/menu/importar", response_model=schemas.MenuLoteResultado)
+async def importar_menu(
+    request: Request,
+    current_restaurante: models.Restaurante = Depends(auth_restaurante.get_current_restaurante),
+    db: AsyncSession = Depends(get_db)
+):
+    """Formatos e colunas em app/importacao_menu.py; pratos que não vieram no arquivo saem do cardápio"""
+    return await crud.importar_menu(db, current_restaurante.restaurante_id, ler_importacao(request))
+
 @router.get("/", response_model=list[schemas.RestauranteOut]) 
 async def list_restaurantes(db: AsyncSession = Depends(get_db)):
-    rests = await crud.get_restaurants(db)
-    return rests
+    conteudo = await obter_ou_carregar((None, "lista"), list[schemas.RestauranteOut], lambda: crud.get_restaurants(db))
+    return Response(content=conteudo, media_type="application/json")
+
+# Busca com texto, cidade/estado, avaliação mínima e taxa máxima (DEVE VIR ANTES de /{restaurante_id})
+@router.get("/busca", response_model=list[schemas.RestauranteOut])
+async def buscar_restaurantes(
+    response: Response,
+    filtros: schemas.FiltroRestaurantes = Depends(),
+    db: AsyncSession = Depends(get_db)
+):
+    """Busca restaurantes ativos ordenados pela avaliação, paginada por cursor (header X-Proximo-Cursor)"""
+    restaurantes, proximo_cursor = await crud.buscar_restaurantes(db, filtros)
+    if proximo_cursor:
+        response.headers["X-Proximo-Cursor"] = proximo_cursor
+    return restaurantes
 
 #adicionar essa porra no crud depois #adicionei
 @router.post("/registro", response_model=schemas.RestauranteOut)
@@ -101,6 +142,9 @@ async def registrar_restaurante(
         tempo_entrega = int(tempo_medio_entrega) if tempo_medio_entrega and str(tempo_medio_entrega).strip() else None
         taxa = float(taxa_entrega_base) if taxa_entrega_base and str(taxa_entrega_base).strip() else None
         
+        # Foto primeiro (imagem inválida recusa o cadastro antes de criar o restaurante), já com as variantes
+        foto_url, foto_variantes = await salvar_imagem(foto_perfil) if foto_perfil else (None, None)
+
         # Cria o payload do restaurante
         payload = schemas.RestauranteCreate(
             nome_fantasia=nome_fantasia,
@@ -112,25 +156,15 @@ async def registrar_restaurante(
             tempo_medio_entrega=tempo_entrega,
             taxa_entrega_base=taxa,
             endereco=endereco,
-            foto_perfil=None
+            foto_perfil=foto_url,
+            foto_perfil_variantes=foto_variantes,
         )
         
-        # Cria o restaurante primeiro
+        # se o cadastro falhar a foto fica sem referência e o coletor (app/imagens.py) apaga
         rest = await crud.create_restaurant(db, payload)
-        
-        # Se houver foto, faz o upload
-        if foto_perfil:
-            filename = f"{rest.restaurante_id}_{foto_perfil.filename}"
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(foto_perfil.file, buffer)
-            
-            rest.foto_perfil = f"/static/uploads/{filename}"
-            await db.commit()
-            await db.refresh(rest)
-        
         return rest
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
@@ -138,30 +172,53 @@ async def registrar_restaurante(
 @router.post("/login", response_model=schemas.Token)
 async def login_restaurante(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     restaurante = await crud.get_restaurant_by_email(db, form_data.username)
-    if not restaurante or not auth_restaurante.verificar_senha(form_data.password, restaurante.senha_hash):
+    if not restaurante:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais inválidas")
-    access_token = auth_restaurante.criar_token({"sub": restaurante.email})
+    valida, novo_hash = await auth_restaurante.verificar_e_atualizar(form_data.password, restaurante.senha_hash)
+    if not valida:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais inválidas")
+    if novo_hash:  # BCRYPT_ROUNDS mudou: aproveita a senha em texto e regrava o hash
+        restaurante.senha_hash = novo_hash
+        await db.commit()
+        invalidar_principal(models.Restaurante, restaurante.restaurante_id)
+    access_token = auth_restaurante.criar_token({"sub": restaurante.email, "id": str(restaurante.restaurante_id)})
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Rota para estatísticas do restaurante (DEVE VIR ANTES de /{restaurante_id})
 @router.get("/estatisticas")
 async def get_estatisticas(
+    dias: int = Query(30, ge=1, le=365, description="Janela em dias usada na receita e na média de pedidos"),
     current_restaurante: models.Restaurante = Depends(auth_restaurante.get_current_restaurante),
     db: AsyncSession = Depends(get_db)
 ):
     """Retorna estatísticas do restaurante logado"""
-    return await crud.get_estatisticas_restaurante(db, current_restaurante.restaurante_id)
+    return await crud.get_estatisticas_restaurante(db, current_restaurante.restaurante_id, dias)
 
 @router.get("/{restaurante_id}", response_model=schemas.RestauranteOut)
-async def get_restaurante(restaurante_id: UUID, db: AsyncSession = Depends(get_db)):
-    rest = await crud.get_restaurant(db, restaurante_id) #busca no banco
-    if not rest: #verifica se existe
+async def get_restaurante(restaurante_id: UUID, request: Request, db: AsyncSession = Depends(get_db)):
+    versao = await crud.get_versao_perfil_restaurante(db, restaurante_id) #só a versão, pra responder 304 sem carregar nada
+    resposta = versao and await resposta_versionada( #busca no cache ou no banco
+        request, (str(restaurante_id), "restaurante"), schemas.RestauranteOut, lambda: crud.get_restaurant(db, restaurante_id), versao
+    )
+    if resposta is None: #verifica se existe
         raise HTTPException(status_code=404, detail="Restaurante não encontrado")
-    return rest #retorna, converte automaticamente para o schema RestauranteOut
+    return resposta #já vem serializado no formato de RestauranteOut
 
 @router.get("/{restaurante_id}/menu", response_model=list[schemas.PratoOut])
-async def menu(restaurante_id: UUID, db: AsyncSession = Depends(get_db)):
-    return await crud.get_menu(db, restaurante_id)
+async def menu(
+    restaurante_id: UUID,
+    request: Request,
+    excluir_restricoes: Optional[list[str]] = Query(None, description="Esconde pratos com qualquer uma dessas restrições"),
+    somente_sem_restricoes: bool = Query(False, description="Mostra só pratos sem nenhuma restrição"),
+    db: AsyncSession = Depends(get_db)
+):
+    versao = await crud.get_versao_restaurante(db, restaurante_id)
+    if versao is None:
+        return [] #restaurante não existe, cardápio vazio
+    chave = (str(restaurante_id), "menu", tuple(normalizar_restricoes(excluir_restricoes)), somente_sem_restricoes)
+    return await resposta_versionada(
+        request, chave, list[schemas.PratoOut], lambda: crud.get_menu(db, restaurante_id, excluir_restricoes, somente_sem_restricoes), versao
+    )
 
 @router.post("/{restaurante_id}/menu", response_model=schemas.PratoOut)
 async def criar_prato(restaurante_id: UUID, payload: schemas.PratoCreate, db: AsyncSession = Depends(get_db)):
@@ -192,27 +249,20 @@ async def atualizar_foto_perfil(
     db: AsyncSession = Depends(get_db)
 ):
     try:
-        # Remove foto antiga se existir
-        if current_restaurante.foto_perfil:
-            foto_antiga_path = os.path.join("app", current_restaurante.foto_perfil.lstrip("/"))
-            if os.path.exists(foto_antiga_path):
-                try:
-                    os.remove(foto_antiga_path)
-                except Exception:
-                    pass  # Ignora erro se não conseguir remover
-        
-        # Salva nova foto
-        filename = f"{current_restaurante.restaurante_id}_{foto_perfil.filename}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(foto_perfil.file, buffer)
-        
-        current_restaurante.foto_perfil = f"/static/uploads/{filename}"
+        # a foto anterior não é apagada aqui: o arquivo pode ser usado por outro cadastro, quem limpa é o coletor
+        foto_url, foto_variantes = await salvar_imagem(foto_perfil)
+
+        current_restaurante.foto_perfil = foto_url
+        current_restaurante.foto_perfil_variantes = foto_variantes
+        await crud.incrementar_versao_restaurante(db, current_restaurante.restaurante_id)
         await db.commit()
         await db.refresh(current_restaurante)
-        
+        cache_leituras.invalidar_restaurante(current_restaurante.restaurante_id)
+        invalidar_principal(models.Restaurante, current_restaurante.restaurante_id)
+
         return current_restaurante
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao atualizar foto: {str(e)}")
 
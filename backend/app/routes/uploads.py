@@ -1,34 +1,30 @@
 # type: ignore
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from .. import models, database
+from .. import crud, models, database
+from ..cache import cache_leituras
+from ..imagens import salvar_imagem
 from uuid import UUID
-import os
-import shutil
 
 router = APIRouter(prefix="/uploads", tags=["uploads"])
 
-UPLOAD_DIR = os.path.join("app", "static", "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 @router.post("/prato/{prato_id}")
 async def upload_imagem_prato(
     prato_id: UUID,
     file: UploadFile = File(...),
     db: AsyncSession = Depends(database.get_db)
 ):
-    prato = await db.get(models.Prato, prato_id)
+    prato = await crud.get_prato(db, prato_id)
     if not prato:
         raise HTTPException(status_code=404, detail="Prato não encontrado")
 
-    filename = f"{prato_id}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    imagem_url, variantes = await salvar_imagem(file)  # a imagem anterior fica pro coletor (pode ser de outro prato também)
 
-    prato.imagem_url = f"/static/uploads/{filename}"
+    prato.imagem_url = imagem_url
+    prato.imagem_variantes = variantes
+    await crud.incrementar_versao_restaurante(db, prato.restaurante_id)
     await db.commit()
     await db.refresh(prato)
+    cache_leituras.invalidar_restaurante(prato.restaurante_id)
 
-    return {"message": "Imagem salva com sucesso!", "imagem_url": prato.imagem_url}
+    return {"message": "Imagem salva com sucesso!", "imagem_url": prato.imagem_url, "imagem_variantes": prato.imagem_variantes}
@@ -1,11 +1,13 @@
 #type: ignore
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
 from .. import schemas, models, auth, crud
 from ..auth import obter_usuario_atual
+from ..auth_cache import invalidar_principal
 from ..database import get_db
 import sqlalchemy as sa
+from typing import Optional
 
 router = APIRouter(prefix="/usuarios", tags=["usuarios"])
 
@@ -16,10 +18,17 @@ async def criar_usuario(payload: schemas.UsuarioCreate, db: AsyncSession = Depen
 @router.post("/login", response_model=schemas.Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     usuario = await auth.obter_usuario_por_email(db, form_data.username)
-    if not usuario or not auth.verificar_senha(form_data.password, usuario.senha_hash):
+    if not usuario:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais inválidas")
+    valida, novo_hash = await auth.verificar_e_atualizar(form_data.password, usuario.senha_hash)
+    if not valida:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais inválidas")
+    if novo_hash:  # BCRYPT_ROUNDS mudou: aproveita a senha em texto e regrava o hash
+        usuario.senha_hash = novo_hash
+        await db.commit()
+        invalidar_principal(models.Usuario, usuario.usuario_id)
 
-    access_token = auth.criar_token({"sub": usuario.email})
+    access_token = auth.criar_token({"sub": usuario.email, "id": str(usuario.usuario_id)})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.UsuarioOut)
@@ -61,4 +70,18 @@ async def alterar_senha_usuario(
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/me/pratos-compativeis", response_model=list[schemas.PratoOut])
+async def listar_pratos_compativeis(
+    response: Response,
+    marcacoes: Optional[list[str]] = Query(None, description="Exige pratos marcados com todas essas restrições (ex: vegano)"),
+    filtros: schemas.FiltroPratosCompativeis = Depends(),
+    usuario: models.Usuario = Depends(obter_usuario_atual),
+    db: AsyncSession = Depends(get_db)
+):
+    """Pratos de todos os restaurantes compatíveis com as restrições do usuário logado, paginados por cursor"""
+    pratos, proximo_cursor = await crud.get_pratos_compativeis(db, usuario, filtros, marcacoes)
+    if proximo_cursor:
+        response.headers["X-Proximo-Cursor"] = proximo_cursor
+    return pratos
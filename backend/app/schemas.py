@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
-from pydantic import BaseModel, EmailStr, field_validator
-from typing import Optional, List, Any
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Optional, List, Any, Literal
 from uuid import UUID
 from decimal import Decimal
 import re
@@ -52,6 +52,7 @@ class RestauranteCreate(BaseModel):
     taxa_entrega_base: Optional[Decimal]
     endereco: Endereco
     foto_perfil: Optional[str] = None
+    foto_perfil_variantes: Optional[dict[str, str]] = None
 
 class RestauranteOut(BaseModel):
     restaurante_id: UUID
@@ -63,9 +64,18 @@ class RestauranteOut(BaseModel):
     tempo_medio_entrega: Optional[int]
     taxa_entrega_base: Optional[Decimal]
     avaliacao_media: Optional[Decimal] = 0.0
+    total_avaliacoes: int = 0
     ativo: bool
     endereco: Endereco
     foto_perfil: Optional[str] = None
+    foto_perfil_variantes: Optional[dict[str, str]] = None
+    # tempos observados em minutos (nulos até ter pedidos suficientes), ver app/estatisticas.py
+    tempo_preparo_p50: Optional[int] = None
+    tempo_preparo_p90: Optional[int] = None
+    tempo_entrega_p50: Optional[int] = None
+    tempo_entrega_p90: Optional[int] = None
+    eta_p50: Optional[int] = None
+    eta_p90: Optional[int] = None
     criado_em: datetime 
     
     class Config:
@@ -110,6 +120,17 @@ class RestauranteUpdate(BaseModel):
             raise ValueError('Taxa de entrega não pode ser negativa')
         return v
 
+class FiltroRestaurantes(BaseModel):
+    """Filtros e paginação por cursor da busca de restaurantes"""
+    q: Optional[str] = Field(None, min_length=3, description="Texto buscado no nome e na descrição")
+    cidade: Optional[str] = None
+    estado: Optional[str] = None
+    avaliacao_minima: Optional[Decimal] = Field(None, ge=0, le=5)
+    taxa_maxima: Optional[Decimal] = Field(None, ge=0)
+    ordenar: Literal["avaliacao", "eta"] = "avaliacao"  # eta: menor tempo de entrega observado primeiro
+    cursor: Optional[str] = None  # valor do header X-Proximo-Cursor da página anterior (da mesma ordenação)
+    limite: int = Field(20, ge=1, le=100)
+
 class RestauranteLogin(BaseModel):
     email: str
     senha: str
@@ -136,6 +157,35 @@ class PratoOut(PratoCreate):
     prato_id: UUID
     restaurante_id: UUID
     disponivel: bool
+    imagem_variantes: Optional[dict[str, str]] = None
+
+class PratoLoteItem(PratoCreate):
+    """Prato no lote/importação: com prato_id atualiza (se for do restaurante), sem cria"""
+    prato_id: Optional[UUID] = None
+    descricao: Optional[str] = None  # planilha com a coluna vazia
+    disponivel: bool = True
+
+class PratoDisponibilidade(BaseModel):
+    prato_id: UUID
+    disponivel: bool
+
+class MenuLote(BaseModel):
+    """Alterações no cardápio aplicadas numa transação só (tudo ou nada)"""
+    upserts: list[PratoLoteItem] = Field(default_factory=list, max_length=1000)
+    remover: list[UUID] = Field(default_factory=list, max_length=1000)
+    disponibilidade: list[PratoDisponibilidade] = Field(default_factory=list, max_length=1000)
+
+class MenuLoteResultado(BaseModel):
+    criados: int = 0
+    atualizados: int = 0
+    removidos: int = 0
+    disponibilidade_alterada: int = 0
+    pratos: list[PratoOut] = []  # os pratos criados/atualizados, já com prato_id
+
+class FiltroPratosCompativeis(BaseModel):
+    """Paginação dos pratos compatíveis com o usuário"""
+    cursor: Optional[str] = None
+    limite: int = Field(50, ge=1, le=100)
 
 class ItemPedidoCreate(BaseModel):
     prato_id: UUID
@@ -161,12 +211,59 @@ class PedidoOut(BaseModel):
     restaurante_id: UUID
     data_pedido: Any
     status: str
+    em_preparo_em: Optional[datetime] = None
+    saiu_para_entrega_em: Optional[datetime] = None
+    entregue_em: Optional[datetime] = None
+    cancelado_em: Optional[datetime] = None
+    versao: int = 0  # mandar de volta no PUT /pedidos/{id}/status pra não sobrescrever mudança de outro dispositivo
     total: Decimal
     itens: List[ItemPedidoOut]
     
     class Config:
         orm_mode = True
 
+class HistoricoStatusOut(BaseModel):
+    status_anterior: Optional[str]
+    status: str
+    versao: int
+    alterado_em: datetime
+
+    class Config:
+        orm_mode = True
+
+class RestauranteResumo(BaseModel):
+    """O que o histórico de pedidos mostra do restaurante"""
+    restaurante_id: UUID
+    nome_fantasia: str
+    foto_perfil: Optional[str] = None
+    foto_perfil_variantes: Optional[dict[str, str]] = None
+    avaliacao_media: Optional[Decimal] = 0.0
+
+    class Config:
+        from_attributes = True
+
+class AvaliacaoResumo(BaseModel):
+    nota: int
+    comentario: Optional[str]
+    criado_em: datetime
+
+    class Config:
+        from_attributes = True
+
+class PedidoHistoricoOut(PedidoOut):
+    """Pedido do histórico do cliente já com o restaurante e a avaliação (None = ainda não avaliado)"""
+    restaurante: Optional[RestauranteResumo] = None
+    avaliacao: Optional[AvaliacaoResumo] = None
+
+
+class FiltroPedidos(BaseModel):
+    """Filtros e paginação por cursor das listagens de pedidos"""
+    status: Optional[str] = None
+    desde: Optional[datetime] = None
+    ate: Optional[datetime] = None
+    cursor: Optional[str] = None  # valor do header X-Proximo-Cursor da página anterior
+    limite: int = Field(50, ge=1, le=100)
+
     
 class UsuarioBase(BaseModel):
     nome: str
@@ -1,54 +1,407 @@
 # type: ignore
-from typing import Dict, Set
-from fastapi import WebSocket
+"""
+Conexões WebSocket e distribuição das mensagens entre workers.
+
+Cada worker guarda só os sockets conectados nele; os broadcasts passam por um backend de pub/sub
+e cada worker entrega só pros seus sockets locais:
+ - memoria (padrão): entrega direto no próprio processo, serve quando há um worker só
+ - postgres: NOTIFY no canal treelivery_ws; todo worker faz LISTEN numa conexão dedicada, então cada
+   dashboard recebe a mensagem uma vez, não importa em qual worker o pedido foi criado
+
+Cada socket tem uma fila de saída própria, esvaziada por uma tarefa só dele: publicar uma mensagem só
+serializa uma vez e enfileira, então um tablet lento não atrasa os outros nem quem publicou. Se a fila
+enche, a conexão é fechada (o cliente reconecta e recarrega) ou, com WS_FILA_CHEIA=descartar, a mensagem
+mais antiga da fila é descartada.
+
+Canais: "restaurante:<id>" (dashboard do restaurante) e "usuario:<id>" (pedidos do cliente).
+
+Todo evento sai com um "seq" crescente (sequence ws_eventos_seq no Postgres, contador local no backend
+memoria), igual em todos os workers e sempre crescente dentro de um canal: no postgres o nextval e o NOTIFY
+rodam numa transação que segura um advisory lock do canal, então os NOTIFY de um canal saem na ordem do seq. Cada worker guarda os últimos WS_REPLAY_MAX eventos de cada
+restaurante; quem reconecta com ?ultimo_seq=N&epoca=E recebe só o que perdeu. Se o buffer não cobre o
+intervalo (ou o servidor reiniciou, no backend memoria) o cliente recebe {"type": "snapshot"} e recarrega a lista.
+
+Heartbeat: uma tarefa só (não um timer por socket) manda {"type": "ping"} a cada WS_HEARTBEAT_SEGUNDOS e fecha as
+conexões que não mandaram nada (pong ou qualquer outra mensagem) nos últimos WS_HEARTBEAT_TIMEOUT segundos.
+
+Configuração: WS_PUBSUB=memoria|postgres, WS_FILA_MAX (padrão 100), WS_FILA_CHEIA=fechar|descartar,
+WS_TIMEOUT_ENVIO (segundos, padrão 10; envio que demora mais que isso derruba a conexão), WS_REPLAY_MAX (padrão 50),
+WS_HEARTBEAT_SEGUNDOS (padrão 25) e WS_HEARTBEAT_TIMEOUT (padrão 60)
+"""
+from collections import deque
+import bisect
+from typing import Callable, Dict, Optional, Set
+from fastapi import WebSocket, WebSocketDisconnect
+import asyncio
+import itertools
 import json
+import os
+import time
+import uuid
+
+import asyncpg
+import sqlalchemy as sa
+
+WS_FILA_MAX = int(os.getenv("WS_FILA_MAX", "100"))
+WS_FILA_CHEIA = os.getenv("WS_FILA_CHEIA", "fechar").lower()
+WS_TIMEOUT_ENVIO = float(os.getenv("WS_TIMEOUT_ENVIO", "10"))
+WS_REPLAY_MAX = int(os.getenv("WS_REPLAY_MAX", "50"))
+WS_HEARTBEAT_SEGUNDOS = float(os.getenv("WS_HEARTBEAT_SEGUNDOS", "25"))
+WS_HEARTBEAT_TIMEOUT = float(os.getenv("WS_HEARTBEAT_TIMEOUT", "60"))
+
+PING = json.dumps({"type": "ping"})
+PONG = json.dumps({"type": "pong"})
+
+Entregar = Callable[[str, int, str], None]  # (canal, seq, mensagem já em JSON); só enfileira, não bloqueia
+
+
+class BackendMemoria:
+    """Pub/sub dentro do próprio processo"""
+
+    nome = "memoria"
 
-class ConnectionManager:
-    """Gerenciador de conexões WebSocket"""
-    
     def __init__(self):
-        # Dicionário: restaurante_id -> Set[WebSocket]
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, restaurante_id: str):
-        """Conecta um WebSocket para um restaurante"""
-        await websocket.accept()
-        if restaurante_id not in self.active_connections:
-            self.active_connections[restaurante_id] = set()
-        self.active_connections[restaurante_id].add(websocket)
-    
-    def disconnect(self, websocket: WebSocket, restaurante_id: str):
-        """Desconecta um WebSocket"""
-        if restaurante_id in self.active_connections:
-            self.active_connections[restaurante_id].discard(websocket)
-            if not self.active_connections[restaurante_id]:
-                del self.active_connections[restaurante_id]
-    
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        """Envia mensagem para um WebSocket específico"""
+        self.epoca = uuid.uuid4().hex[:12]  # o contador recomeça junto com o processo
+        self.cobertura = 0  # eventos com seq maior que isso passaram por este worker
+        self._seq = itertools.count(1)
+
+    async def iniciar(self, entregar: Entregar, historico_perdido: Callable[[], None]):
+        self._entregar = entregar
+
+    async def publicar(self, canal: str, texto: str):
+        self._entregar(canal, next(self._seq), texto)
+
+    async def parar(self):
+        pass
+
+
+class BackendPostgres:
+    """Pub/sub via LISTEN/NOTIFY no próprio banco da aplicação"""
+
+    nome = "postgres"
+    epoca = "pg"  # a sequence sobrevive a restart dos workers
+    CANAL_PG = "treelivery_ws"
+    SEQUENCIA = "ws_eventos_seq"  # criada no startup (AJUSTES_SCHEMA)
+    LIMITE_PAYLOAD = 7900  # o NOTIFY aceita até 8000 bytes de payload
+    ESPACO_LOCK = 7301  # primeira chave do advisory lock por canal (a segunda é hashtext do canal)
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self._conexao = None
+        self._tarefas: list[asyncio.Task] = []
+        self.cobertura = 0
+
+    async def iniciar(self, entregar: Entregar, historico_perdido: Callable[[], None]):
+        self._entregar = entregar
+        self._historico_perdido = historico_perdido
+        await self._conectar()
+        self._tarefas = [asyncio.create_task(self._vigiar())]
+
+    async def _conectar(self):
+        self._perdida = asyncio.Event()
+        self._conexao = await asyncpg.connect(self.dsn)
+        self._conexao.add_termination_listener(lambda _conexao: self._perdida.set())
+        await self._conexao.add_listener(self.CANAL_PG, self._ao_notificar)
+        # lido depois do LISTEN: todo evento com seq maior que esse vai chegar por aqui
+        ultimo, chamada = await self._conexao.fetchrow(f"SELECT last_value, is_called FROM {self.SEQUENCIA}")
+        self.cobertura = ultimo if chamada else ultimo - 1
+
+    async def _vigiar(self):
+        """Reabre o LISTEN se a conexão cair (o que for publicado nesse meio tempo se perde)"""
+        while True:
+            await self._perdida.wait()
+            print("Conexão do LISTEN caiu, reconectando...")
+            while True:
+                try:
+                    await self._conectar()
+                    self._historico_perdido()
+                    break
+                except (OSError, asyncpg.PostgresError) as e:
+                    print(f"Falha ao reconectar o LISTEN: {e}")
+                    await asyncio.sleep(1)
+
+    def _ao_notificar(self, _conexao, _pid, _canal_pg, payload: str):
+        # callback do asyncpg, na ordem dos NOTIFY; entregar só enfileira nas conexões
         try:
-            await websocket.send_text(json.dumps(message))
+            seq, _, resto = payload.partition("|")
+            dados = json.loads(resto)
+            self._entregar(dados["c"], int(seq), dados["m"])
         except Exception as e:
-            print(f"Erro ao enviar mensagem: {e}")
-    
+            print(f"Erro ao distribuir notificação: {type(e).__name__}: {e}")
+
+    async def publicar(self, canal: str, texto: str):
+        payload = json.dumps({"c": canal, "m": texto})
+        if len(payload.encode()) > self.LIMITE_PAYLOAD:
+            raise ValueError(f"Mensagem grande demais para o NOTIFY ({len(payload)} bytes)")
+        async with self.engine.begin() as conn:
+            # os NOTIFY chegam na ordem do commit, não do nextval: com o lock do canal até o commit, dois
+            # eventos do mesmo canal não se cruzam e o seq chega crescente em todo worker
+            await conn.execute(
+                sa.text("SELECT pg_advisory_xact_lock(:espaco, hashtext(:canal))"),
+                {"espaco": self.ESPACO_LOCK, "canal": canal},
+            )
+            # o seq é gerado no mesmo comando do NOTIFY: "seq|{json}"
+            await conn.execute(
+                sa.text(f"SELECT pg_notify(:canal_pg, nextval('{self.SEQUENCIA}')::text || '|' || :payload)"),
+                {"canal_pg": self.CANAL_PG, "payload": payload},
+            )
+
+    async def parar(self):
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+        self._tarefas = []
+        if self._conexao is not None and not self._conexao.is_closed():
+            await self._conexao.close()
+
+
+def criar_backend():
+    tipo = os.getenv("WS_PUBSUB", "memoria").lower()
+    if tipo == "postgres":
+        from .database import engine
+        return BackendPostgres(engine)
+    if tipo == "memoria":
+        return BackendMemoria()
+    raise ValueError(f"WS_PUBSUB inválido: {tipo} (use memoria ou postgres)")
+
+
+
+def canal_restaurante(restaurante_id) -> str:
+    return f"restaurante:{restaurante_id}"
+
+def canal_usuario(usuario_id) -> str:
+    return f"usuario:{usuario_id}"
+
+
+class Conexao:
+    """Um WebSocket com a sua fila de saída; só a tarefa da fila escreve no socket"""
+
+    def __init__(self, websocket: WebSocket, canal: str, ao_fechar: Callable[["Conexao"], None]):
+        self.websocket = websocket
+        self.canal = canal
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=WS_FILA_MAX)
+        self.descartadas = 0
+        self.fechada = False
+        self.ultima_atividade = time.monotonic()  # última mensagem recebida do cliente
+        self._ao_fechar = ao_fechar
+        self._tarefa = asyncio.create_task(self._esvaziar_fila())
+
+    def enviar(self, texto: str):
+        """Enfileira sem esperar; aplica a política de fila cheia"""
+        if self.fechada:
+            return
+        try:
+            self.fila.put_nowait(texto)
+        except asyncio.QueueFull:
+            if WS_FILA_CHEIA == "descartar":
+                self.fila.get_nowait()
+                self.fila.put_nowait(texto)
+                self.descartadas += 1
+            else:
+                print(f"Fila de envio cheia em {self.canal}, fechando a conexão")
+                self.fechar(1013, "Fila de envio cheia")
+
+    async def _esvaziar_fila(self):
+        try:
+            while True:
+                texto = await self.fila.get()
+                async with asyncio.timeout(WS_TIMEOUT_ENVIO):  # sem a tarefa extra que o wait_for cria a cada envio
+                    await self.websocket.send_text(texto)
+        except asyncio.CancelledError:
+            raise
+        except WebSocketDisconnect:
+            self.fechar()  # o cliente foi embora no meio do envio: limpeza normal, sem log
+        except Exception as e:
+            print(f"Erro ao enviar para {self.canal}: {type(e).__name__}: {e}")
+            self.fechar(1011, "Falha no envio")
+
+    def fechar(self, codigo: int = 1000, motivo: str = ""):
+        """Tira a conexão do gerenciador e fecha o socket em segundo plano (idempotente)"""
+        if self.fechada:
+            return
+        self.fechada = True
+        self._ao_fechar(self)
+        if self._tarefa is not asyncio.current_task():
+            self._tarefa.cancel()
+        _em_segundo_plano(self._fechar_socket(codigo, motivo))
+
+    async def _fechar_socket(self, codigo: int, motivo: str):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=codigo, reason=motivo), timeout=WS_TIMEOUT_ENVIO)
+        except Exception:
+            pass  # já estava fechado ou o cliente sumiu
+
+
+_tarefas_soltas: Set[asyncio.Task] = set()
+
+def _em_segundo_plano(coro):
+    # guarda a referência até terminar (o event loop só guarda referência fraca das tarefas)
+    tarefa = asyncio.create_task(coro)
+    _tarefas_soltas.add(tarefa)
+    tarefa.add_done_callback(_tarefas_soltas.discard)
+
+
+class HistoricoCanal:
+    """Últimos eventos de um canal (ring buffer) para reenviar a quem reconecta"""
+
+    def __init__(self, cobertura: int):
+        self.eventos: deque = deque(maxlen=WS_REPLAY_MAX)  # (seq, texto)
+        self.cobertura = cobertura  # todo evento com seq maior que isso está em self.eventos
+
+    def adicionar(self, seq: int, texto: str):
+        """Guarda o evento mantendo o buffer ordenado por seq (o replay filtra por seq > ultimo_seq)"""
+        if seq <= self.cobertura:
+            return  # anterior ao que o buffer cobre: quem pedir esse trecho recebe snapshot
+        if len(self.eventos) == self.eventos.maxlen:
+            self.cobertura = self.eventos.popleft()[0]  # o mais antigo sai do buffer
+            if seq <= self.cobertura:
+                return
+        if not self.eventos or seq > self.eventos[-1][0]:
+            self.eventos.append((seq, texto))
+        else:
+            # fora de ordem (não acontece com o lock por canal, mas um buffer fora de ordem perderia eventos no replay)
+            self.eventos.insert(bisect.bisect([s for s, _ in self.eventos], seq), (seq, texto))
+
+    def ultimo_seq(self) -> int:
+        return self.eventos[-1][0] if self.eventos else self.cobertura
+
+    def eventos_desde(self, ultimo_seq: int) -> Optional[list[str]]:
+        """Eventos depois de ultimo_seq, ou None se parte deles já saiu do buffer"""
+        if ultimo_seq < self.cobertura:
+            return None
+        return [texto for seq, texto in self.eventos if seq > ultimo_seq]
+
+
+def _com_seq(texto: str, seq: int) -> str:
+    # as mensagens são sempre objetos JSON não vazios: insere o seq sem desserializar de novo
+    return f'{{"seq":{seq},{texto[1:]}'
+
+
+class ConnectionManager:
+    """Gerenciador de conexões WebSocket"""
+
+    def __init__(self, backend=None):
+        # Dicionário: canal -> Set[Conexao] (só os sockets deste worker)
+        self.active_connections: Dict[str, Set[Conexao]] = {}
+        self.backend = backend or BackendMemoria()
+        self.historicos: Dict[str, HistoricoCanal] = {}  # só canais de restaurante
+        self._tarefa_heartbeat: Optional[asyncio.Task] = None
+        self.fechadas_por_heartbeat = 0
+
+    async def iniciar(self):
+        await self.backend.iniciar(self._entregar_local, self._historico_perdido)
+        self._tarefa_heartbeat = asyncio.create_task(self._heartbeat())
+
+    async def parar(self):
+        if self._tarefa_heartbeat is not None:
+            self._tarefa_heartbeat.cancel()
+            self._tarefa_heartbeat = None
+        await self.backend.parar()
+        for conexoes in list(self.active_connections.values()):
+            for conexao in list(conexoes):
+                conexao.fechar(1001, "Servidor reiniciando")
+
+    async def connect(self, websocket: WebSocket, canal: str, ultimo_seq: Optional[int] = None, epoca: Optional[str] = None) -> Conexao:
+        """
+        Aceita o WebSocket e registra no canal. Manda {"type": "conectado", "epoca", "seq"} e, se o cliente
+        informou ultimo_seq/epoca (reconexão), os eventos perdidos ou um {"type": "snapshot"}.
+        """
+        await websocket.accept()
+        # daqui até o fim não tem await: nenhum evento novo entra entre o replay e o registro
+        conexao = Conexao(websocket, canal, self.disconnect)
+        self.active_connections.setdefault(canal, set()).add(conexao)
+        historico = self.historicos.get(canal)
+        seq_atual = historico.ultimo_seq() if historico else self.backend.cobertura
+        conexao.enviar(json.dumps({"type": "conectado", "epoca": self.backend.epoca, "seq": seq_atual}))
+        if ultimo_seq is not None:
+            perdidos = self._eventos_perdidos(canal, ultimo_seq, epoca)
+            if perdidos is None:
+                conexao.enviar(json.dumps({"type": "snapshot", "epoca": self.backend.epoca, "seq": seq_atual}))
+            else:
+                for texto in perdidos:
+                    conexao.enviar(texto)
+        return conexao
+
+    def _eventos_perdidos(self, canal: str, ultimo_seq: int, epoca: Optional[str]) -> Optional[list[str]]:
+        if epoca != self.backend.epoca or not canal.startswith("restaurante:"):
+            return None
+        historico = self.historicos.get(canal)
+        if historico is None:
+            # nenhum evento do canal desde que este worker começou a ouvir
+            return [] if ultimo_seq >= self.backend.cobertura else None
+        perdidos = historico.eventos_desde(ultimo_seq)
+        if perdidos is not None and len(perdidos) >= WS_FILA_MAX:
+            return None  # não cabe na fila de envio: mais barato recarregar
+        return perdidos
+
+    def disconnect(self, conexao: Conexao):
+        """Remove a conexão do canal (chamado também quando a conexão se fecha sozinha)"""
+        conexoes = self.active_connections.get(conexao.canal)
+        if conexoes is not None:
+            conexoes.discard(conexao)
+            if not conexoes:
+                del self.active_connections[conexao.canal]
+        if not conexao.fechada:
+            conexao.fechada = True
+            conexao._tarefa.cancel()
+
+    def send_personal_message(self, message: dict, conexao: Conexao):
+        """Envia mensagem para uma conexão específica"""
+        conexao.enviar(json.dumps(message))
+
+    async def publicar(self, canal: str, message: dict):
+        """Publica para todas as conexões do canal, em qualquer worker (serializa uma vez só)"""
+        await self.backend.publicar(canal, json.dumps(message))
+
     async def broadcast_to_restaurante(self, restaurante_id: str, message: dict):
-        """Envia mensagem para todos os WebSockets de um restaurante"""
-        if restaurante_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[restaurante_id]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except Exception as e:
-                    print(f"Erro ao enviar para restaurante {restaurante_id}: {e}")
-                    disconnected.add(connection)
-            
-            # Remove conexões desconectadas
-            for conn in disconnected:
-                self.active_connections[restaurante_id].discard(conn)
-            
-            if not self.active_connections[restaurante_id]:
-                del self.active_connections[restaurante_id]
+        await self.publicar(canal_restaurante(restaurante_id), message)
 
-# Instância global do gerenciador
-manager = ConnectionManager()
+    async def enviar_para_usuario(self, usuario_id: str, message: dict):
+        await self.publicar(canal_usuario(usuario_id), message)
+
+    def _entregar_local(self, canal: str, seq: int, texto: str):
+        """Guarda no histórico (canais de restaurante) e enfileira nas conexões deste worker"""
+        texto = _com_seq(texto, seq)
+        if canal.startswith("restaurante:"):
+            historico = self.historicos.get(canal)
+            if historico is None:
+                historico = self.historicos[canal] = HistoricoCanal(self.backend.cobertura)
+            historico.adicionar(seq, texto)
+        for conexao in list(self.active_connections.get(canal, ())):
+            conexao.enviar(texto)
 
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_SEGUNDOS)
+            limite = time.monotonic() - WS_HEARTBEAT_TIMEOUT
+            for conexoes in list(self.active_connections.values()):
+                for conexao in list(conexoes):
+                    if conexao.ultima_atividade < limite:
+                        self.fechadas_por_heartbeat += 1
+                        conexao.fechar(1001, "Sem resposta ao heartbeat")
+                    else:
+                        conexao.enviar(PING)
+
+    def _historico_perdido(self):
+        """O backend pode ter perdido eventos (LISTEN caiu): descarta os buffers e manda todo mundo recarregar"""
+        self.historicos.clear()
+        snapshot = json.dumps({"type": "snapshot", "epoca": self.backend.epoca, "seq": self.backend.cobertura})
+        for conexoes in list(self.active_connections.values()):
+            for conexao in list(conexoes):
+                conexao.enviar(snapshot)
+
+    def metricas(self) -> dict:
+        conexoes = [c for grupo in self.active_connections.values() for c in grupo]
+        return {
+            "backend": self.backend.nome,
+            "canais": len(self.active_connections),
+            "conexoes": len(conexoes),
+            "mensagens_na_fila": sum(c.fila.qsize() for c in conexoes),
+            "descartadas": sum(c.descartadas for c in conexoes),
+            "canais_com_historico": len(self.historicos),
+            "fechadas_por_heartbeat": self.fechadas_por_heartbeat,
+        }
+
+# Instância global do gerenciador
+manager = ConnectionManager(criar_backend())
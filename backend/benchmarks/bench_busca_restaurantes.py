@@ -0,0 +1,108 @@
+"""
+Benchmark da busca de restaurantes (/restaurantes/busca) sobre 100k restaurantes sintéticos.
+
+Tudo roda dentro de uma transação que é desfeita no final, então o banco não fica com os dados
+sintéticos. Para cada cenário mostra o tempo de crud.buscar_restaurantes e confere no EXPLAIN
+que o plano usa índice (nenhum Seq Scan em restaurantes).
+
+Precisa de um PostgreSQL rodando com o DATABASE_URL de app/database.py e da extensão pg_trgm.
+Uso (dentro de backend/):  python -m benchmarks.bench_busca_restaurantes
+"""
+import asyncio
+import json
+import time
+from decimal import Decimal
+from statistics import median
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app import crud, schemas
+from app.database import AsyncSessionLocal, engine
+from app.main import startup
+
+TOTAL_RESTAURANTES = 100_000
+REPETICOES = 20
+
+CENARIOS = {
+    "primeira página": schemas.FiltroRestaurantes(),
+    "texto": schemas.FiltroRestaurantes(q="pizza"),
+    "cidade": schemas.FiltroRestaurantes(cidade="Cidade 42"),
+    "cidade/estado": schemas.FiltroRestaurantes(estado="MG", cidade="Cidade 42"),
+    "avaliação + taxa": schemas.FiltroRestaurantes(avaliacao_minima=Decimal("4.5"), taxa_maxima=Decimal("5")),
+    "texto + estado": schemas.FiltroRestaurantes(q="vegana", estado="MG"),
+}
+
+# dados sintéticos: 500 cidades em 5 estados, descrições com palavras variadas e avaliações de 0 a 5
+INSERIR_SINTETICOS = """
+INSERT INTO restaurantes (restaurante_id, nome_fantasia, razao_social, descricao, avaliacao_media,
+                          taxa_entrega_base, endereco, ativo, email, senha_hash, criado_em)
+SELECT gen_random_uuid(),
+       'Restaurante ' || i || ' ' || (ARRAY['Sabor', 'Cantina', 'Bistrô', 'Casa', 'Empório'])[1 + i % 5],
+       'Razão ' || i,
+       (ARRAY['pizza artesanal', 'comida vegana', 'hambúrguer', 'sushi e temaki', 'comida caseira',
+              'massas frescas', 'açaí e lanches'])[1 + i % 7] || ' número ' || i,
+       round((random() * 5)::numeric, 2),
+       round((random() * 15)::numeric, 2),
+       jsonb_build_object('cidade', 'Cidade ' || (i % 500), 'estado', (ARRAY['SP', 'RJ', 'MG', 'PR', 'BA'])[1 + i % 5]),
+       i % 20 <> 0,
+       'bench-' || i || '@bench.local',
+       'x',
+       now()
+FROM generate_series(1, :total) AS i
+"""
+
+
+def _planos_com_seq_scan(plano: dict) -> list[str]:
+    encontrados = []
+    if plano.get("Node Type") == "Seq Scan" and plano.get("Relation Name") == "restaurantes":
+        encontrados.append("Seq Scan em restaurantes")
+    for filho in plano.get("Plans", []):
+        encontrados += _planos_com_seq_scan(filho)
+    return encontrados
+
+
+def _indices_usados(plano: dict) -> set[str]:
+    usados = {plano["Index Name"]} if "Index Name" in plano else set()
+    for filho in plano.get("Plans", []):
+        usados |= _indices_usados(filho)
+    return usados
+
+
+async def main():
+    engine.echo = False
+    await startup()
+
+    async with AsyncSessionLocal() as db:
+        try:
+            inicio = time.perf_counter()
+            await db.execute(sa.text(INSERIR_SINTETICOS), {"total": TOTAL_RESTAURANTES})
+            await db.execute(sa.text("ANALYZE restaurantes"))
+            print(f"{TOTAL_RESTAURANTES} restaurantes sintéticos criados em {time.perf_counter() - inicio:.1f}s\n")
+
+            print(f"{'cenário':<18} | {'mediana (ms)':>12} | {'linhas':>6} | índices")
+            for nome, filtros in CENARIOS.items():
+                tempos = []
+                for _ in range(REPETICOES):
+                    t0 = time.perf_counter()
+                    restaurantes, _ = await crud.buscar_restaurantes(db, filtros)
+                    tempos.append((time.perf_counter() - t0) * 1000)
+
+                sql = crud.query_busca_restaurantes(filtros).compile(
+                    dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+                )
+                explain = await db.execute(sa.text(f"EXPLAIN (FORMAT JSON) {sql}"))
+                raw = explain.scalar()
+                plano = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+                problemas = _planos_com_seq_scan(plano)
+                indices = ", ".join(sorted(_indices_usados(plano))) or "-"
+                status = "OK" if not problemas else "; ".join(problemas)
+                print(f"{nome:<18} | {median(tempos):>12.2f} | {len(restaurantes):>6} | {indices} [{status}]")
+        finally:
+            await db.rollback()
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""
+Benchmark da criação de pedidos: compara o caminho antigo (1 SELECT + 1 flush por item)
+com o crud.create_pedido atual (1 SELECT com IN + INSERT em lote) para carrinhos de 1, 10 e 100 itens.
+
+Precisa de um PostgreSQL rodando com o DATABASE_URL de app/database.py.
+Uso (dentro de backend/):  python -m benchmarks.bench_create_pedido
+"""
+import asyncio
+import time
+import uuid
+from decimal import Decimal
+from statistics import median
+
+import sqlalchemy as sa
+from sqlalchemy.orm import selectinload
+
+from app import crud, models, schemas
+from app.database import AsyncSessionLocal, Base, engine
+
+TAMANHOS_CARRINHO = [1, 10, 100]
+REPETICOES = 20
+
+
+async def create_pedido_antigo(db, pedido_data: schemas.PedidoCreate, usuario_id):
+    """Cópia da implementação anterior, mantida só para comparação"""
+    total = 0
+    pedido = models.Pedido(restaurante_id=pedido_data.restaurante_id, usuario_id=usuario_id, total=0)
+    db.add(pedido)
+    await db.flush()
+    for item in pedido_data.itens:
+        result = await db.execute(sa.select(models.Prato).where(models.Prato.prato_id == item.prato_id))
+        prato = result.scalar_one_or_none()
+        preco = float(prato.preco)
+        total += preco * item.quantidade
+        db.add(models.ItemPedido(
+            pedido_id=pedido.pedido_id,
+            prato_id=item.prato_id,
+            nome_prato=str(prato.nome),
+            quantidade=item.quantidade,
+            preco_unitario=preco,
+        ))
+        await db.flush()
+    pedido.total = total
+    await db.flush()
+    await db.commit()
+    result = await db.execute(
+        sa.select(models.Pedido).options(selectinload(models.Pedido.itens)).where(models.Pedido.pedido_id == pedido.pedido_id)
+    )
+    return result.scalar_one()
+
+
+async def preparar_dados():
+    """Cria um restaurante, um usuário e 100 pratos temporários"""
+    async with AsyncSessionLocal() as db:
+        restaurante = models.Restaurante(
+            nome_fantasia="Bench", razao_social="Bench LTDA", email=f"bench-{uuid.uuid4()}@bench.local",
+            senha_hash="x", endereco={"cidade": "Bench", "estado": "SP"},
+        )
+        usuario = models.Usuario(nome="Bench", email=f"bench-{uuid.uuid4()}@bench.local", senha_hash="x")
+        db.add_all([restaurante, usuario])
+        await db.flush()
+        pratos = [
+            models.Prato(restaurante_id=restaurante.restaurante_id, nome=f"Prato {i}", preco=Decimal("10.00") + i, disponivel=True)
+            for i in range(max(TAMANHOS_CARRINHO))
+        ]
+        db.add_all(pratos)
+        await db.commit()
+        return restaurante.restaurante_id, usuario.usuario_id, [p.prato_id for p in pratos]
+
+
+async def limpar_dados(restaurante_id, usuario_id):
+    async with AsyncSessionLocal() as db:
+        await db.execute(sa.delete(models.Pedido).where(models.Pedido.restaurante_id == restaurante_id))
+        await db.execute(sa.delete(models.Restaurante).where(models.Restaurante.restaurante_id == restaurante_id))
+        await db.execute(sa.delete(models.Usuario).where(models.Usuario.usuario_id == usuario_id))
+        await db.commit()
+
+
+async def medir(funcao, payload, usuario_id):
+    """Retorna (mediana em ms, quantidade de statements SQL por pedido)"""
+    statements = 0
+
+    def contar(*args):
+        nonlocal statements
+        statements += 1
+
+    sa.event.listen(engine.sync_engine, "before_cursor_execute", contar)
+    tempos = []
+    try:
+        for _ in range(REPETICOES):
+            async with AsyncSessionLocal() as db:
+                inicio = time.perf_counter()
+                await funcao(db, payload, usuario_id)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+    finally:
+        sa.event.remove(engine.sync_engine, "before_cursor_execute", contar)
+    return median(tempos), statements / REPETICOES
+
+
+async def main():
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    restaurante_id, usuario_id, prato_ids = await preparar_dados()
+    try:
+        print(f"{'itens':>6} | {'antigo (ms)':>12} | {'sql':>5} | {'novo (ms)':>10} | {'sql':>5} | {'ganho':>6}")
+        for tamanho in TAMANHOS_CARRINHO:
+            payload = schemas.PedidoCreate(
+                restaurante_id=restaurante_id,
+                itens=[schemas.ItemPedidoCreate(prato_id=prato_id, quantidade=1) for prato_id in prato_ids[:tamanho]],
+            )
+            antigo_ms, antigo_sql = await medir(create_pedido_antigo, payload, usuario_id)
+            novo_ms, novo_sql = await medir(crud.create_pedido, payload, usuario_id)
+            print(f"{tamanho:>6} | {antigo_ms:>12.2f} | {antigo_sql:>5.0f} | {novo_ms:>10.2f} | {novo_sql:>5.0f} | {antigo_ms / novo_ms:>5.1f}x")
+    finally:
+        await limpar_dados(restaurante_id, usuario_id)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
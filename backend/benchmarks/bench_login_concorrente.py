@@ -0,0 +1,114 @@
+"""
+Teste de carga do login: latência de endpoints que não têm nada a ver com senha enquanto
+50 logins rodam ao mesmo tempo.
+
+Compara três situações, todas dentro do mesmo event loop (httpx + ASGITransport, sem rede):
+  - sem logins (linha de base)
+  - 50 logins com o bcrypt no pool de threads (auth.verificar_e_atualizar atual)
+  - 50 logins com o bcrypt rodando direto no event loop (como era antes, mantido só para comparação)
+Durante cada fase um "probe" fica chamando GET /metricas/cache e GET /restaurantes/ e mede p50/p99.
+Logins recusados com 503 pelo controle de admissão (BCRYPT_MAX_PENDENTES, que com 1-3 CPUs fica abaixo de 50)
+contam como carga descartada e aparecem na coluna "503"; qualquer outro status diferente de 200 falha o teste.
+
+Precisa de um PostgreSQL rodando com o DATABASE_URL de app/database.py.
+Uso (dentro de backend/):  python -m benchmarks.bench_login_concorrente
+"""
+import asyncio
+import time
+import uuid
+
+import httpx
+import sqlalchemy as sa
+
+from app import auth, models
+from app.database import AsyncSessionLocal, engine
+from app.main import app, startup
+
+LOGINS_CONCORRENTES = 50
+ENDPOINTS_PROBE = ["/metricas/cache", "/restaurantes/"]
+INTERVALO_PROBE = 0.005
+SENHA = "senha-bench-123"
+
+
+async def verificar_no_loop(senha: str, senha_hash: str):
+    """Implementação anterior: bcrypt síncrono dentro do handler"""
+    return auth.pwd_context.verify_and_update(auth._preparar_senha(senha), senha_hash)
+
+
+def percentil(valores: list[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+async def probe(cliente: httpx.AsyncClient, parar: asyncio.Event) -> list[float]:
+    latencias = []
+    while not parar.is_set():
+        for url in ENDPOINTS_PROBE:
+            t0 = time.perf_counter()
+            r = await cliente.get(url)
+            r.raise_for_status()
+            latencias.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(INTERVALO_PROBE)
+    return latencias
+
+
+async def fase(cliente: httpx.AsyncClient, email: str | None) -> tuple[list[float], float, int]:
+    """
+    Roda o probe; se email, dispara LOGINS_CONCORRENTES logins e para quando todos terminarem.
+    Retorna (latências do probe, duração, logins recusados com 503).
+    """
+    parar = asyncio.Event()
+    tarefa_probe = asyncio.create_task(probe(cliente, parar))
+    await asyncio.sleep(0.05)  # probe já rodando antes da rajada
+    t0 = time.perf_counter()
+    if email:
+        respostas = await asyncio.gather(*[
+            cliente.post("/usuarios/login", data={"username": email, "password": SENHA})
+            for _ in range(LOGINS_CONCORRENTES)
+        ])
+        assert all(r.status_code in (200, 503) for r in respostas), [r.status_code for r in respostas]
+        recusados = sum(r.status_code == 503 for r in respostas)
+    else:
+        await asyncio.sleep(1)
+        recusados = 0
+    duracao = time.perf_counter() - t0
+    parar.set()
+    return await tarefa_probe, duracao, recusados
+
+
+async def main():
+    engine.echo = False
+    await startup()
+
+    email = f"bench-{uuid.uuid4()}@bench.local"
+    async with AsyncSessionLocal() as db:
+        usuario = models.Usuario(nome="Bench", email=email, senha_hash=await auth.gerar_hash(SENHA))
+        db.add(usuario)
+        await db.commit()
+
+    print(f"bcrypt: {auth.BCRYPT_ROUNDS} rounds, {auth.BCRYPT_WORKERS} threads, "
+          f"até {auth.BCRYPT_MAX_PENDENTES} pendentes\n")
+    print(f"{'fase':<28} | {'p50 (ms)':>9} | {'p99 (ms)':>9} | {'máx (ms)':>9} | {'probes':>6} | {'503':>4} | duração")
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as cliente:
+            fases = [("sem logins", None, auth.verificar_e_atualizar),
+                     (f"{LOGINS_CONCORRENTES} logins (pool)", email, auth.verificar_e_atualizar),
+                     (f"{LOGINS_CONCORRENTES} logins (no event loop)", email, verificar_no_loop)]
+            original = auth.verificar_e_atualizar
+            for nome, email_fase, verificar in fases:
+                auth.verificar_e_atualizar = verificar
+                try:
+                    latencias, duracao, recusados = await fase(cliente, email_fase)
+                finally:
+                    auth.verificar_e_atualizar = original
+                print(f"{nome:<28} | {percentil(latencias, 50):>9.2f} | {percentil(latencias, 99):>9.2f} | "
+                      f"{max(latencias):>9.2f} | {len(latencias):>6} | {recusados:>4} | {duracao:.2f}s")
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(sa.delete(models.Usuario).where(models.Usuario.email == email))
+            await db.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+"""
+Soak test dos WebSockets: muitas conexões simultâneas no mesmo worker.
+
+Sobe um worker uvicorn (heartbeat curto via env), abre N dashboards autenticados do mesmo restaurante e mede:
+  - memória do worker por conexão (VmRSS antes e depois de conectar todo mundo)
+  - latência do broadcast de novo_pedido: do POST até cada um dos N sockets receber (p50/p99/máx)
+  - se o heartbeat derrubou alguém durante o soak (os clientes respondem o ping, então tem que dar zero)
+  - se o worker volta a zero conexões depois que os clientes fecham
+Clientes e servidor dividem a mesma máquina, então a latência inclui o tempo dos clientes lendo as mensagens.
+
+Precisa de um PostgreSQL rodando com o DATABASE_URL de app/database.py e de ulimit -n maior que N
+(o script sobe o soft limit até o hard limit).
+Uso (dentro de backend/):  python -m benchmarks.bench_ws_soak [--conexoes 10000] [--pedidos 5] [--soak 30]
+"""
+import argparse
+import asyncio
+import json
+import resource
+import time
+
+import httpx
+import websockets
+
+from .ws_multiworker import esperar_worker, preparar_dados, subir_worker
+
+PORTA = 8200
+
+
+def percentil(valores: list[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for linha in f:
+            if linha.startswith("VmRSS:"):
+                return int(linha.split()[1]) / 1024
+    return 0.0
+
+
+def subir_limite_arquivos(necessario: int):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < necessario:
+        print(f"aviso: ulimit -n {hard} é menor que os ~{necessario} descritores necessários")
+
+
+async def dashboard(url: str, semaforo: asyncio.Semaphore, conectados: list, recebidos: dict, parar: asyncio.Event):
+    async with semaforo:
+        ws = await websockets.connect(url, ping_interval=None, open_timeout=60)
+    conectados.append(ws)
+    try:
+        async for texto in ws:
+            chegada = time.perf_counter()
+            mensagem = json.loads(texto)
+            if mensagem["type"] == "novo_pedido":
+                recebidos.setdefault(mensagem["pedido_id"], []).append(chegada)
+            elif mensagem["type"] == "ping":
+                await ws.send('{"type": "pong"}')
+            if parar.is_set():
+                break
+    except websockets.ConnectionClosed:
+        pass
+
+
+async def metricas_ws(cliente: httpx.AsyncClient) -> dict:
+    return (await cliente.get("/metricas/websocket")).json()
+
+
+async def main(args):
+    subir_limite_arquivos(args.conexoes + 100)  # vale pra este processo e pro worker (herda o limite)
+    processo = subir_worker(args.app, PORTA, WS_PUBSUB=args.pubsub,
+                            WS_HEARTBEAT_SEGUNDOS=str(args.heartbeat), WS_HEARTBEAT_TIMEOUT=str(args.heartbeat * 2.5))
+    tarefas = []
+    try:
+        await esperar_worker(PORTA, processo)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORTA}", timeout=120) as cliente:
+            dados = await preparar_dados(cliente)
+            url = f"ws://127.0.0.1:{PORTA}/ws/restaurante/{dados['restaurante_id']}?token={dados['token_restaurante']}"
+
+            # um socket só antes, pra não contar na memória o que é carregado na primeira conexão
+            async with websockets.connect(url):
+                pass
+            await asyncio.sleep(0.5)
+            rss_antes = rss_mb(processo.pid)
+
+            semaforo, conectados, recebidos, parar = asyncio.Semaphore(args.paralelo), [], {}, asyncio.Event()
+            t0 = time.perf_counter()
+            tarefas = [asyncio.create_task(dashboard(url, semaforo, conectados, recebidos, parar))
+                       for _ in range(args.conexoes)]
+            while len(conectados) < args.conexoes:
+                falhas = [t for t in tarefas if t.done() and t.exception()]
+                if falhas:
+                    raise RuntimeError(f"{len(falhas)} conexão(ões) falharam: {falhas[0].exception()!r}")
+                await asyncio.sleep(0.1)
+            print(f"{args.conexoes} conexões em {time.perf_counter() - t0:.1f}s")
+            await asyncio.sleep(1)
+            rss_depois = rss_mb(processo.pid)
+            print(f"RSS do worker: {rss_antes:.1f} MB -> {rss_depois:.1f} MB "
+                  f"({(rss_depois - rss_antes) * 1024 / args.conexoes:.1f} KB por conexão)")
+
+            latencias = []
+            for _ in range(args.pedidos):
+                inicio = time.perf_counter()
+                r = await cliente.post(
+                    "/pedidos/",
+                    json={"restaurante_id": dados["restaurante_id"], "itens": [{"prato_id": dados["prato_id"], "quantidade": 1}]},
+                    headers={"Authorization": f"Bearer {dados['token_usuario']}"},
+                )
+                r.raise_for_status()
+                pedido_id = r.json()["pedido_id"]
+                limite = time.monotonic() + 60
+                while len(recebidos.get(pedido_id, ())) < args.conexoes and time.monotonic() < limite:
+                    await asyncio.sleep(0.01)
+                chegadas = recebidos.get(pedido_id, [])
+                latencias += [(t - inicio) * 1000 for t in chegadas]
+                print(f"pedido {pedido_id[:8]}: {len(chegadas)}/{args.conexoes} sockets, "
+                      f"último em {(max(chegadas) - inicio) * 1000:.0f} ms" if chegadas else "nenhum socket recebeu")
+            if latencias:
+                print(f"latência do broadcast: p50 {percentil(latencias, 50):.0f} ms | "
+                      f"p99 {percentil(latencias, 99):.0f} ms | máx {max(latencias):.0f} ms")
+
+            print(f"soak de {args.soak:.0f}s com heartbeat a cada {args.heartbeat:.0f}s...")
+            await asyncio.sleep(args.soak)
+            durante = await metricas_ws(cliente)
+
+            parar.set()
+            for ws in conectados:
+                await ws.close()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+            limite = time.monotonic() + 30
+            while (depois := await metricas_ws(cliente))["conexoes"] and time.monotonic() < limite:
+                await asyncio.sleep(0.5)
+
+        problemas = []
+        if durante["conexoes"] != args.conexoes:
+            problemas.append(f"{durante['conexoes']} conexões no fim do soak, esperado {args.conexoes}")
+        if durante["fechadas_por_heartbeat"]:
+            problemas.append(f"heartbeat fechou {durante['fechadas_por_heartbeat']} conexões que respondiam")
+        if any(len(recebidos.get(p, ())) != args.conexoes for p in recebidos):
+            problemas.append("algum pedido não chegou em todos os sockets")
+        if depois["conexoes"]:
+            problemas.append(f"{depois['conexoes']} conexões continuaram registradas depois dos clientes fecharem")
+        print(f"\nsoak: {'OK' if not problemas else 'FALHOU: ' + '; '.join(problemas)}")
+        return 1 if problemas else 0
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak test com muitas conexões WebSocket num worker")
+    parser.add_argument("--conexoes", type=int, default=10000)
+    parser.add_argument("--paralelo", type=int, default=200, help="handshakes em andamento ao mesmo tempo")
+    parser.add_argument("--pedidos", type=int, default=5)
+    parser.add_argument("--soak", type=float, default=30, help="segundos com tudo conectado depois dos pedidos")
+    parser.add_argument("--heartbeat", type=float, default=5, help="WS_HEARTBEAT_SEGUNDOS do worker (timeout = 2.5x)")
+    parser.add_argument("--pubsub", default="memoria", choices=["memoria", "postgres"])
+    parser.add_argument("--app", default="app.main:app", help="aplicação ASGI que o worker sobe")
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
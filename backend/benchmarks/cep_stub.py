@@ -0,0 +1,127 @@
+"""
+Verificação da busca de CEP (app/cep.py) contra um ViaCEP falso rodando localmente, sem rede nem banco.
+
+O stub sobe na porta 8300 e responde /ws/<cep>/json/ com atraso configurável; contando as chamadas que
+ele recebeu dá pra conferir:
+  - 50 buscas simultâneas do mesmo CEP viram uma chamada só (single-flight)
+  - a segunda rodada sai do cache (nenhuma chamada nova)
+  - CEP inexistente: 404, e a repetição sai do cache negativo
+  - 5xx e timeout do upstream: 502/504 e nada fica em cache (a próxima busca tenta de novo)
+  - CEP que está no CEP_DATASET responde sem chamar o upstream
+  - o mesmo httpx.AsyncClient (e a mesma conexão keep-alive) é usado em todas as chamadas
+
+Uso (dentro de backend/):  python -m benchmarks.cep_stub
+"""
+import asyncio
+import os
+import tempfile
+
+PORTA = 8300
+ATRASO = 0.2
+
+_dataset = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8")
+_dataset.write("cep,logradouro,bairro,cidade,estado,complemento\n70040-010,Esplanada dos Ministérios,Zona Cívico-Administrativa,Brasília,DF,\n")
+_dataset.close()
+# antes de importar app.cep, que lê a configuração no import
+os.environ.update({
+    "CEP_UPSTREAM_URL": f"http://127.0.0.1:{PORTA}/ws/{{cep}}/json/",
+    "CEP_TIMEOUT_SEGUNDOS": "1",
+    "CEP_DATASET": _dataset.name,
+})
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from app import cep
+from app.routes import cep as rotas_cep
+
+chamadas: list[str] = []
+conexoes: set = set()  # portas de origem vistas pelo stub: 1 = keep-alive funcionando
+modo = {"falhar": False, "lento": False}
+
+
+async def viacep_falso(request):
+    numero = request.path_params["cep"]
+    chamadas.append(numero)
+    conexoes.add(request.client.port)
+    await asyncio.sleep(2 if modo["lento"] else ATRASO)
+    if modo["falhar"]:
+        return Response(status_code=503)
+    if numero.startswith("99"):
+        return JSONResponse({"erro": "true"})
+    return JSONResponse({"cep": f"{numero[:5]}-{numero[5:]}", "logradouro": "Praça da Sé", "complemento": "lado ímpar",
+                         "bairro": "Sé", "localidade": "São Paulo", "uf": "SP"})
+
+
+async def main():
+    stub = uvicorn.Server(uvicorn.Config(Starlette(routes=[Route("/ws/{cep}/json/", viacep_falso)]),
+                                         port=PORTA, log_level="warning"))
+    tarefa_stub = asyncio.create_task(stub.serve())
+    while not stub.started:
+        await asyncio.sleep(0.05)
+
+    app = FastAPI()
+    app.include_router(rotas_cep.router)
+    falhas = 0
+
+    def conferir(descricao: str, ok: bool):
+        nonlocal falhas
+        falhas += not ok
+        print(f"{descricao}: [{'OK' if ok else 'FALHOU'}]")
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://teste") as cliente:
+            respostas = await asyncio.gather(*[cliente.get("/cep/01001-000") for _ in range(50)])
+            conferir(f"50 buscas simultâneas -> {len(chamadas)} chamada(s) ao upstream",
+                     len(chamadas) == 1 and all(r.status_code == 200 for r in respostas))
+            conferir("resposta no formato da API", respostas[0].json() == {
+                "cep": "01001-000", "logradouro": "Praça da Sé", "bairro": "Sé", "cidade": "São Paulo",
+                "estado": "SP", "complemento": "lado ímpar"})
+
+            antes = len(chamadas)
+            respostas = await asyncio.gather(*[cliente.get("/cep/01001000") for _ in range(50)])
+            conferir("segunda rodada sai do cache", len(chamadas) == antes and all(r.status_code == 200 for r in respostas))
+
+            antes = len(chamadas)
+            primeira, segunda = await cliente.get("/cep/99999999"), await cliente.get("/cep/99999-999")
+            conferir("CEP inexistente: 404 com cache negativo",
+                     primeira.status_code == segunda.status_code == 404 and len(chamadas) == antes + 1)
+
+            conferir("CEP inválido: 400 sem chamar o upstream",
+                     (await cliente.get("/cep/123")).status_code == 400 and len(chamadas) == antes + 1)
+
+            modo["falhar"] = True
+            antes = len(chamadas)
+            primeira, segunda = await cliente.get("/cep/02002000"), await cliente.get("/cep/02002000")
+            conferir("upstream com 503: 502 e sem cache",
+                     primeira.status_code == segunda.status_code == 502 and len(chamadas) == antes + 2)
+            modo["falhar"] = False
+            conferir("upstream voltou: mesma busca agora dá 200", (await cliente.get("/cep/02002000")).status_code == 200)
+
+            modo["lento"] = True
+            conferir("upstream lento: 504", (await cliente.get("/cep/03003000")).status_code == 504)
+            modo["lento"] = False
+
+            antes = len(chamadas)
+            resposta = await cliente.get("/cep/70040010")
+            conferir("CEP do dataset sem chamar o upstream",
+                     resposta.status_code == 200 and resposta.json()["cidade"] == "Brasília" and len(chamadas) == antes)
+
+        # o timeout derruba a conexão em uso, então conta no máximo 2 (antes e depois do timeout)
+        conferir(f"cliente HTTP compartilhado: {len(chamadas)} chamadas em {len(conexoes)} conexão(ões)", len(conexoes) <= 2)
+        print(cep.metricas())
+        print(f"\n{'tudo certo' if not falhas else f'{falhas} verificação(ões) falharam'}")
+        return 1 if falhas else 0
+    finally:
+        await cep.fechar_cliente()
+        stub.should_exit = True
+        await tarefa_stub
+        os.unlink(_dataset.name)
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
@@ -0,0 +1,221 @@
+"""
+Teste do fan-out dos WebSockets com vários workers (WS_PUBSUB=postgres).
+
+Sobe N processos uvicorn independentes (como os workers do gunicorn, cada um com o seu ConnectionManager),
+conecta dashboards do mesmo restaurante em todos eles e cria pedidos em rajadas concorrentes, um POST em
+cada worker ao mesmo tempo. Confere, para cada dashboard:
+ - cada novo_pedido chegou exatamente uma vez, com o mesmo seq em todos os dashboards;
+ - os seqs chegaram em ordem estritamente crescente (os NOTIFY concorrentes não se cruzam).
+Depois reconecta um dashboard em outro worker com ?ultimo_seq= da metade dos eventos e confere que o
+replay traz exatamente os eventos seguintes, na ordem do seq.
+
+Qualquer divergência termina com AssertionError (código de saída 1). Precisa de um PostgreSQL rodando com
+o DATABASE_URL de app/database.py.
+Uso (dentro de backend/):  python -m benchmarks.ws_multiworker [--workers 3] [--dashboards 2] [--pedidos 30]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+import websockets
+
+PORTA_INICIAL = 8100
+
+
+async def esperar_worker(porta: int, processo: subprocess.Popen, limite: float = 30):
+    inicio = time.monotonic()
+    async with httpx.AsyncClient() as cliente:
+        while time.monotonic() - inicio < limite:
+            if processo.poll() is not None:
+                raise RuntimeError(f"worker da porta {porta} saiu com código {processo.returncode}")
+            try:
+                if (await cliente.get(f"http://127.0.0.1:{porta}/metricas/banco/saude")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"worker da porta {porta} não respondeu em {limite}s")
+
+
+def subir_worker(app: str, porta: int, **env) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(porta), "--log-level", "warning"],
+        env={**os.environ, "WS_PUBSUB": "postgres", **env},
+    )
+
+
+async def preparar_dados(cliente: httpx.AsyncClient) -> dict:
+    """Cria restaurante, prato e usuário pela API; retorna ids e tokens"""
+    sufixo = uuid.uuid4().hex[:8]
+    r = await cliente.post("/restaurantes/registro", data=dict(
+        nome_fantasia=f"WS {sufixo}", razao_social="WS LTDA", email=f"ws-rest-{sufixo}@bench.com.br", senha="123456",
+        cep="01001000", logradouro="Rua", numero="1", bairro="Centro", cidade="São Paulo", estado="SP",
+    ))
+    r.raise_for_status()
+    restaurante_id = r.json()["restaurante_id"]
+    r = await cliente.post("/restaurantes/login", data={"username": f"ws-rest-{sufixo}@bench.com.br", "password": "123456"})
+    token_restaurante = r.json()["access_token"]
+    r = await cliente.post(f"/restaurantes/{restaurante_id}/menu", json={"nome": "Prato WS", "descricao": None, "preco": "10.00"})
+    r.raise_for_status()
+    prato_id = r.json()["prato_id"]
+    r = await cliente.post("/usuarios/", json={"nome": "WS", "email": f"ws-user-{sufixo}@bench.com.br", "senha": "123456"})
+    r.raise_for_status()
+    r = await cliente.post("/usuarios/login", data={"username": f"ws-user-{sufixo}@bench.com.br", "password": "123456"})
+    return {
+        "restaurante_id": restaurante_id,
+        "prato_id": prato_id,
+        "token_restaurante": token_restaurante,
+        "token_usuario": r.json()["access_token"],
+    }
+
+
+class Dashboard:
+    """Um dashboard conectado: guarda os novo_pedido na ordem em que chegaram"""
+
+    def __init__(self, porta: int, url: str):
+        self.porta = porta
+        self.url = url
+        self.epoca = None
+        self.chegadas: list[tuple[int, str]] = []  # (seq, pedido_id)
+
+    async def ouvir(self, pronto: asyncio.Event, parar: asyncio.Event):
+        async with websockets.connect(self.url) as ws:
+            pronto.set()
+            while not parar.is_set():
+                try:
+                    mensagem = json.loads(await asyncio.wait_for(ws.recv(), timeout=0.2))
+                except asyncio.TimeoutError:
+                    continue
+                if mensagem.get("type") == "conectado":
+                    self.epoca = mensagem["epoca"]
+                elif mensagem.get("type") == "novo_pedido":
+                    self.chegadas.append((mensagem["seq"], mensagem["pedido_id"]))
+
+
+def conferir_dashboard(d: Dashboard, criados: list[str]) -> list[str]:
+    """Divergências de um dashboard: pedido faltando ou repetido, seq fora de ordem"""
+    problemas = []
+    recebidos = Counter(pedido_id for _, pedido_id in d.chegadas)
+    faltando = [p for p in criados if recebidos[p] == 0]
+    duplicados = [p for p in criados if recebidos[p] > 1]
+    if faltando or duplicados:
+        problemas.append(f"porta {d.porta}: {len(faltando)} pedido(s) faltando, {len(duplicados)} duplicado(s)")
+    seqs = [seq for seq, _ in d.chegadas]
+    fora_de_ordem = [(a, b) for a, b in zip(seqs, seqs[1:]) if b <= a]
+    if fora_de_ordem:
+        problemas.append(f"porta {d.porta}: seq fora de ordem {fora_de_ordem[:5]}")
+    print(f"dashboard na porta {d.porta}: {len(d.chegadas)} mensagens, {len(faltando)} faltando, "
+          f"{len(duplicados)} duplicadas, {len(fora_de_ordem)} fora de ordem [{'FALHOU' if problemas else 'OK'}]")
+    return problemas
+
+
+async def conferir_replay(porta: int, dados: dict, epoca: str, ultimo_seq: int, esperados: list[str]) -> list[str]:
+    url = (f"ws://127.0.0.1:{porta}/ws/restaurante/{dados['restaurante_id']}"
+           f"?token={dados['token_restaurante']}&ultimo_seq={ultimo_seq}&epoca={epoca}")
+    async with websockets.connect(url) as ws:
+        recebidos = []
+        while len(recebidos) < len(esperados) + 1:
+            try:
+                recebidos.append(json.loads(await asyncio.wait_for(ws.recv(), timeout=2)))
+            except asyncio.TimeoutError:
+                break
+    replay = [m["pedido_id"] for m in recebidos if m.get("type") == "novo_pedido"]
+    snapshot = any(m.get("type") == "snapshot" for m in recebidos)
+    ok = replay == esperados and not snapshot
+    print(f"replay na porta {porta} a partir do seq {ultimo_seq}: {len(replay)} de {len(esperados)} pedidos"
+          f"{' (recebeu snapshot)' if snapshot else ''} [{'OK' if ok else 'FALHOU'}]")
+    if ok:
+        return []
+    return [f"replay na porta {porta} a partir do seq {ultimo_seq}: esperava {esperados}, veio {replay}"
+            f"{' e um snapshot' if snapshot else ''}"]
+
+
+async def main(args):
+    portas = [PORTA_INICIAL + i for i in range(args.workers)]
+    # o primeiro sobe sozinho pra criar as tabelas sem corrida entre os startups
+    processos = [subir_worker(args.app, portas[0])]
+    try:
+        await esperar_worker(portas[0], processos[0])
+        processos += [subir_worker(args.app, porta) for porta in portas[1:]]
+        await asyncio.gather(*[esperar_worker(porta, p) for porta, p in zip(portas[1:], processos[1:])])
+        print(f"{args.workers} workers no ar (portas {portas[0]}-{portas[-1]})")
+
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{portas[0]}") as cliente:
+            dados = await preparar_dados(cliente)
+
+        parar = asyncio.Event()
+        dashboards, tarefas = [], []
+        for porta in portas:
+            for _ in range(args.dashboards):
+                pronto = asyncio.Event()
+                d = Dashboard(porta, f"ws://127.0.0.1:{porta}/ws/restaurante/{dados['restaurante_id']}?token={dados['token_restaurante']}")
+                dashboards.append(d)
+                tarefas.append(asyncio.create_task(d.ouvir(pronto, parar)))
+                await pronto.wait()
+
+        criados = []
+        clientes = [httpx.AsyncClient(base_url=f"http://127.0.0.1:{porta}") for porta in portas]
+
+        async def criar_pedido(cliente: httpx.AsyncClient) -> str:
+            r = await cliente.post(
+                "/pedidos/",
+                json={"restaurante_id": dados["restaurante_id"], "itens": [{"prato_id": dados["prato_id"], "quantidade": 1}]},
+                headers={"Authorization": f"Bearer {dados['token_usuario']}"},
+            )
+            r.raise_for_status()
+            return r.json()["pedido_id"]
+
+        try:
+            # rajadas: um POST em cada worker ao mesmo tempo, pra os NOTIFY do mesmo restaurante concorrerem
+            while len(criados) < args.pedidos:
+                rajada = clientes[:args.pedidos - len(criados)]
+                criados += await asyncio.gather(*(criar_pedido(c) for c in rajada))
+        finally:
+            for c in clientes:
+                await c.aclose()
+
+        await asyncio.sleep(args.espera)
+        parar.set()
+        await asyncio.gather(*tarefas)
+
+        problemas = []
+        for d in dashboards:
+            problemas += conferir_dashboard(d, criados)
+        seq_por_pedido = [{pedido_id: seq for seq, pedido_id in d.chegadas} for d in dashboards]
+        seqs_diferentes = [p for p in criados if len({seqs.get(p) for seqs in seq_por_pedido}) != 1]
+        if seqs_diferentes:
+            problemas.append(f"{len(seqs_diferentes)} pedido(s) com seq diferente entre os workers")
+
+        # os POSTs concorrentes não definem a ordem: o replay segue a ordem do seq
+        ordem = [pedido_id for _, pedido_id in sorted(dashboards[0].chegadas)]
+        meio = len(ordem) // 2
+        if meio:
+            problemas += await conferir_replay(
+                portas[-1], dados, dashboards[0].epoca, seq_por_pedido[0][ordem[meio - 1]], ordem[meio:]
+            )
+
+        assert not problemas, f"{len(problemas)} problema(s) no fan-out:\n" + "\n".join(problemas)
+        print(f"\n{args.pedidos} pedidos, {len(dashboards)} dashboards: cada pedido chegou uma vez e em ordem em todos [OK]")
+        return 0
+    finally:
+        for processo in processos:
+            processo.terminate()
+        for processo in processos:
+            processo.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fan-out dos WebSockets entre vários workers")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--dashboards", type=int, default=2, help="dashboards conectados em cada worker")
+    parser.add_argument("--pedidos", type=int, default=30)
+    parser.add_argument("--espera", type=float, default=1.0, help="segundos esperando as últimas entregas")
+    parser.add_argument("--app", default="app.main:app", help="aplicação ASGI que cada worker sobe")
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
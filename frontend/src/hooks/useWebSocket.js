@@ -6,6 +6,9 @@ export function useWebSocket(url, onMessage) {
   const reconnectTimeoutRef = useRef(null);
   const reconnectAttempts = useRef(0);
   const maxReconnectAttempts = 5;
+  // Último evento recebido: na reconexão o servidor reenvia só o que foi perdido (ou manda um "snapshot")
+  const ultimoSeq = useRef(null);
+  const epoca = useRef(null);
 
   useEffect(() => {
     if (!url) {
@@ -22,6 +25,8 @@ export function useWebSocket(url, onMessage) {
       }
       ws.current = null;
     }
+    ultimoSeq.current = null;
+    epoca.current = null;
 
     const connect = () => {
       // Evita múltiplas conexões
@@ -31,39 +36,40 @@ export function useWebSocket(url, onMessage) {
 
       try {
         // Converte http:// para ws:// ou https:// para wss://
-        const wsUrl = url.replace(/^http/, 'ws');
+        let wsUrl = url.replace(/^http/, 'ws');
+        if (epoca.current !== null && ultimoSeq.current !== null) {
+          const separador = wsUrl.includes('?') ? '&' : '?';
+          wsUrl += `${separador}ultimo_seq=${ultimoSeq.current}&epoca=${encodeURIComponent(epoca.current)}`;
+        }
         ws.current = new WebSocket(wsUrl);
 
         ws.current.onopen = () => {
           console.log('WebSocket conectado');
           setIsConnected(true);
           reconnectAttempts.current = 0;
-          
-          // Envia um ping periódico para manter a conexão viva
-          const pingInterval = setInterval(() => {
-            if (ws.current && ws.current.readyState === WebSocket.OPEN) {
-              try {
-                ws.current.send(JSON.stringify({ type: 'ping' }));
-              } catch (error) {
-                console.error('Erro ao enviar ping:', error);
-                clearInterval(pingInterval);
-              }
-            } else {
-              clearInterval(pingInterval);
-            }
-          }, 30000); // Ping a cada 30 segundos
-          
-          // Armazena o intervalo para limpar depois
-          ws.current._pingInterval = pingInterval;
         };
 
         ws.current.onmessage = (event) => {
           try {
             const data = JSON.parse(event.data);
-            // Ignora mensagens de pong (resposta ao ping)
+            // O heartbeat é do servidor: responde o ping, senão a conexão é fechada por inatividade
+            if (data.type === 'ping') {
+              ws.current?.send(JSON.stringify({ type: 'pong' }));
+              return;
+            }
             if (data.type === 'pong') {
               return;
             }
+            if (data.epoca) {
+              epoca.current = data.epoca;
+            }
+            if (typeof data.seq === 'number') {
+              ultimoSeq.current = Math.max(ultimoSeq.current ?? data.seq, data.seq);
+            }
+            // "conectado" só informa a posição atual do stream
+            if (data.type === 'conectado') {
+              return;
+            }
             if (onMessage) {
               onMessage(data);
             }
@@ -80,11 +86,6 @@ export function useWebSocket(url, onMessage) {
           console.log('WebSocket desconectado', event.code, event.reason);
           setIsConnected(false);
           
-          // Limpa o intervalo de ping
-          if (ws.current && ws.current._pingInterval) {
-            clearInterval(ws.current._pingInterval);
-          }
-          
           // Não tenta reconectar se foi fechado intencionalmente (código 1000)
           if (event.code === 1000) {
             console.log('Conexão fechada intencionalmente');
@@ -119,11 +120,6 @@ export function useWebSocket(url, onMessage) {
       
       // Fecha conexão WebSocket
       if (ws.current) {
-        // Limpa o intervalo de ping
-        if (ws.current._pingInterval) {
-          clearInterval(ws.current._pingInterval);
-        }
-        
         // Remove event listeners para evitar vazamentos
         ws.current.onopen = null;
         ws.current.onmessage = null;
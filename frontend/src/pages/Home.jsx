@@ -18,7 +18,8 @@ function Card({ r, index, isRecomendado }) {
       <div className="h-40 bg-gradient-to-br from-secundario/30 to-primario/20 flex items-center justify-center overflow-hidden">
         {r.foto_perfil ? (
           <img 
-            src={`http://localhost:8000${r.foto_perfil}`}
+            src={`http://localhost:8000${r.foto_perfil_variantes?.thumb ?? r.foto_perfil}`}
+            loading="lazy"
             alt={r.nome_fantasia}
             className="w-full h-full object-cover group-hover:scale-110 transition-transform"
           />
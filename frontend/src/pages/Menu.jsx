@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import axios from "axios";
 import { useParams, useNavigate } from "react-router-dom";
 import { motion, AnimatePresence } from "framer-motion";
@@ -14,6 +14,8 @@ export default function Menu() {
   const [loading, setLoading] = useState(true);
   const [busca, setBusca] = useState("");
   const [finalizando, setFinalizando] = useState(false);
+  // Idempotency-Key do carrinho atual: tentar de novo o mesmo carrinho reusa a chave e não duplica o pedido
+  const tentativaPedido = useRef(null);
   const { cartItems, addToCart, clearCart, total, removeFromCart } = useCart();
   const { usuario } = useAuth();
   const { success, error, info, warning } = useToast();
@@ -143,7 +145,20 @@ export default function Menu() {
         })),
       };
 
-      const response = await axios.post("http://localhost:8000/pedidos/", payload);
+      const corpo = JSON.stringify(payload);
+      if (tentativaPedido.current?.corpo !== corpo) {
+        tentativaPedido.current = { corpo, chave: crypto.randomUUID() };
+      }
+      const config = { headers: { "Idempotency-Key": tentativaPedido.current.chave } };
+      let response;
+      try {
+        response = await axios.post("http://localhost:8000/pedidos/", payload, config);
+      } catch (err) {
+        if (err.response) throw err;
+        // sem resposta (rede caiu): o pedido pode ter sido criado, repete uma vez com a mesma chave
+        response = await axios.post("http://localhost:8000/pedidos/", payload, config);
+      }
+      tentativaPedido.current = null;
       success(`Pedido realizado com sucesso! ID: ${response.data.pedido_id.slice(0, 8).toUpperCase()}`);
       clearCart();
       // Redireciona para a página de pedidos após criar
@@ -203,7 +218,7 @@ export default function Menu() {
               <div className="w-24 h-24 rounded-full overflow-hidden border-2 border-primario flex-shrink-0">
                 {restaurante.foto_perfil ? (
                   <img 
-                    src={`http://localhost:8000${restaurante.foto_perfil}`}
+                    src={`http://localhost:8000${restaurante.foto_perfil_variantes?.thumb ?? restaurante.foto_perfil}`}
                     alt={restaurante.nome_fantasia}
                     className="w-full h-full object-cover"
                   />
@@ -226,7 +241,12 @@ export default function Menu() {
                       <span>{Number(restaurante.avaliacao_media).toFixed(1)}</span>
                     </span>
                   )}
-                  {restaurante.tempo_medio_entrega && (
+                  {/* tempo observado nas últimas entregas; sem dados suficientes, o informado pelo restaurante */}
+                  {restaurante.eta_p50 ? (
+                    <span className="flex items-center gap-1" title="Tempo real das últimas entregas">
+                      ⏱️ {restaurante.eta_p50}–{restaurante.eta_p90} min
+                    </span>
+                  ) : restaurante.tempo_medio_entrega && (
                     <span className="flex items-center gap-1">
                       ⏱️ {restaurante.tempo_medio_entrega} min
                     </span>
@@ -359,7 +379,8 @@ export default function Menu() {
                     {/* Imagem */}
                     {p.imagem_url ? (
                       <img
-                        src={`http://localhost:8000${p.imagem_url}`}
+                        src={`http://localhost:8000${p.imagem_variantes?.media ?? p.imagem_url}`}
+                        loading="lazy"
                         alt={p.nome}
                         className="h-48 w-full object-cover"
                       />
@@ -1,18 +1,21 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useState, useCallback } from "react";
 import axios from "axios";
 import { useAuth } from "../context/AuthContext";
 import { motion } from "framer-motion";
 import { useNavigate } from "react-router-dom";
 import { useToast } from "../context/ToastContext";
+import { useWebSocket } from "../hooks/useWebSocket";
 
 export default function MeusPedidos() {
-  const { usuario } = useAuth();
+  const { usuario, token } = useAuth();
   const navigate = useNavigate();
   const { error, success } = useToast();
   const [pedidos, setPedidos] = useState([]);
   const [restaurantes, setRestaurantes] = useState({});
   const [avaliacoes, setAvaliacoes] = useState({});
   const [loading, setLoading] = useState(true);
+  const [proximoCursor, setProximoCursor] = useState(null); // X-Proximo-Cursor da última página; null = não tem mais
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [filtroStatus, setFiltroStatus] = useState("todos");
   const [busca, setBusca] = useState("");
   const [avaliandoPedido, setAvaliandoPedido] = useState(null);
@@ -25,43 +28,35 @@ export default function MeusPedidos() {
     }
   }, [usuario]);
 
+  // Uma request por página: cada pedido já vem com o resumo do restaurante e a avaliação (null = não avaliado)
+  function buscarPagina(cursor) {
+    return axios.get(`http://localhost:8000/pedidos/usuario/me/historico`, {
+      params: cursor ? { cursor } : {},
+    });
+  }
+
+  function registrarPagina(lista) {
+    const restaurantesMap = {};
+    const avaliacoesMap = {};
+    for (const pedido of lista) {
+      if (pedido.restaurante) {
+        restaurantesMap[pedido.restaurante_id] = pedido.restaurante;
+      }
+      if (pedido.avaliacao) {
+        avaliacoesMap[pedido.pedido_id] = pedido.avaliacao;
+      }
+    }
+    setRestaurantes((atuais) => ({ ...atuais, ...restaurantesMap }));
+    setAvaliacoes((atuais) => ({ ...atuais, ...avaliacoesMap }));
+  }
+
   async function carregarPedidos() {
     try {
       setLoading(true);
-      const response = await axios.get(
-        `http://localhost:8000/pedidos/usuario/me`
-      );
+      const response = await buscarPagina();
       setPedidos(response.data);
-      
-      // Carrega informações dos restaurantes
-      const restaurantesMap = {};
-      for (const pedido of response.data) {
-        if (!restaurantesMap[pedido.restaurante_id]) {
-          try {
-            const restResponse = await axios.get(
-              `http://localhost:8000/restaurantes/${pedido.restaurante_id}`
-            );
-            restaurantesMap[pedido.restaurante_id] = restResponse.data;
-          } catch (err) {
-            console.error("Erro ao carregar restaurante:", err);
-          }
-        }
-      }
-      setRestaurantes(restaurantesMap);
-      
-      // Carrega avaliações dos pedidos
-      const avaliacoesMap = {};
-      for (const pedido of response.data) {
-        try {
-          const avaliacaoResponse = await axios.get(
-            `http://localhost:8000/avaliacoes/pedido/${pedido.pedido_id}`
-          );
-          avaliacoesMap[pedido.pedido_id] = avaliacaoResponse.data;
-        } catch (err) {
-          // Se não encontrar avaliação, não faz nada (pedido ainda não foi avaliado)
-        }
-      }
-      setAvaliacoes(avaliacoesMap);
+      setProximoCursor(response.headers["x-proximo-cursor"] ?? null);
+      registrarPagina(response.data);
     } catch (err) {
       console.error("❌ Erro ao carregar pedidos:", err);
       error("Erro ao carregar pedidos. Tente novamente.");
@@ -70,9 +65,46 @@ export default function MeusPedidos() {
     }
   }
 
+  async function carregarMais() {
+    try {
+      setCarregandoMais(true);
+      const response = await buscarPagina(proximoCursor);
+      setPedidos((atuais) => {
+        const ids = new Set(atuais.map((p) => p.pedido_id));
+        return [...atuais, ...response.data.filter((p) => !ids.has(p.pedido_id))];
+      });
+      setProximoCursor(response.headers["x-proximo-cursor"] ?? null);
+      registrarPagina(response.data);
+    } catch (err) {
+      console.error("❌ Erro ao carregar mais pedidos:", err);
+      error("Erro ao carregar mais pedidos. Tente novamente.");
+    } finally {
+      setCarregandoMais(false);
+    }
+  }
+
+  // Mudanças de status chegam pelo WebSocket do usuário e atualizam só o pedido afetado
+  const wsUrl = usuario?.usuario_id && token
+    ? `http://localhost:8000/ws/usuario?token=${encodeURIComponent(token)}`
+    : null;
+
+  const handleWebSocketMessage = useCallback((data) => {
+    if (data.type === 'snapshot') {
+      // Reconectou e o servidor não tem como reenviar o que foi perdido: recarrega a lista
+      carregarPedidos();
+    } else if (data.type === 'status_pedido') {
+      setPedidos((atuais) =>
+        atuais.map((p) => (p.pedido_id === data.pedido_id ? { ...p, status: data.status } : p))
+      );
+    }
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []); // carregarPedidos só usa setters, não precisa estar nas dependências
+
+  useWebSocket(wsUrl, handleWebSocketMessage);
+
   async function enviarAvaliacao(pedidoId) {
     try {
-      await axios.post("http://localhost:8000/avaliacoes/", {
+      const response = await axios.post("http://localhost:8000/avaliacoes/", {
         pedido_id: pedidoId,
         nota: formAvaliacao.nota,
         comentario: formAvaliacao.comentario || null,
@@ -81,7 +113,8 @@ export default function MeusPedidos() {
       setAvaliandoPedido(null);
       setFormAvaliacao({ nota: 0, comentario: "" });
       setHoverNota(0);
-      carregarPedidos(); // Recarrega para atualizar avaliações
+      // atualiza só este pedido: recarregar voltaria pra primeira página e sumiria com os mais antigos
+      setAvaliacoes((atuais) => ({ ...atuais, [pedidoId]: response.data }));
     } catch (err) {
       console.error("Erro ao enviar avaliação:", err);
       const errorMsg = err.response?.data?.detail || "Erro ao enviar avaliação. Tente novamente.";
@@ -154,7 +187,7 @@ export default function MeusPedidos() {
             <p className="text-gray-600 text-sm">
               {pedidos.length === 0 
                 ? "Você ainda não fez nenhum pedido" 
-                : `${pedidos.length} pedido${pedidos.length !== 1 ? 's' : ''} encontrado${pedidos.length !== 1 ? 's' : ''}`
+                : `${pedidos.length} pedido${pedidos.length !== 1 ? 's' : ''} encontrado${pedidos.length !== 1 ? 's' : ''}${proximoCursor ? ' (há pedidos mais antigos)' : ''}`
               }
             </p>
           </div>
@@ -441,6 +474,19 @@ export default function MeusPedidos() {
           })}
         </div>
       )}
+
+      {/* Busca e filtros valem para os pedidos já carregados: a próxima página traz os mais antigos */}
+      {proximoCursor && (
+        <div className="flex justify-center mt-6">
+          <button
+            onClick={carregarMais}
+            disabled={carregandoMais}
+            className="bg-white text-primario border border-primario px-6 py-2 rounded-lg hover:bg-primario/10 transition font-medium disabled:opacity-50 disabled:cursor-not-allowed"
+          >
+            {carregandoMais ? "Carregando..." : "Carregar pedidos mais antigos"}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
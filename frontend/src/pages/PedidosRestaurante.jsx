@@ -6,36 +6,53 @@ import { useToast } from "../context/ToastContext";
 import { useWebSocket } from "../hooks/useWebSocket";
 
 export default function PedidosRestaurante() {
-  const { restaurante } = useAuthRestaurante();
+  const { restaurante, token } = useAuthRestaurante();
   const { success, error } = useToast();
   const [pedidos, setPedidos] = useState([]);
   const [usuarios, setUsuarios] = useState({});
   const [loading, setLoading] = useState(true);
+  const [proximoCursor, setProximoCursor] = useState(null); // X-Proximo-Cursor da última página; null = não tem mais
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [filtroStatus, setFiltroStatus] = useState("todos");
   const [busca, setBusca] = useState("");
 
+  // a listagem vem em páginas (mais novos primeiro); o cursor da resposta busca a seguinte
+  function buscarPagina(cursor) {
+    return axios.get(`http://localhost:8000/pedidos/restaurante/${restaurante.restaurante_id}`, {
+      params: cursor ? { cursor } : {},
+    });
+  }
+
+  // junta sem repetir: o mesmo pedido pode vir em duas páginas se a lista foi atualizada no meio
+  function juntarPedidos(primeiros, seguintes) {
+    const ids = new Set(primeiros.map((p) => p.pedido_id));
+    return [...primeiros, ...seguintes.filter((p) => !ids.has(p.pedido_id))];
+  }
+
+  function registrarUsuarios(lista) {
+    // Carrega informações dos usuários
+    const usuariosMap = {};
+    for (const pedido of lista) {
+      if (pedido.usuario_id && !usuariosMap[pedido.usuario_id]) {
+        try {
+          // Nota: precisaríamos de uma rota para buscar usuário por ID
+          // Por enquanto, vamos apenas armazenar o ID
+          usuariosMap[pedido.usuario_id] = { usuario_id: pedido.usuario_id };
+        } catch (err) {
+          console.error("Erro ao carregar usuário:", err);
+        }
+      }
+    }
+    setUsuarios((atuais) => ({ ...atuais, ...usuariosMap }));
+  }
+
   async function carregarPedidos() {
     try {
       setLoading(true);
-      const response = await axios.get(
-        `http://localhost:8000/pedidos/restaurante/${restaurante.restaurante_id}`
-      );
+      const response = await buscarPagina();
       setPedidos(response.data);
-      
-      // Carrega informações dos usuários
-      const usuariosMap = {};
-      for (const pedido of response.data) {
-        if (pedido.usuario_id && !usuariosMap[pedido.usuario_id]) {
-          try {
-            // Nota: precisaríamos de uma rota para buscar usuário por ID
-            // Por enquanto, vamos apenas armazenar o ID
-            usuariosMap[pedido.usuario_id] = { usuario_id: pedido.usuario_id };
-          } catch (err) {
-            console.error("Erro ao carregar usuário:", err);
-          }
-        }
-      }
-      setUsuarios(usuariosMap);
+      setProximoCursor(response.headers["x-proximo-cursor"] ?? null);
+      registrarUsuarios(response.data);
     } catch (err) {
       console.error("❌ Erro ao carregar pedidos:", err);
       error("Erro ao carregar pedidos. Tente novamente.");
@@ -44,6 +61,34 @@ export default function PedidosRestaurante() {
     }
   }
 
+  async function carregarMais() {
+    try {
+      setCarregandoMais(true);
+      const response = await buscarPagina(proximoCursor);
+      setPedidos((atuais) => juntarPedidos(atuais, response.data));
+      setProximoCursor(response.headers["x-proximo-cursor"] ?? null);
+      registrarUsuarios(response.data);
+    } catch (err) {
+      console.error("❌ Erro ao carregar mais pedidos:", err);
+      error("Erro ao carregar mais pedidos. Tente novamente.");
+    } finally {
+      setCarregandoMais(false);
+    }
+  }
+
+  // Pedido novo: busca só a primeira página e põe por cima, sem perder as páginas antigas já carregadas
+  // (o cursor que já temos continua apontando pro pedido mais antigo da lista)
+  async function carregarNovos() {
+    try {
+      const response = await buscarPagina();
+      setPedidos((atuais) => juntarPedidos(response.data, atuais));
+      setProximoCursor((atual) => atual ?? response.headers["x-proximo-cursor"] ?? null);
+      registrarUsuarios(response.data);
+    } catch (err) {
+      console.error("❌ Erro ao carregar pedidos:", err);
+    }
+  }
+
   useEffect(() => {
     if (restaurante?.restaurante_id) {
       carregarPedidos();
@@ -51,33 +96,66 @@ export default function PedidosRestaurante() {
   }, [restaurante]);
 
   // WebSocket para notificações em tempo real
-  const wsUrl = restaurante?.restaurante_id 
-    ? `http://localhost:8000/ws/restaurante/${restaurante.restaurante_id}`
+  const wsUrl = restaurante?.restaurante_id && token
+    ? `http://localhost:8000/ws/restaurante/${restaurante.restaurante_id}?token=${encodeURIComponent(token)}`
     : null;
 
   const handleWebSocketMessage = useCallback((data) => {
     if (data.type === 'novo_pedido') {
       success(`🎉 Novo pedido recebido! Total: R$ ${data.total.toFixed(2)}`);
-      // Recarrega a lista de pedidos
+      carregarNovos();
+    } else if (data.type === 'snapshot') {
+      // Reconectou e os eventos perdidos já saíram do histórico do servidor: recarrega a lista
       carregarPedidos();
+    } else if (data.type === 'status_pedido') {
+      // Status alterado (por este ou outro dispositivo do restaurante): atualiza só o pedido
+      setPedidos((atuais) =>
+        atuais.map((p) => (p.pedido_id === data.pedido_id ? { ...p, status: data.status, versao: data.versao } : p))
+      );
     }
     // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [success]); // carregarPedidos é estável, não precisa estar nas dependências
+  }, [success]); // carregarPedidos/carregarNovos só usam setters, não precisa estar nas dependências
 
   const { isConnected } = useWebSocket(wsUrl, handleWebSocketMessage);
 
-  async function atualizarStatus(pedidoId, novoStatus) {
+  async function atualizarStatus(pedido, novoStatus) {
     try {
-      await axios.put(`http://localhost:8000/pedidos/${pedidoId}/status?status=${novoStatus}`);
+      // a versao faz o servidor recusar (409) se outro dispositivo mudou o pedido depois que ele foi carregado aqui
+      const res = await axios.put(`http://localhost:8000/pedidos/${pedido.pedido_id}/status`, null, {
+        params: { status: novoStatus, versao: pedido.versao },
+      });
+      setPedidos((atuais) =>
+        atuais.map((p) =>
+          p.pedido_id === pedido.pedido_id ? { ...p, status: res.data.status, versao: res.data.versao } : p
+        )
+      );
       success("Status atualizado com sucesso!");
-      carregarPedidos(); // Recarrega a lista
     } catch (err) {
       console.error("❌ Erro ao atualizar status:", err);
-      error("Erro ao atualizar status. Tente novamente.");
+      const detalhe = err.response?.status === 409 ? err.response.data.detail : null;
+      if (detalhe) {
+        // mostra o status que está valendo em vez do que esta tela achava que era
+        setPedidos((atuais) =>
+          atuais.map((p) =>
+            p.pedido_id === pedido.pedido_id ? { ...p, status: detalhe.status, versao: detalhe.versao } : p
+          )
+        );
+        error(`${detalhe.erro}. Status atual: ${detalhe.status}.`);
+      } else {
+        error("Erro ao atualizar status. Tente novamente.");
+      }
     }
   }
 
   const statusValidos = ["Recebido", "Em preparo", "Saiu para entrega", "Entregue", "Cancelado"];
+  // mesmas transições de TRANSICOES_PEDIDO no backend
+  const proximosStatus = {
+    "Recebido": ["Em preparo", "Cancelado"],
+    "Em preparo": ["Saiu para entrega", "Cancelado"],
+    "Saiu para entrega": ["Entregue", "Cancelado"],
+    "Entregue": [],
+    "Cancelado": [],
+  };
   
   const getStatusIcon = (status) => {
     const icons = {
@@ -153,7 +231,7 @@ export default function PedidosRestaurante() {
             <p className="text-gray-600 text-sm">
               {pedidos.length === 0 
                 ? "Nenhum pedido encontrado" 
-                : `${pedidos.length} pedido${pedidos.length !== 1 ? 's' : ''} encontrado${pedidos.length !== 1 ? 's' : ''}`
+                : `${pedidos.length} pedido${pedidos.length !== 1 ? 's' : ''} encontrado${pedidos.length !== 1 ? 's' : ''}${proximoCursor ? ' (há pedidos mais antigos)' : ''}`
               }
             </p>
           </div>
@@ -317,10 +395,10 @@ export default function PedidosRestaurante() {
                   {statusValidos.map((status) => (
                     <button
                       key={status}
-                      onClick={() => atualizarStatus(pedido.pedido_id, status)}
-                      disabled={pedido.status === status}
+                      onClick={() => atualizarStatus(pedido, status)}
+                      disabled={!proximosStatus[pedido.status]?.includes(status)}
                       className={`px-3 py-1 rounded-lg text-sm font-medium transition flex items-center gap-1 ${
-                        pedido.status === status
+                        !proximosStatus[pedido.status]?.includes(status)
                           ? "bg-gray-200 text-gray-500 cursor-not-allowed"
                           : "bg-secundario/20 text-secundario hover:bg-secundario/30"
                       }`}
@@ -335,6 +413,19 @@ export default function PedidosRestaurante() {
           ))}
         </div>
       )}
+
+      {/* Busca e filtros valem para os pedidos já carregados: a próxima página traz os mais antigos */}
+      {proximoCursor && (
+        <div className="flex justify-center mt-6">
+          <button
+            onClick={carregarMais}
+            disabled={carregandoMais}
+            className="bg-white text-primario border border-primario px-6 py-2 rounded-lg hover:bg-primario/10 transition font-medium disabled:opacity-50 disabled:cursor-not-allowed"
+          >
+            {carregandoMais ? "Carregando..." : "Carregar pedidos mais antigos"}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
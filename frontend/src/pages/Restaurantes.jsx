@@ -88,9 +88,11 @@ export default function RestaurantesAdmin() {
   async function fetchPratos() {
     try {
       setLoadingPratos(true);
-      const res = await axios.get(
-        `http://localhost:8000/restaurantes/${restaurante.restaurante_id}/menu`
-      );
+      const token = localStorage.getItem("restaurante_token");
+      // /me/menu traz também os indisponíveis, que o cardápio público esconde
+      const res = await axios.get("http://localhost:8000/restaurantes/me/menu", {
+        headers: { Authorization: `Bearer ${token}` },
+      });
       setPratos(res.data);
     } catch (err) {
       console.error("Erro ao buscar pratos:", err);
@@ -186,6 +188,25 @@ export default function RestaurantesAdmin() {
     }
   }
 
+  // 🔹 Ligar/desligar disponibilidade
+  async function alternarDisponivel(prato) {
+    try {
+      const token = localStorage.getItem("restaurante_token");
+      await axios.post(
+        "http://localhost:8000/restaurantes/me/menu/lote",
+        { disponibilidade: [{ prato_id: prato.prato_id, disponivel: !prato.disponivel }] },
+        { headers: { Authorization: `Bearer ${token}` } }
+      );
+      setPratos((prev) =>
+        prev.map((p) => (p.prato_id === prato.prato_id ? { ...p, disponivel: !prato.disponivel } : p))
+      );
+      success(prato.disponivel ? "Prato marcado como indisponível." : "Prato disponível novamente!");
+    } catch (err) {
+      console.error("Erro ao alterar disponibilidade:", err);
+      error(err.response?.data?.detail || "Erro ao alterar disponibilidade. Tente novamente.");
+    }
+  }
+
   // 🔹 Deletar prato
   async function deletePrato() {
     try {
@@ -417,7 +438,7 @@ export default function RestaurantesAdmin() {
                   <div className="w-20 h-20 rounded-full overflow-hidden border-2 border-primario flex-shrink-0">
                     {restaurante.foto_perfil ? (
                       <img 
-                        src={`http://localhost:8000${restaurante.foto_perfil}`}
+                        src={`http://localhost:8000${restaurante.foto_perfil_variantes?.thumb ?? restaurante.foto_perfil}`}
                         alt={restaurante.nome_fantasia}
                         className="w-full h-full object-cover"
                       />
@@ -1108,7 +1129,8 @@ export default function RestaurantesAdmin() {
                   <div className="w-full sm:w-40 h-32 bg-gradient-to-br from-secundario/20 to-primario/10 flex-shrink-0 rounded-lg overflow-hidden border border-gray-200">
                     {p.imagem_url ? (
                       <img
-                        src={`http://localhost:8000${p.imagem_url}`}
+                        src={`http://localhost:8000${p.imagem_variantes?.thumb ?? p.imagem_url}`}
+                        loading="lazy"
                         alt={p.nome}
                         className="object-cover w-full h-full"
                       />
@@ -1287,6 +1309,13 @@ export default function RestaurantesAdmin() {
                         <span>✏️</span>
                         <span>Editar</span>
                       </button>
+                      <button
+                        onClick={() => alternarDisponivel(p)}
+                        className="bg-gray-500 text-white px-4 py-2 rounded-lg hover:bg-gray-600 transition font-medium flex items-center gap-2"
+                      >
+                        <span>{p.disponivel ? "⏸️" : "▶️"}</span>
+                        <span>{p.disponivel ? "Pausar" : "Ativar"}</span>
+                      </button>
                       <button
                         onClick={() => {
                           setMostrarModal(true);